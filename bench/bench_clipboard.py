@@ -0,0 +1,103 @@
+"""Clipboard watching: CPU per idle hour and how long a copy takes to be noticed.
+
+Runs each watcher against an in-memory clipboard whose reads cost what pyperclip's
+do on Linux: one short-lived child process (the xclip/xsel call), unless --free-reads.
+The old fixed half-second loop is included for comparison. The X11 watcher is
+measured against the real clipboard when a display with XFixes is available.
+
+    python bench/bench_clipboard.py --idle 20 --copies 10
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import threading
+import time
+
+from common import obd, print_table
+
+
+def cpu_seconds():
+    """CPU time of this process and its finished children, which is where xclip's cost lands"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class SimulatedClipboard:
+    """Clipboard text in memory, each read optionally paying for a child process like pyperclip"""
+    def __init__(self, spawn):
+        self.text = ""
+        self.reads = 0
+        self.spawn = spawn
+        self.true = shutil.which("true")
+
+    def read(self):
+        self.reads += 1
+        if self.spawn and self.true:
+            subprocess.run([self.true])
+        return self.text
+
+
+def measure(name, source, clipboard, copy, idle, copies):
+    detected = threading.Event()
+    source.start(lambda text: detected.set())
+    time.sleep(1)  # Let the poller back off to its idle interval
+    reads = clipboard.reads if clipboard else None
+    cpu_started = cpu_seconds()
+    time.sleep(idle)
+    cpu = cpu_seconds() - cpu_started
+    idle_reads = clipboard.reads - reads if clipboard else None
+
+    latencies = []
+    for n in range(copies):
+        time.sleep(random.uniform(0.5, 1.5))  # Copies land anywhere in the poll cycle
+        detected.clear()
+        started = time.perf_counter()
+        copy(f"https://osu.ppy.sh/beatmapsets/{n} {started}")
+        if detected.wait(5):
+            latencies.append(time.perf_counter() - started)
+    source.stop()
+    latencies.sort()
+    return {"source": name, "CPU s/idle hour": cpu * 3600 / idle,
+            "reads/idle hour": idle_reads * 3600 / idle if idle_reads is not None else None,
+            "median latency ms": latencies[len(latencies) // 2] * 1000 if latencies else None,
+            "worst latency ms": latencies[-1] * 1000 if latencies else None,
+            "missed": copies - len(latencies)}
+
+
+def x11_copy(text):
+    subprocess.run(["xclip", "-selection", "clipboard"], input=text.encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--idle", type=float, default=20, help="idle seconds measured per source")
+    parser.add_argument("--copies", type=int, default=10, help="copies timed per source")
+    parser.add_argument("--free-reads", action="store_true", help="don't spawn a process per read")
+    args = parser.parse_args()
+
+    rows = []
+    for name, make in (("fixed 0.5 s loop (before)", lambda: obd.PollingClipboardSource(0.5, 0.5)),
+                       ("polling", obd.PollingClipboardSource)):
+        clipboard = SimulatedClipboard(not args.free_reads)
+        source = make()
+        source.read = clipboard.read
+
+        def copy(text, clipboard=clipboard):
+            clipboard.text = text
+        rows.append(measure(name, source, clipboard, copy, args.idle, args.copies))
+    try:
+        source = obd.X11ClipboardSource()
+    except Exception as e:
+        print(f"Skipping x11: {str(e)}")
+    else:
+        if shutil.which("xclip"):
+            rows.append(measure("x11", source, None, x11_copy, args.idle, args.copies))
+        else:
+            print("Skipping x11: xclip is needed to make the copies")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
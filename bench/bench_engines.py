@@ -0,0 +1,72 @@
+"""Threaded workers vs the async engine on a big batch.
+
+Queues N downloads against a local mock mirror that answers after a fixed latency,
+once per engine, each in a fresh process so peak memory is comparable.
+
+    python bench/bench_engines.py --count 500 --latency 0.05
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from common import isolated_app, peak_rss_mb, print_table
+from mock_mirror import MockMirror
+
+
+def run_engine(args):
+    """One engine in this process, prints a JSON result line"""
+    settings = {"mirrors": [{"name": "mock", "url": args.url}], "skip_existing": False, "engine": args.mode,
+                "max_workers": args.workers, "async_concurrency": args.concurrency,
+                "per_host_limit": args.concurrency, "pool_size": args.workers}
+    with isolated_app(**settings) as app:
+        if args.mode == "async" and app.async_engine is None:
+            sys.exit("aiohttp is not installed")
+        rss_before = peak_rss_mb()
+        tracemalloc.start()
+        started = time.perf_counter()
+        for i in range(args.count):
+            app.download_queue.submit(str(200000 + i))
+        app.download_queue.join()
+        elapsed = time.perf_counter() - started
+        traced_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+        failed = app.download_queue.counts()["failed"]
+    print(json.dumps({"engine": args.mode, "downloads": args.count, "failed": failed, "seconds": elapsed,
+                      "downloads/s": args.count / elapsed, "MB/s": args.count * args.size / elapsed / 1e6,
+                      "peak RSS MB": peak_rss_mb(), "RSS growth MB": peak_rss_mb() - rss_before,
+                      "peak traced MB": traced_peak}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--size", type=int, default=256 * 1024, help="bytes per set")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the mirror takes to answer")
+    parser.add_argument("--workers", type=int, default=16, help="threads for the threaded engine")
+    parser.add_argument("--concurrency", type=int, default=100, help="downloads in flight for the async engine")
+    parser.add_argument("--mode", choices=("threaded", "async"), help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        run_engine(args)
+        return
+
+    rows = []
+    with MockMirror(size=args.size, latency=args.latency) as mirror:
+        for mode in ("threaded", "async"):
+            command = [sys.executable, __file__, "--mode", mode, "--url", mirror.url]
+            for name in ("count", "size", "workers", "concurrency"):
+                command += [f"--{name}", str(getattr(args, name))]
+            result = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+            if result.returncode:
+                print(f"{mode} engine failed")
+                continue
+            rows.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
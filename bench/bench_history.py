@@ -0,0 +1,107 @@
+"""Download history with 100k entries: the old JSON file vs HistoryStore.
+
+Generates the entries, then times what each download and each history lookup cost
+with the JSON list rewritten on every save and with the SQLite store.
+
+    python bench/bench_history.py --entries 100000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from common import obd, print_table
+
+WORDS = ["blue", "night", "dream", "fire", "star", "moon", "rain", "heart", "sky", "light", "zero", "echo"]
+
+
+def generate(count, seed=1):
+    rng = random.Random(seed)
+    entries = []
+    start = time.mktime((2015, 1, 1, 0, 0, 0, 0, 0, -1))
+    for i in range(count):
+        beatmap_id = str(rng.randint(1, 2500000))
+        artist = " ".join(rng.sample(WORDS, 2)).title()
+        title = " ".join(rng.sample(WORDS, 3)).title()
+        filename = f"{beatmap_id} {artist} - {title}.osz"
+        entries.append({
+            "id": beatmap_id,
+            "filename": filename,
+            "path": os.path.join("/home/player/Downloads", filename),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start + i * 3600)),
+            "url": f"https://osu.ppy.sh/beatmapsets/{beatmap_id}",
+            "title": title,
+            "artist": artist,
+            "creator": rng.choice(WORDS).title() + str(rng.randint(1, 99)),
+            "difficulties": ["Easy", "Normal", "Hard", "Insane"][:rng.randint(1, 4)],
+        })
+    return entries
+
+
+def timed(function, repeat=1):
+    """Average seconds per call and the last result"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100000)
+    args = parser.parse_args()
+
+    entries = generate(args.entries)
+    probe = entries[args.entries // 2]
+    day = probe["date"][:10]
+    new_entry = dict(probe, id="9999999", date="2030-01-01 00:00:00")
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="osu-bench-") as folder:
+        json_path = os.path.join(folder, "download_history.json")
+
+        def save_json():
+            # What the old save_history did after every single download
+            with open(json_path, 'w') as f:
+                json.dump(entries, f, indent=2)
+
+        def load_json():
+            with open(json_path) as f:
+                return json.load(f)
+
+        seconds, _ = timed(save_json)
+        rows.append({"store": "json", "operation": "record one download", "ms": seconds * 1000})
+        seconds, loaded = timed(load_json)
+        rows.append({"store": "json", "operation": "load all", "ms": seconds * 1000, "rows": len(loaded)})
+        seconds, found = timed(lambda: [e for e in loaded if e["id"] == probe["id"]], 20)
+        rows.append({"store": "json", "operation": "find by id", "ms": seconds * 1000, "rows": len(found)})
+        seconds, found = timed(lambda: [e for e in loaded if e["date"].startswith(day)], 20)
+        rows.append({"store": "json", "operation": "find by date", "ms": seconds * 1000, "rows": len(found)})
+        seconds, found = timed(lambda: [e for e in loaded if "fire" in json.dumps(e).lower()], 3)
+        rows.append({"store": "json", "operation": "search", "ms": seconds * 1000, "rows": len(found)})
+
+        store = obd.HistoryStore(os.path.join(folder, "download_history.db"))
+        seconds, migrated = timed(lambda: store.migrate_json(json_path))
+        rows.append({"store": "sqlite", "operation": "migrate json", "ms": seconds * 1000, "rows": migrated})
+        seconds, _ = timed(lambda: store.add(new_entry), 100)
+        rows.append({"store": "sqlite", "operation": "record one download", "ms": seconds * 1000})
+        seconds, loaded = timed(store.all)
+        rows.append({"store": "sqlite", "operation": "load all", "ms": seconds * 1000, "rows": len(loaded)})
+        seconds, found = timed(lambda: store.find_by_id(probe["id"]), 20)
+        rows.append({"store": "sqlite", "operation": "find by id", "ms": seconds * 1000, "rows": len(found)})
+        seconds, found = timed(lambda: store.find_by_date(day, day + " 23:59:59"), 20)
+        rows.append({"store": "sqlite", "operation": "find by date", "ms": seconds * 1000, "rows": len(found)})
+        seconds, found = timed(lambda: store.search("fire"), 3)
+        rows.append({"store": "sqlite", "operation": "search", "ms": seconds * 1000, "rows": len(found)})
+        for text in ("s", "fire", "no such map"):
+            # What the history tab runs per search: the first page of matches only
+            seconds, found = timed(lambda: store.search(text, obd.OsuBeatmapDownloader.HISTORY_PAGE), 3)
+            rows.append({"store": "sqlite", "operation": f"search page '{text}'", "ms": seconds * 1000,
+                         "rows": len(found)})
+        store.close()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Reading osu!.db and collection.db: synthetic fixtures in osu!'s binary formats.
+
+Writes an osu!.db with N difficulties and a collection.db referencing a share of
+them, then times read_osu_db, read_collection_db and import_files, as a dry run and
+queueing every set (into a queue wired like the app's that isn't started). Pass
+--beatmaps 400000 for a 100k-set osu!.db.
+
+    python bench/bench_import.py --beatmaps 100000 --version 20250108
+"""
+import argparse
+import hashlib
+import os
+import struct
+import tempfile
+import time
+
+from common import isolated_app, obd, print_table
+
+
+def string(value):
+    """osu!'s string encoding: 0x00 for None, otherwise 0x0b, ULEB128 length, UTF-8"""
+    if value is None:
+        return b"\x00"
+    data = value.encode("utf-8")
+    length = len(data)
+    prefix = bytearray()
+    while True:
+        part = length & 0x7f
+        length >>= 7
+        prefix.append(part | 0x80 if length else part)
+        if not length:
+            return b"\x0b" + bytes(prefix) + data
+
+
+def beatmap_entry(version, md5, beatmap_id, set_id, index):
+    """One osu!.db difficulty record, field for field in the order read_osu_db skips them"""
+    name = f"Artist {set_id} - Title {set_id}"
+    parts = [struct.pack("<i", 0)] if version < 20191106 else []  # Entry size, never checked
+    parts += [string(f"Artist {set_id}"), string(None), string(f"Title {set_id}"), string(None),
+              string("Mapper"), string(f"Diff {index}"), string("audio.mp3"), string(md5),
+              string(f"{name} [Diff {index}].osu"),
+              struct.pack("<Bhhhq", 4, 100, 50, 0, 0)]
+    parts.append(struct.pack("<4B", 9, 4, 5, 8) if version < 20140609 else struct.pack("<4f", 9, 4, 5, 8))
+    parts.append(struct.pack("<d", 1.4))
+    if version >= 20140609:
+        pair = (struct.pack("<BiBd", 0x08, 0, 0x0d, 5.25) if version < 20250107
+                else struct.pack("<BiBf", 0x08, 0, 0x0d, 5.25))
+        for _ in range(4):
+            parts.append(struct.pack("<i", 2) + pair * 2)
+    parts.append(struct.pack("<iii", 90000, 95000, 30000))
+    parts.append(struct.pack("<i", 2) + struct.pack("<dd?", 300.0, 0.0, True) * 2)
+    parts.append(struct.pack("<ii", beatmap_id, set_id))
+    parts.append(struct.pack("<i4BhfB", 0, 9, 9, 9, 9, 0, 0.7, 0))
+    parts += [string(None), string("bench tags"), struct.pack("<h", 0), string(None),
+              struct.pack("<?q?", True, 0, False), string(f"{set_id} {name}"), struct.pack("<q5?", 0, *[False] * 5)]
+    if version < 20140609:
+        parts.append(struct.pack("<h", 0))
+    parts.append(struct.pack("<iB", 0, 0))
+    return b"".join(parts)
+
+
+def write_osu_db(path, beatmaps, version, per_set=4):
+    """An osu!.db with `beatmaps` difficulties, `per_set` to a set, returns their MD5s"""
+    hashes = []
+    with open(path, 'wb') as f:
+        f.write(struct.pack("<ii?q", version, beatmaps // per_set, True, 0) + string("Player"))
+        f.write(struct.pack("<i", beatmaps))
+        for i in range(beatmaps):
+            md5 = hashlib.md5(str(i).encode()).hexdigest()
+            hashes.append(md5)
+            f.write(beatmap_entry(version, md5, 1000000 + i, 1 + i // per_set, i % per_set))
+        f.write(struct.pack("<i", 0))  # User permissions
+    return hashes
+
+
+def write_collection_db(path, collections, version=20250108):
+    """A collection.db from {name: [MD5s]}"""
+    with open(path, 'wb') as f:
+        f.write(struct.pack("<ii", version, len(collections)))
+        for name, hashes in collections.items():
+            f.write(string(name) + struct.pack("<i", len(hashes)))
+            f.write(b"".join(string(md5) for md5 in hashes))
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--beatmaps", type=int, default=100000, help="difficulties in osu!.db")
+    parser.add_argument("--version", type=int, default=20250108, help="osu!.db version to write")
+    parser.add_argument("--collections", type=int, default=50)
+    args = parser.parse_args()
+
+    rows = []
+    with isolated_app() as app, tempfile.TemporaryDirectory(prefix="osu-bench-") as folder:
+        osu_db = os.path.join(folder, "osu!.db")
+        collection_db = os.path.join(folder, "collection.db")
+        hashes = write_osu_db(osu_db, args.beatmaps, args.version)
+        # Every collection takes a slice of every 10th difficulty, so a tenth of the maps is wanted
+        wanted = hashes[::10]
+        write_collection_db(collection_db, {f"Collection {n}": wanted[n::args.collections]
+                                            for n in range(args.collections)})
+        expected_sets = len({i // 4 for i in range(0, args.beatmaps, 10)})
+
+        for label, path in (("osu!.db", osu_db), ("collection.db", collection_db)):
+            mb = os.path.getsize(path) / 1e6
+            reader = obd.read_osu_db if label == "osu!.db" else obd.read_collection_db
+            seconds, records = timed(lambda: sum(1 for _ in reader(path)))
+            rows.append({"step": f"read {label}", "MB": mb, "records": records, "seconds": seconds,
+                         "MB/s": mb / seconds})
+        seconds, summary = timed(lambda: app.import_files([collection_db, osu_db], dry_run=True))
+        if len(summary["sets"]) != expected_sets or summary["unresolved"]:
+            raise SystemExit(f"import found {len(summary['sets'])} sets, expected {expected_sets}")
+        rows.append({"step": "import_files dry run", "records": len(summary["sets"]), "seconds": seconds})
+
+        # The same import queued for real, into a queue wired like the app's that isn't started
+        app.download_queue.stop()
+        app.download_queue = obd.DownloadQueue(app.download_set, app.max_workers, on_change=app.on_job_changed,
+                                               retry_policy=app.retry_policy)
+        seconds, summary = timed(lambda: app.import_files([collection_db, osu_db]))
+        queued = app.download_queue.counts()[obd.DownloadJob.QUEUED]
+        if queued != expected_sets:
+            raise SystemExit(f"import queued {queued} sets, expected {expected_sets}")
+        rows.append({"step": "import_files enqueue", "records": queued, "seconds": seconds})
+        seconds, summary = timed(lambda: app.import_files([osu_db], dry_run=True))
+        rows.append({"step": "whole osu!.db dry run", "records": len(summary["sets"]), "seconds": seconds})
+        app.download_queue.stop()
+        app.download_queue = obd.DownloadQueue(app.download_set, app.max_workers, on_change=app.on_job_changed,
+                                               retry_policy=app.retry_policy)
+        seconds, summary = timed(lambda: app.import_files([osu_db]))
+        rows.append({"step": "whole osu!.db enqueue", "records": app.download_queue.counts()[obd.DownloadJob.QUEUED],
+                     "seconds": seconds})
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
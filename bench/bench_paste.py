@@ -0,0 +1,86 @@
+"""Link extraction and batch enqueue on multi-megabyte pastes.
+
+Builds forum-post-like text mixing prose, set links, difficulty links and lines of
+bare IDs, then times extract_beatmap_links and enqueue_text into a queue wired like the app's
+(on_change included) that isn't started, with difficulty lookups answered offline.
+
+    python bench/bench_paste.py --sizes 1 4 16
+"""
+import argparse
+import random
+import re
+import time
+
+from common import isolated_app, obd, print_table
+
+PROSE = ("Here's the mappool for this week, remember to check the difficulty settings before you "
+         "start and please report any broken links in the thread. ")
+
+
+def build_paste(megabytes, seed=1):
+    """About `megabytes` MB of text, returns (text, links written)"""
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    links = 0
+    while size < megabytes * 1024 * 1024:
+        kind = rng.random()
+        if kind < 0.5:
+            part = PROSE * rng.randint(1, 4)
+        elif kind < 0.75:
+            beatmap_id = rng.randint(1, 2500000)
+            part = f"NM{rng.randint(1, 6)}: https://osu.ppy.sh/beatmapsets/{beatmap_id}#osu/{beatmap_id * 3}\n"
+            links += 1
+        elif kind < 0.9:
+            part = f"https://osu.ppy.sh/b/{rng.randint(1, 5000000)}?m=0 "
+            links += 1
+        else:
+            ids = [str(rng.randint(1, 2500000)) for _ in range(rng.randint(1, 8))]
+            part = "\n" + ", ".join(ids) + "\n"
+            links += len(ids)
+        parts.append(part)
+        size += len(part)
+    return "".join(parts), links
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 16], help="paste sizes in MB")
+    args = parser.parse_args()
+
+    baseline = re.compile(r'osu\.ppy\.sh/beatmapsets/(\d+)')  # Before: first set link only
+    rows = []
+    with isolated_app() as app:
+        app.resolve_beatmap = lambda beatmap_id: "9" + beatmap_id  # Offline stand-in for the lookup
+        for megabytes in args.sizes:
+            text, links = build_paste(megabytes)
+            mb = len(text.encode()) / 1e6
+
+            started = time.perf_counter()
+            baseline.search(text)
+            search_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            set_ids, beatmap_ids = obd.extract_beatmap_links(text)
+            extract_seconds = time.perf_counter() - started
+
+            # Wired like the app's own queue, so every submit runs on_job_changed's status and
+            # metrics bookkeeping, but never started: the jobs stay queued and nothing downloads
+            app.download_queue.stop()
+            app.download_queue = obd.DownloadQueue(app.download_set, app.max_workers, on_change=app.on_job_changed,
+                                                   retry_policy=app.retry_policy)
+            started = time.perf_counter()
+            batch = app.enqueue_text(text, "Paste")
+            while app.download_queue.counts()[obd.DownloadJob.QUEUED] + batch.skipped < batch.total:
+                time.sleep(0.001)  # Difficulty links are enqueued by a resolver thread
+            enqueue_seconds = time.perf_counter() - started
+
+            rows.append({"MB": mb, "links": links, "unique": len(set_ids) + len(beatmap_ids),
+                         "re.search ms": search_seconds * 1000, "extract ms": extract_seconds * 1000,
+                         "extract MB/s": mb / extract_seconds, "enqueue ms": enqueue_seconds * 1000,
+                         "jobs": app.download_queue.counts()[obd.DownloadJob.QUEUED]})
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Connection reuse: pooled keep-alive session vs a new connection per download.
+
+Downloads N sets from a local mock mirror that adds a fixed delay to every new
+connection (standing in for TCP + TLS setup), sequentially and with the worker
+pool, and reports wall time and how many connections the mirror saw.
+
+    python bench/bench_session.py --count 100 --handshake 0.03
+"""
+import argparse
+import concurrent.futures
+import time
+
+from common import isolated_app, obd, print_table
+from mock_mirror import MockMirror
+
+
+def run(app, mirror, count, workers):
+    ids = [str(100000 + i) for i in range(count)]
+    before = mirror.stats()["connections"]
+    started = time.perf_counter()
+    if workers == 1:
+        for beatmap_id in ids:
+            app.download_set(beatmap_id, force=True)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            list(pool.map(lambda beatmap_id: app.download_set(beatmap_id, force=True), ids))
+    elapsed = time.perf_counter() - started
+    return elapsed, mirror.stats()["connections"] - before - 1  # Minus the /stats request itself
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--size", type=int, default=64 * 1024, help="bytes per set")
+    parser.add_argument("--handshake", type=float, default=0.03, help="seconds per new connection")
+    args = parser.parse_args()
+
+    rows = []
+    with MockMirror(size=args.size, handshake=args.handshake) as mirror:
+        for mode in ("new connection", "pooled"):
+            for workers in (1, args.workers):
+                with isolated_app(mirrors=[{"name": "mock", "url": mirror.url}], max_workers=args.workers,
+                                  skip_existing=False) as app:
+                    if mode == "new connection":
+                        # What every download did before the shared session: nothing survives the response
+                        app._session = obd.create_http_session(args.workers, app.user_agent)
+                        app._session.headers['Connection'] = 'close'
+                    elapsed, connections = run(app, mirror, args.count, workers)
+                rows.append({"mode": mode, "workers": workers, "downloads": args.count, "seconds": elapsed,
+                             "per download ms": elapsed / args.count * 1000, "connections": connections})
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
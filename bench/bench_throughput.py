@@ -0,0 +1,72 @@
+"""Write-path throughput: MB/s and CPU seconds per GB downloaded.
+
+Downloads large sets from a local mock mirror (its own process, so serving costs
+aren't counted) with the threaded and the async engine, each in a fresh process,
+and reports wall-clock throughput and this process's CPU time per GB.
+
+    python bench/bench_throughput.py --size 134217728 --count 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from common import isolated_app, print_table
+from mock_mirror import MockMirror
+
+
+def run_engine(args):
+    """One engine in this process, prints a JSON result line"""
+    settings = {"mirrors": [{"name": "mock", "url": args.url}], "skip_existing": False, "engine": args.mode,
+                "max_workers": args.workers, "async_concurrency": args.workers, "per_host_limit": args.workers,
+                "max_kbps": args.max_kbps}
+    with isolated_app(**settings) as app:
+        if args.mode == "async" and app.async_engine is None:
+            sys.exit("aiohttp is not installed")
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        for i in range(args.count):
+            app.download_queue.submit(str(300000 + i))
+        app.download_queue.join()
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        failed = app.download_queue.counts()["failed"]
+        for name in os.listdir(app.download_folder):
+            os.remove(os.path.join(app.download_folder, name))  # Don't keep gigabytes around between runs
+    gigabytes = args.count * args.size / 1e9
+    print(json.dumps({"engine": args.mode, "limit KB/s": args.max_kbps or None, "GB": gigabytes,
+                      "failed": failed, "seconds": elapsed, "MB/s": gigabytes * 1000 / elapsed,
+                      "CPU s": cpu, "CPU s/GB": cpu / gigabytes}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=128 * 1024 * 1024, help="bytes per set")
+    parser.add_argument("--count", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-kbps", type=int, default=0, help="also run with this global speed limit")
+    parser.add_argument("--mode", choices=("threaded", "async"), help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        run_engine(args)
+        return
+
+    rows = []
+    with MockMirror(size=args.size) as mirror:
+        for mode in ("threaded", "async"):
+            for max_kbps in sorted({0, args.max_kbps}):
+                command = [sys.executable, __file__, "--mode", mode, "--url", mirror.url, "--size", str(args.size),
+                           "--count", str(args.count), "--workers", str(args.workers), "--max-kbps", str(max_kbps)]
+                result = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+                if result.returncode:
+                    print(f"{mode} engine failed")
+                    continue
+                rows.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Helpers shared by the benchmarks: a throwaway app folder and result tables"""
+import contextlib
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import osu_beatmap_downloader as obd  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+@contextlib.contextmanager
+def app_folder():
+    """Point settings, history and downloads at a temporary folder, like a fresh install"""
+    saved = obd.__file__, {name: os.environ.get(name) for name in ("HOME", "USERPROFILE", "LOCALAPPDATA")}
+    with tempfile.TemporaryDirectory(prefix="osu-bench-") as folder:
+        obd.__file__ = os.path.join(folder, "osu_beatmap_downloader.py")
+        os.environ["HOME"] = os.environ["USERPROFILE"] = folder
+        os.environ.pop("LOCALAPPDATA", None)
+        try:
+            yield folder
+        finally:
+            obd.__file__ = saved[0]
+            for name, value in saved[1].items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+@contextlib.contextmanager
+def isolated_app(**settings):
+    """A headless downloader in a temporary folder, configured with settings.json values"""
+    with app_folder() as folder:
+        with open(os.path.join(folder, "settings.json"), "w") as f:
+            json.dump(settings, f)
+        app = obd.OsuBeatmapDownloader()
+        app.open_after_download = False
+        try:
+            yield app
+        finally:
+            app.shutdown()
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, None where the OS doesn't say"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # Bytes on macOS, KB elsewhere
+
+
+def print_table(rows):
+    """Print a list of dicts as aligned columns"""
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    cells = [[format_cell(row.get(column)) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for line in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)))
+
+
+def format_cell(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.3f}" if abs(value) < 100 else f"{value:.0f}"
+    return str(value)
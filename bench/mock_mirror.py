@@ -0,0 +1,122 @@
+"""Mock beatmap mirror for the benchmarks.
+
+Runs in its own process so its CPU time stays out of the client's numbers:
+
+    python bench/mock_mirror.py --size 262144 --latency 0.02 --handshake 0.03
+
+prints the port it listens on, then serves the same stored .osz for any /d/<id>.
+/stats returns connection and request counts as JSON.
+"""
+import argparse
+import http.server
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import zipfile
+
+
+def build_set(size):
+    """A valid .osz of about `size` bytes: one .osu plus stored (incompressible) audio"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        archive.writestr("Bench - Set (Mock) [Normal].osu",
+                         "osu file format v14\n\n[Metadata]\nTitle:Set\nArtist:Bench\nCreator:Mock\nVersion:Normal\n")
+        filler = os.urandom(min(size, 1024 * 1024))
+        info = zipfile.ZipInfo("audio.mp3")
+        with archive.open(info, "w", force_zip64=size > 2 ** 31) as audio:
+            left = max(0, size - 512)
+            while left > 0:
+                audio.write(filler[:left])
+                left -= len(filler)
+    return buffer.getvalue()
+
+
+def serve(port, size, latency, handshake):
+    body = build_set(size)
+    counts = {"connections": 0, "requests": 0}
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Like any production server, otherwise delayed ACKs add ~40 ms to every keep-alive response
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with lock:
+                counts["connections"] += 1
+            if handshake:
+                time.sleep(handshake)  # What TCP + TLS setup costs against a real mirror
+
+        def do_GET(self):
+            if self.path == "/stats":
+                data = json.dumps(counts).encode()
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            with lock:
+                counts["requests"] += 1
+            if latency:
+                time.sleep(latency)
+            beatmap_id = self.path.rsplit("/", 1)[-1]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", '"bench"')
+            self.send_header("Content-Disposition", f'attachment; filename="{beatmap_id} Bench - Set.osz"')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    print(server.server_address[1], flush=True)
+    server.serve_forever()
+
+
+class MockMirror:
+    """A mock mirror running in a child process"""
+    def __init__(self, size=256 * 1024, latency=0.0, handshake=0.0):
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--size", str(size),
+                                         "--latency", str(latency), "--handshake", str(handshake)],
+                                        stdout=subprocess.PIPE, text=True)
+        self.port = int(self.process.stdout.readline())
+        self.url = f"http://127.0.0.1:{self.port}/d/{{}}"
+
+    def stats(self):
+        with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/stats") as response:
+            return json.load(response)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--size", type=int, default=256 * 1024, help="bytes per set")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each response")
+    parser.add_argument("--handshake", type=float, default=0.0, help="seconds added to each new connection")
+    args = parser.parse_args()
+    serve(args.port, args.size, args.latency, args.handshake)
+
+
+if __name__ == "__main__":
+    main()
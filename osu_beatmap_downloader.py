@@ -1,32 +1,2347 @@
 import re
+import argparse
+import collections
+import hashlib
+import heapq
+import sys
 import threading
 import time
-import requests
 import os
-import tkinter as tk
-from tkinter import messagebox, ttk, filedialog
 import json
-import webbrowser
-import pyperclip
-from tkinter.font import Font
+import mmap
+import queue
+import random
+import sqlite3
+import struct
+import zipfile
+import zlib
+# requests, asyncio, http.server and webbrowser are imported where they're first needed:
+# this runs at every login and the window should be up before the network stack is loaded
+
+IMPORT_STARTED = time.perf_counter()  # For startup-check, interpreter startup itself isn't counted
+DEFAULT_USER_AGENT = 'OsuBeatmapDownloader/1.0'  # Sent with every mirror request to avoid potential API blocks
+# Archives are written byte for byte: a compressed reply would make Content-Length and resume offsets
+# count different bytes than the ones that land in the .part file
+DOWNLOAD_HEADERS = {'Accept-Encoding': 'identity'}
+
+
+def create_http_session(pool_size=16, user_agent=DEFAULT_USER_AGENT):
+    """Build the pooled keep-alive session shared by all mirror requests"""
+    import requests
+    session = requests.Session()
+    # One pool per host, sized so every download worker can keep its connection alive
+    adapter = timed_http_adapter()(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        'User-Agent': user_agent,
+        'Connection': 'keep-alive'
+    })
+    return session
+
+
+connect_timing = threading.local()  # Seconds this thread spent opening connections, for the metrics
+
+
+class ConnectTimer:
+    """Mixin for urllib3 connections that adds the time spent connecting to connect_timing.seconds"""
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            connect_timing.seconds = getattr(connect_timing, 'seconds', 0.0) + time.perf_counter() - started
+
+
+_timed_adapter = None
+
+
+def timed_http_adapter():
+    """HTTPAdapter class whose new connections report how long DNS, TCP and TLS setup took.
+
+    Built on first use, subclassing requests and urllib3 would otherwise import them with this module.
+    """
+    global _timed_adapter
+    if _timed_adapter is None:
+        import requests.adapters
+        import urllib3
+
+        class TimedHTTPConnection(ConnectTimer, urllib3.connection.HTTPConnection):
+            pass
+
+        class TimedHTTPSConnection(ConnectTimer, urllib3.connection.HTTPSConnection):
+            pass  # Includes the TLS handshake
+
+        class TimedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+            ConnectionCls = TimedHTTPConnection
+
+        class TimedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+            ConnectionCls = TimedHTTPSConnection
+
+        class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+            def init_poolmanager(self, *args, **kwargs):
+                super().init_poolmanager(*args, **kwargs)
+                self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool,
+                                                           "https": TimedHTTPSConnectionPool}
+
+        _timed_adapter = TimedHTTPAdapter
+    return _timed_adapter
+
+
+DEFAULT_MIRRORS = [
+    {"name": "catboy", "url": "https://catboy.best/d/{}"},
+    {"name": "nerinyan", "url": "https://api.nerinyan.moe/d/{}"},
+    {"name": "osu.direct", "url": "https://osu.direct/api/d/{}"}
+]
+
+
+DEFAULT_BEATMAP_LOOKUP_URL = "https://catboy.best/api/v2/b/{}"  # Beatmap (difficulty) ID -> JSON with beatmapset_id
+
+# One pass over the text finds every kind of reference we understand
+_LINKS = r"""
+    osu\.ppy\.sh/(?:beatmapsets|s)/(?P<set>\d+)       # set pages, including #osu/<beatmap> anchors
+  | osu\.ppy\.sh/(?:beatmaps|b)/(?P<beatmap>\d+)      # single difficulty links
+"""
+BEATMAP_LINK_PATTERN = re.compile(_LINKS, re.VERBOSE | re.MULTILINE)
+# Only for text meant as a beatmap list (manual paste, command line, imports): in a copied
+# web page a line holding a year or a score would otherwise download that set
+BEATMAP_REFERENCE_PATTERN = re.compile(_LINKS + r"""
+  | ^[ \t]*(?P<bare>\d+(?:[ \t,;]+\d+)*)[ \t,;\r]*$   # lines holding nothing but set IDs, CRLF included
+""", re.VERBOSE | re.MULTILINE)
+
+
+def extract_beatmap_links(text, bare_ids=True):
+    """Every set and beatmap ID referenced in a block of text, de-duplicated in order.
+
+    Returns (set_ids, beatmap_ids); beatmap IDs still have to be resolved to their set.
+    Lines of bare numbers count as set IDs only with bare_ids.
+    """
+    set_ids = {}
+    beatmap_ids = {}
+    pattern = BEATMAP_REFERENCE_PATTERN if bare_ids else BEATMAP_LINK_PATTERN
+    for match in pattern.finditer(text):
+        if match.group("set"):
+            set_ids[match.group("set")] = None
+        elif match.group("beatmap"):
+            beatmap_ids[match.group("beatmap")] = None
+        else:
+            for beatmap_id in re.split(r'[ \t,;]+', match.group("bare").strip()):
+                set_ids[beatmap_id] = None
+    return list(set_ids), list(beatmap_ids)
+
+
+PRIORITY_HIGH = 0  # A single map the user just asked for
+PRIORITY_NORMAL = 1  # A pasted batch of links
+PRIORITY_LOW = 2  # Backfills: imports, resumed and retried downloads
+
+
+class TokenBucket:
+    """Thread-safe token bucket, a rate of 0 means unlimited"""
+    def __init__(self, rate=0, burst=None):
+        self._lock = threading.Lock()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        with self._lock:
+            self.rate = max(0.0, float(rate or 0))
+            self.burst = float(burst) if burst else max(self.rate, 1.0)  # One second's worth by default
+            self._tokens = self.burst
+            self._last = time.monotonic()
+
+    def reserve(self, amount):
+        """Take tokens, going into debt if needed, returns how long the caller must wait"""
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def consume(self, amount):
+        delay = self.reserve(amount)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class DownloadError(Exception):
+    """No mirror could deliver a beatmapset"""
+    def __init__(self, message, causes=()):
+        super().__init__(message)
+        self.causes = list(causes)  # The exception each mirror failed with
+
+
+class MirrorError(Exception):
+    """A mirror answered, but not with the beatmapset we asked for"""
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class MirrorBusyError(MirrorError):
+    """Every mirror is backing off for longer than we are willing to wait"""
+
+
+class IntegrityError(MirrorError):
+    """The mirror sent something that isn't a complete, valid .osz"""
+
+
+class OszVerifier:
+    """Checks an .osz (zip) archive while it streams in and reads set metadata on the way.
+
+    Local file headers are parsed as bytes arrive, so an HTML error page or a corrupt
+    archive is rejected after the first few bytes. .osu entries are inflated on the fly
+    to check their CRC and read the [Metadata] section, and finish() validates the
+    central directory once the transfer is done, without a second pass over the data.
+    """
+    LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+    MAX_OSU_HEADER = 64 * 1024  # Metadata sits at the top of every .osu file
+    METADATA_KEYS = {"Title": "title", "Artist": "artist", "Creator": "creator", "Source": "source"}
+
+    def __init__(self):
+        self.received = 0
+        self.entries = []  # Names of the local entries seen so far
+        self.metadata = {}
+        self.difficulties = []
+        self._buffer = bytearray()
+        self._state = "header"  # header, data, descriptor, done (central directory reached) or opaque
+        self._entry = None
+
+    def feed(self, data):
+        self.received += len(data)
+        if self._state in ("done", "opaque"):
+            return  # Only the central directory is left, finish() reads it from disk
+        entry = self._entry
+        if (self._state == "data" and not self._buffer and entry["remaining"] is not None
+                and entry["inflater"] is None and entry["text"] is None):
+            # Bulk of an entry we don't look inside (audio, backgrounds): skip it without copying
+            skipped = min(len(data), entry["remaining"])
+            entry["remaining"] -= skipped
+            data = data[skipped:]
+            if not entry["remaining"]:
+                self._end_entry(entry["crc"])
+                self._state = "header"
+        self._buffer += data
+        while self._step():
+            pass
+
+    def feed_file(self, path):
+        """Catch up on bytes already on disk, e.g. before resuming a partial download"""
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                self.feed(chunk)
+
+    def finish(self, path, expected_length=None):
+        """Validate the completed archive, returns the set metadata"""
+        if expected_length and self.received != expected_length:
+            raise IntegrityError(f"expected {expected_length} bytes, got {self.received}")
+        if self._state not in ("done", "opaque"):
+            raise IntegrityError("archive is truncated")
+        try:
+            with zipfile.ZipFile(path) as archive:
+                names = archive.namelist()
+                osu_files = [name for name in names if name.lower().endswith(".osu")]
+                if self._state == "done" and len(names) != len(self.entries):
+                    raise IntegrityError(f"central directory lists {len(names)} files, "
+                                         f"archive holds {len(self.entries)}")
+                if not osu_files:
+                    raise IntegrityError("archive holds no .osu difficulties")
+                if not self.difficulties:
+                    # Couldn't follow the stream (zip64 or unusual layout), read the headers directly
+                    for name in osu_files:
+                        with archive.open(name) as f:
+                            self._read_osu_header(f.read(OszVerifier.MAX_OSU_HEADER))
+        except zipfile.BadZipFile as e:
+            raise IntegrityError(f"bad central directory: {str(e)}")
+        return dict(self.metadata, difficulties=self.difficulties)
+
+    def _step(self):
+        """Parse as much of the buffer as possible, returns False when more bytes are needed"""
+        if self._state == "header":
+            return self._parse_header()
+        if self._state == "data":
+            return self._parse_data()
+        if self._state == "descriptor":
+            return self._parse_descriptor()
+        return False
+
+    def _parse_header(self):
+        if len(self._buffer) < 4:
+            return False
+        signature = bytes(self._buffer[:4])
+        if signature in (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06"):
+            # Central directory: all entries have been seen
+            self._state = "done"
+            self._buffer.clear()
+            return False
+        if signature != b"PK\x03\x04":
+            if not self.entries:
+                raise IntegrityError(f"not a zip archive (starts with {bytes(self._buffer[:16])!r})")
+            raise IntegrityError(f"corrupt archive after {self.entries[-1]}")
+        if len(self._buffer) < OszVerifier.LOCAL_HEADER.size:
+            return False
+        (_, _, flags, method, _, _, crc, compressed_size, _,
+         name_length, extra_length) = OszVerifier.LOCAL_HEADER.unpack_from(self._buffer)
+        header_size = OszVerifier.LOCAL_HEADER.size + name_length + extra_length
+        if len(self._buffer) < header_size:
+            return False
+        name = bytes(self._buffer[OszVerifier.LOCAL_HEADER.size:OszVerifier.LOCAL_HEADER.size + name_length])
+        name = name.decode("utf-8" if flags & 0x800 else "cp437", "replace")
+        del self._buffer[:header_size]
+        self.entries.append(name)
+
+        has_descriptor = bool(flags & 0x08)  # Sizes and CRC come after the data
+        is_osu = name.lower().endswith(".osu")
+        if compressed_size == 0xFFFFFFFF or flags & 0x01 or (has_descriptor and method != 8):
+            # Zip64, encrypted, or an entry whose end we can't find without the central directory
+            self._state = "opaque"
+            self._buffer.clear()
+            return False
+        inflate = method == 8 and (is_osu or has_descriptor)
+        self._entry = {
+            "name": name,
+            "crc": crc,
+            "remaining": None if has_descriptor else compressed_size,
+            "descriptor": has_descriptor,
+            "inflater": zlib.decompressobj(-15) if inflate else None,
+            "checksum": 0 if (inflate or (is_osu and method == 0)) else None,
+            "text": bytearray() if is_osu and method in (0, 8) else None
+        }
+        self._state = "data"
+        return True
+
+    def _parse_data(self):
+        entry = self._entry
+        if not self._buffer:
+            return False
+        if entry["remaining"] is None:
+            # Deflate stream of unknown length: it ends where the inflater says it does
+            chunk = bytes(self._buffer)
+            self._buffer.clear()
+            self._consume(entry, self._inflate(entry, chunk))
+            if not entry["inflater"].eof:
+                return False
+            self._buffer[:0] = entry["inflater"].unused_data
+            self._state = "descriptor"
+            return True
+        take = min(len(self._buffer), entry["remaining"])
+        if entry["inflater"] or entry["text"] is not None:
+            chunk = bytes(self._buffer[:take])
+            self._consume(entry, self._inflate(entry, chunk) if entry["inflater"] else chunk)
+        del self._buffer[:take]
+        entry["remaining"] -= take
+        if entry["remaining"]:
+            return False
+        if entry["inflater"] and not entry["inflater"].eof:
+            raise IntegrityError(f"{entry['name']} is truncated")
+        self._end_entry(entry["crc"])
+        self._state = "header"
+        return True
+
+    def _parse_descriptor(self):
+        if len(self._buffer) < 4:
+            return False
+        size = 16 if self._buffer[:4] == b"PK\x07\x08" else 12  # The signature is optional
+        if len(self._buffer) < size:
+            return False
+        crc = struct.unpack_from("<I", self._buffer, size - 12)[0]
+        del self._buffer[:size]
+        self._end_entry(crc)
+        self._state = "header"
+        return True
+
+    def _inflate(self, entry, data):
+        try:
+            return entry["inflater"].decompress(data)
+        except zlib.error as e:
+            raise IntegrityError(f"{entry['name']} is corrupt: {str(e)}")
+
+    def _consume(self, entry, data):
+        if entry["checksum"] is not None:
+            entry["checksum"] = zlib.crc32(data, entry["checksum"])
+        text = entry["text"]
+        if text is not None and len(text) < OszVerifier.MAX_OSU_HEADER:
+            text += data[:OszVerifier.MAX_OSU_HEADER - len(text)]
+
+    def _end_entry(self, crc):
+        entry = self._entry
+        if entry["checksum"] is not None and entry["checksum"] != crc:
+            raise IntegrityError(f"CRC mismatch in {entry['name']}")
+        if entry["text"] is not None:
+            self._read_osu_header(bytes(entry["text"]))
+        self._entry = None
+
+    def _read_osu_header(self, data):
+        section = None
+        for line in data.decode("utf-8", "replace").splitlines():
+            line = line.strip()
+            if line.startswith("[") and line.endswith("]"):
+                if section == "Metadata":
+                    break
+                section = line[1:-1]
+            elif section == "Metadata" and ":" in line:
+                key, value = line.split(":", 1)
+                if key in OszVerifier.METADATA_KEYS:
+                    self.metadata.setdefault(OszVerifier.METADATA_KEYS[key], value.strip())
+                elif key == "Version":
+                    self.difficulties.append(value.strip())
+
+
+class RetryPolicy:
+    """How often and how long to wait before retrying a failed download, per kind of error.
+
+    Delays grow exponentially from "base" up to "max" seconds, with random jitter so a
+    batch that failed together doesn't hit the mirrors again all at once.
+    """
+    DEFAULT_RULES = {
+        "connect": {"attempts": 5, "base": 2, "max": 120},  # Refused or dropped connections
+        "timeout": {"attempts": 4, "base": 5, "max": 120},
+        "server": {"attempts": 4, "base": 10, "max": 300},  # 5xx replies
+        "rate_limit": {"attempts": 6, "base": 30, "max": 900},  # 429, or every mirror backing off
+        "integrity": {"attempts": 2, "base": 5, "max": 60}  # Broken or truncated archives
+    }
+    # Most transient first: a set one mirror timed out on and another lacks is still worth retrying
+    PRECEDENCE = ("rate_limit", "server", "timeout", "connect", "integrity")
+
+    def __init__(self, rules=None, jitter=0.5):
+        self.rules = {kind: dict(rule) for kind, rule in RetryPolicy.DEFAULT_RULES.items()}
+        for kind, rule in (rules or {}).items():
+            if kind in self.rules:
+                self.rules[kind].update(rule)
+        self.jitter = min(1.0, max(0.0, jitter))  # Fraction of each delay that is randomized
+
+    def classify(self, error):
+        """Error class of a failure, or None when retrying won't help (e.g. the set doesn't exist)"""
+        if isinstance(error, DownloadError):
+            kinds = {self.classify(cause) for cause in error.causes}
+            return next((kind for kind in RetryPolicy.PRECEDENCE if kind in kinds), None)
+        if isinstance(error, IntegrityError):
+            return "integrity"
+        if isinstance(error, MirrorBusyError):
+            return "rate_limit"
+        if isinstance(error, MirrorError):
+            if error.status_code == 429:
+                return "rate_limit"
+            if error.status_code and error.status_code >= 500:
+                return "server"
+            return None
+        if isinstance(error, TimeoutError):  # asyncio.TimeoutError is an alias since 3.11
+            return "timeout"
+        requests = sys.modules.get("requests")  # Its errors can't come up before it's loaded
+        if requests and isinstance(error, requests.exceptions.Timeout):
+            return "timeout"
+        asyncio = sys.modules.get("asyncio")
+        if asyncio and isinstance(error, asyncio.TimeoutError):
+            return "timeout"
+        if isinstance(error, ConnectionError):
+            return "connect"
+        if requests and isinstance(error, (requests.exceptions.ConnectionError,
+                                           requests.exceptions.ChunkedEncodingError)):
+            return "connect"
+        aiohttp = sys.modules.get("aiohttp")  # Only loaded when the async engine is in use
+        if aiohttp and isinstance(error, aiohttp.ClientError):
+            return "connect"
+        if isinstance(error, OSError) and error.errno is None:
+            return "connect"  # Stream ended early, as opposed to a disk error
+        return None
+
+    def delay(self, error, attempt):
+        """Seconds to wait before retry number `attempt`, or None to give up"""
+        kind = self.classify(error)
+        rule = self.rules.get(kind)
+        if not rule or attempt > rule["attempts"]:
+            return None
+        delay = min(rule["max"], rule["base"] * 2 ** (attempt - 1))
+        delay *= 1 - self.jitter * random.random()
+        return max(delay, self.retry_after(error) or 0)
+
+    def retry_after(self, error):
+        causes = error.causes if isinstance(error, DownloadError) else [error]
+        waits = [cause.retry_after for cause in causes if getattr(cause, 'retry_after', None)]
+        return min(waits) if waits else None
+
+
+class PartFileWriter:
+    """Writes a transfer into its .part file.
+
+    Fresh downloads are preallocated from Content-Length so the file system can lay them out
+    in one piece. Progress is checkpointed so a crash never leaves trailing preallocated zeros
+    looking like data. fsync_policy is "never", "on_complete" (before the rename) or "interval"
+    (every checkpoint as well).
+    """
+    CHECKPOINT = 8 * 1024 * 1024  # Bytes between flushes and journal updates
+    FSYNC_POLICIES = ("never", "on_complete", "interval")
+
+    def __init__(self, path, append, length=None, preallocate=True, fsync_policy="on_complete",
+                 on_checkpoint=None):
+        self.fsync_policy = fsync_policy
+        self.on_checkpoint = on_checkpoint  # Called with the number of bytes safely written
+        self.f = open(path, 'ab' if append else 'wb')
+        self.position = self.f.tell()
+        self.preallocated = False
+        self._unsynced = 0
+        if preallocate and length and not append:
+            try:
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(self.f.fileno(), 0, length)
+                else:
+                    self.f.truncate(length)  # Allocates the whole file on NTFS
+                self.preallocated = True
+            except OSError:
+                pass  # Not supported here (some network shares), write as we go instead
+            if self.preallocated and self.on_checkpoint:
+                self.on_checkpoint(0)
+
+    def write(self, data):
+        self.f.write(data)
+        count = len(data)
+        self.position += count
+        self._unsynced += count
+        if self._unsynced >= PartFileWriter.CHECKPOINT:
+            self.checkpoint()
+        return count
+
+    def checkpoint(self):
+        self.f.flush()
+        if self.fsync_policy == "interval":
+            os.fsync(self.f.fileno())
+        self._unsynced = 0
+        if self.on_checkpoint:
+            self.on_checkpoint(self.position)
+
+    def close(self, complete=False):
+        try:
+            if self.preallocated:
+                self.f.truncate(self.position)  # Drop the unused tail after an early end
+            self.f.flush()
+            if complete and self.fsync_policy != "never":
+                os.fsync(self.f.fileno())
+            if self.on_checkpoint:
+                self.on_checkpoint(self.position)
+        finally:
+            self.f.close()
+
+
+class Mirror:
+    """A download mirror URL template plus its rolling health measurements"""
+    SMOOTHING = 0.3  # Weight of the newest sample in the moving averages
+    TYPICAL_SET_SIZE = 10 * 1024 * 1024  # Used to weigh latency against throughput
+
+    def __init__(self, name, url_template, max_kbps=0, requests_per_minute=0):
+        self.name = name
+        self.url_template = url_template
+        self.bandwidth = TokenBucket(max_kbps * 1024)  # Bytes per second from this mirror
+        self.requests = TokenBucket(requests_per_minute / 60.0)  # Requests per second to this mirror
+        self.latency = None  # Seconds until the response headers arrive
+        self.throughput = None  # Bytes per second while streaming the body
+        self.failures = 0  # Consecutive failures, reset by any success
+        self.open_until = 0  # Circuit breaker: skip this mirror until this timestamp
+        self.last_error = None
+
+    def url_for(self, beatmap_id):
+        return self.url_template.format(beatmap_id)
+
+    def is_available(self, now=None):
+        return (now or time.time()) >= self.open_until
+
+    def expected_seconds(self):
+        """Estimated time to fetch a typical set, unmeasured mirrors look free so they get probed"""
+        if self.latency is None or not self.throughput:
+            return 0.0
+        return self.latency + Mirror.TYPICAL_SET_SIZE / self.throughput
+
+    def _smooth(self, current, sample):
+        if current is None:
+            return sample
+        return current + Mirror.SMOOTHING * (sample - current)
+
+
+class MirrorRegistry:
+    """Chooses mirrors by measured speed and backs off from the ones that keep failing"""
+    def __init__(self, mirrors, failure_threshold=3, cooldown=30, max_cooldown=600,
+                 max_kbps=0, requests_per_minute=0):
+        # Per-mirror limits in the list override the defaults given here
+        self.mirrors = [Mirror(m["name"], m["url"], m.get("max_kbps", max_kbps),
+                               m.get("requests_per_minute", requests_per_minute)) for m in mirrors]
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+
+    def candidates(self, preferred_url=None):
+        """Mirrors to try in order, fastest healthy mirror first"""
+        now = time.time()
+        with self._lock:
+            healthy = [m for m in self.mirrors if m.is_available(now)]
+            if not healthy:
+                # Every circuit is open, probe the one that will recover first
+                healthy = sorted(self.mirrors, key=lambda m: m.open_until)[:1]
+            order = sorted(healthy, key=lambda m: (m.expected_seconds(), self.mirrors.index(m)))
+        if preferred_url:
+            # Resuming a partial download only works against the mirror that started it
+            order.sort(key=lambda m: not preferred_url.startswith(m.url_template.split("{")[0]))
+        return order
+
+    def record_success(self, mirror, latency, nbytes, seconds):
+        with self._lock:
+            mirror.latency = mirror._smooth(mirror.latency, latency)
+            if nbytes and seconds > 0:
+                mirror.throughput = mirror._smooth(mirror.throughput, nbytes / seconds)
+            mirror.failures = 0
+            mirror.open_until = 0
+            mirror.last_error = None
+
+    def record_failure(self, mirror, error, retry_after=None):
+        with self._lock:
+            mirror.failures += 1
+            mirror.last_error = str(error)
+            if retry_after:
+                mirror.open_until = time.time() + min(retry_after, self.max_cooldown)
+            elif mirror.failures >= self.failure_threshold:
+                # Back off exponentially for as long as the mirror keeps failing
+                backoff = self.cooldown * 2 ** (mirror.failures - self.failure_threshold)
+                mirror.open_until = time.time() + min(backoff, self.max_cooldown)
+
+    def set_limits(self, max_kbps=0, requests_per_minute=0, overrides=()):
+        """Apply new default limits at runtime, overrides is the mirror list from the settings"""
+        overrides = {m.get("name"): m for m in overrides}
+        with self._lock:
+            for mirror in self.mirrors:
+                override = overrides.get(mirror.name, {})
+                mirror.bandwidth.set_rate(override.get("max_kbps", max_kbps) * 1024)
+                mirror.requests.set_rate(override.get("requests_per_minute", requests_per_minute) / 60.0)
+
+    def snapshot(self):
+        """Health of every mirror, for display"""
+        now = time.time()
+        with self._lock:
+            return [{
+                "name": m.name,
+                "url": m.url_template,
+                "latency": m.latency,
+                "throughput": m.throughput,
+                "failures": m.failures,
+                "state": "ok" if m.is_available(now) else f"backoff {int(m.open_until - now)}s",
+                "max_kbps": m.bandwidth.rate / 1024,
+                "requests_per_minute": m.requests.rate * 60,
+                "last_error": m.last_error
+            } for m in self.mirrors]
+
+
+class DownloadMetrics:
+    """Timings, bytes and throughput of recent downloads, for the stats panel, /metrics and the JSONL log.
+
+    Phases don't overlap: dns and connect cover connection setup (dns is only known with the async
+    engine, otherwise it is part of connect), ttfb is the wait for the mirror's reply after that,
+    transfer is the body (disk is the part of it spent writing), total runs from start to finish.
+    """
+    PHASES = ("queue_wait", "dns", "connect", "ttfb", "transfer", "disk", "total")
+    RATE_WINDOW = 10  # Seconds of traffic behind the rolling MB/s
+
+    def __init__(self, window=500, log_path=None):
+        self.samples = collections.deque(maxlen=window)  # Most recent finished downloads
+        self.log_path = log_path  # JSONL file that gets one line per finished download
+        self.downloads = {"done": 0, "failed": 0}
+        self.retries = 0
+        self.bytes_by_mirror = {}
+        self._rate = collections.deque()  # [whole second, bytes received in it]
+        self._transfers = {}  # beatmap_id -> timings of the transfer that delivered it
+        self._lock = threading.Lock()
+
+    def add_bytes(self, mirror_name, nbytes):
+        now = int(time.time())
+        with self._lock:
+            self.bytes_by_mirror[mirror_name] = self.bytes_by_mirror.get(mirror_name, 0) + nbytes
+            if self._rate and self._rate[-1][0] == now:
+                self._rate[-1][1] += nbytes
+            else:
+                self._rate.append([now, nbytes])
+                while self._rate[0][0] <= now - DownloadMetrics.RATE_WINDOW:
+                    self._rate.popleft()
+
+    def record_transfer(self, beatmap_id, mirror_name, **timings):
+        with self._lock:
+            self._transfers[str(beatmap_id)] = dict(timings, mirror=mirror_name)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_job(self, job, queue_depth):
+        """Turn a finished job into a sample, and log it"""
+        sample = {
+            "time": round(job.finished, 3),
+            "id": job.beatmap_id,
+            "status": job.state,
+            "attempts": job.attempts,
+            "queue_depth": queue_depth,
+            "queue_wait": round(job.started - job.created, 4) if job.started else None,
+            "total": round(job.finished - (job.started or job.created), 4),
+            "error": job.error
+        }
+        with self._lock:
+            sample.update(self._transfers.pop(job.beatmap_id, {}))
+            self.downloads[job.state] = self.downloads.get(job.state, 0) + 1
+            self.samples.append(sample)
+            if self.log_path:
+                try:
+                    with open(self.log_path, 'a') as f:
+                        f.write(json.dumps(sample) + "\n")
+                except Exception as e:
+                    print(f"Error writing metrics log: {str(e)}")
+        return sample
+
+    def rate(self):
+        """Bytes per second over the last RATE_WINDOW seconds"""
+        now = int(time.time())
+        with self._lock:
+            recent = sum(nbytes for second, nbytes in self._rate if second > now - DownloadMetrics.RATE_WINDOW)
+        return recent / DownloadMetrics.RATE_WINDOW
+
+    def percentile(self, phase, fraction):
+        with self._lock:
+            values = sorted(sample[phase] for sample in self.samples if sample.get(phase) is not None)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+
+    def prometheus_text(self, queue_counts=None, mirrors=None):
+        """Metrics in the Prometheus text exposition format"""
+        lines = ["# TYPE osu_downloads_total counter"]
+        with self._lock:
+            lines += [f'osu_downloads_total{{status="{status}"}} {count}' for status, count in self.downloads.items()]
+            lines += ["# TYPE osu_download_retries_total counter", f"osu_download_retries_total {self.retries}",
+                      "# TYPE osu_download_bytes_total counter"]
+            lines += [f'osu_download_bytes_total{{mirror="{name}"}} {nbytes}'
+                      for name, nbytes in self.bytes_by_mirror.items()]
+        lines += ["# TYPE osu_download_rate_bytes gauge", f"osu_download_rate_bytes {self.rate():.0f}",
+                  "# TYPE osu_download_phase_seconds summary"]
+        for phase in DownloadMetrics.PHASES:
+            for fraction in (0.5, 0.95):
+                value = self.percentile(phase, fraction)
+                if value is not None:
+                    lines.append(f'osu_download_phase_seconds{{phase="{phase}",quantile="{fraction}"}} {value}')
+        if queue_counts:
+            lines.append("# TYPE osu_queue_jobs gauge")
+            lines += [f'osu_queue_jobs{{state="{state}"}} {count}' for state, count in queue_counts.items()]
+        if mirrors:
+            lines.append("# TYPE osu_mirror_latency_seconds gauge")
+            lines += [f'osu_mirror_latency_seconds{{mirror="{m["name"]}"}} {m["latency"]}'
+                      for m in mirrors if m["latency"] is not None]
+            lines.append("# TYPE osu_mirror_throughput_bytes gauge")
+            lines += [f'osu_mirror_throughput_bytes{{mirror="{m["name"]}"}} {m["throughput"]:.0f}'
+                      for m in mirrors if m["throughput"]]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves DownloadMetrics at http://127.0.0.1:<port>/metrics for Prometheus or curl"""
+    def __init__(self, render, port):
+        self.render = render  # Returns the metrics text
+        self.port = port
+        self._server = None
+
+    def start(self):
+        import http.server
+        render = self.render
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would drown the console
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self._server.daemon_threads = True
+        server_thread = threading.Thread(target=self._server.serve_forever, name="metrics-server")
+        server_thread.daemon = True
+        server_thread.start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class SetCache:
+    """Content-addressed .osz store for the LAN proxy, bounded by size.
+
+    Archives are kept as objects/<ab>/<sha256>.osz and sets.db maps beatmapset IDs to them,
+    so identical files are stored once. Past max_bytes, the sets served longest ago are evicted.
+    """
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(folder, "objects"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(folder, "sets.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS sets (
+                id TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                filename TEXT,
+                last_used REAL
+            )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sets_last_used ON sets (last_used)")
+
+    def object_path(self, sha256):
+        return os.path.join(self.folder, "objects", sha256[:2], sha256 + ".osz")
+
+    def get(self, beatmap_id):
+        """Cache entry of a set, marking it as just used, or None"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT sha256, size, filename FROM sets WHERE id = ?",
+                                     (str(beatmap_id),)).fetchone()
+            if row is None:
+                return None
+            entry = {"id": str(beatmap_id), "sha256": row[0], "size": row[1], "filename": row[2],
+                     "path": self.object_path(row[0])}
+            if not os.path.exists(entry["path"]):
+                self._conn.execute("DELETE FROM sets WHERE id = ?", (entry["id"],))  # Removed behind our back
+                return None
+            self._conn.execute("UPDATE sets SET last_used = ? WHERE id = ?", (time.time(), entry["id"]))
+        return entry
+
+    def put(self, beatmap_id, source_path, filename):
+        """Move a downloaded archive into the cache, returns its entry"""
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+        path = self.object_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(source_path)  # Same bytes as a set we already have
+        else:
+            os.replace(source_path, path)
+        size = os.path.getsize(path)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO sets (id, sha256, size, filename, last_used) "
+                               "VALUES (?, ?, ?, ?, ?)", (str(beatmap_id), sha256, size, filename, time.time()))
+        self.evict(keep=str(beatmap_id))
+        return {"id": str(beatmap_id), "sha256": sha256, "size": size, "filename": filename, "path": path}
+
+    def total_bytes(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM sets GROUP BY sha256)"
+            ).fetchone()[0]
+
+    def evict(self, keep=None):
+        """Drop least recently used sets until the cache fits in max_bytes, never the one in `keep`"""
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT id, sha256, size FROM sets ORDER BY last_used").fetchall()
+            for beatmap_id, sha256, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if beatmap_id == keep:
+                    continue
+                self._conn.execute("DELETE FROM sets WHERE id = ?", (beatmap_id,))
+                if self._conn.execute("SELECT 1 FROM sets WHERE sha256 = ?", (sha256,)).fetchone():
+                    continue  # Another set still points at these bytes
+                total -= size
+                try:
+                    os.remove(self.object_path(sha256))
+                except OSError as e:
+                    # e.g. still being sent on Windows, it's no longer indexed either way
+                    print(f"Error evicting cached set {beatmap_id}: {str(e)}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BeatmapProxy:
+    """Serves GET /d/<id> from a SetCache, so other instances on the LAN can use it as their mirror.
+
+    Misses are fetched through the downloader's own mirrors. Concurrent requests for the same
+    set share one upstream fetch.
+    """
+    PATH_PATTERN = re.compile(r'^/d/(\d+)/?$')
+
+    def __init__(self, downloader, cache, host="0.0.0.0", port=8765):
+        self.downloader = downloader
+        self.cache = cache
+        self.host = host
+        self.port = port
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0  # Requests that waited for a fetch another request had started
+        self._flights = {}  # beatmap_id -> Future of the upstream fetch in progress
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        import http.server
+        proxy = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, clients pool their connections
+
+            def do_GET(self):
+                proxy.handle(self, send_body=True)
+
+            def do_HEAD(self):
+                proxy.handle(self, send_body=False)
+
+            def log_message(self, format, *args):
+                pass  # Cache hits and misses go through update_status instead
+
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]  # Resolves port 0
+        server_thread = threading.Thread(target=self._server.serve_forever, name="beatmap-proxy")
+        server_thread.daemon = True
+        server_thread.start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def get(self, beatmap_id):
+        """Cache entry for a set, fetching it upstream once however many requests are waiting for it"""
+        import concurrent.futures
+        entry = self.cache.get(beatmap_id)
+        with self._lock:
+            if entry:
+                self.hits += 1
+                return entry
+            flight = self._flights.get(beatmap_id)
+            leader = flight is None
+            if leader:
+                flight = self._flights[beatmap_id] = concurrent.futures.Future()
+            else:
+                self.shared += 1
+        if not leader:
+            return flight.result()
+        try:
+            entry = self.cache.get(beatmap_id)  # Another flight may have landed since we looked
+            if entry is None:
+                with self._lock:
+                    self.misses += 1
+                self.downloader.update_status(f"Cache miss, fetching {beatmap_id} upstream")
+                filepath, filename, metadata = self.downloader.download_from_mirrors(beatmap_id)
+                entry = self.cache.put(beatmap_id, filepath, filename)
+            flight.set_result(entry)
+            return entry
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._flights[beatmap_id]
+
+    def handle(self, request, send_body):
+        match = self.PATH_PATTERN.match(request.path.split("?")[0])
+        if not match:
+            request.send_error(404)
+            return
+        try:
+            entry = self.get(match.group(1))
+        except DownloadError as e:
+            # Only a 404 if every mirror said so, anything else may work on a retry
+            missing = e.causes and all(getattr(cause, 'status_code', None) == 404 for cause in e.causes)
+            request.send_error(404 if missing else 502, str(e))
+            return
+        except Exception as e:
+            print(f"Error serving beatmap {match.group(1)}: {str(e)}")
+            request.send_error(502, str(e))
+            return
+        self.send_entry(request, entry, send_body)
+
+    def header_filename(self, entry):
+        filename = re.sub(r'["\r\n]', "", entry["filename"] or f"beatmap_{entry['id']}.osz")
+        try:
+            filename.encode('latin-1')
+        except UnicodeEncodeError:
+            # Raw UTF-8 like the mirrors send it, http.server only writes latin-1 headers
+            filename = filename.encode('utf-8').decode('latin-1')
+        return filename
+
+    def send_entry(self, request, entry, send_body):
+        etag = f'"{entry["sha256"]}"'
+        size = entry["size"]
+        start, end = 0, size - 1
+        status = 200
+        # Honor "Range: bytes=N-[M]" so clients can resume, unless If-Range names other content
+        byte_range = re.match(r'^bytes=(\d+)-(\d*)$', request.headers.get('Range', '').strip())
+        if byte_range and request.headers.get('If-Range', etag) == etag:
+            start = int(byte_range.group(1))
+            if byte_range.group(2):
+                end = min(end, int(byte_range.group(2)))
+            if start > end:
+                request.send_response(416)
+                request.send_header("Content-Range", f"bytes */{size}")
+                request.send_header("Content-Length", "0")
+                request.end_headers()
+                return
+            status = 206
+        try:
+            f = open(entry["path"], 'rb')
+        except OSError:
+            request.send_error(503, "evicted while being requested")  # Rare, the client just retries
+            return
+        with f:
+            request.send_response(status)
+            request.send_header("Content-Type", "application/x-osu-beatmap-archive")
+            request.send_header("Content-Length", str(end - start + 1))
+            request.send_header("Content-Disposition", f'attachment; filename="{self.header_filename(entry)}"')
+            request.send_header("ETag", etag)
+            request.send_header("Accept-Ranges", "bytes")
+            if status == 206:
+                request.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            request.end_headers()
+            if send_body:
+                request.connection.sendfile(f, start, end - start + 1)
+
+
+class HistoryStore:
+    """Download history kept in SQLite, indexed by beatmapset ID and date"""
+    COLUMNS = ("id", "filename", "path", "date", "url")
+    SEARCHED_METADATA = ("title", "artist", "creator", "source", "difficulties")
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()  # One connection shared by the GUI and the workers
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS history (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL,
+                filename TEXT,
+                path TEXT,
+                date TEXT,
+                url TEXT,
+                extra TEXT,
+                search_text TEXT
+            )""")
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(history)")]
+            if "search_text" not in columns:
+                # Databases from before search_text: fill it in from the metadata kept in extra
+                self._conn.execute("ALTER TABLE history ADD COLUMN search_text TEXT")
+                rows = self._conn.execute("SELECT seq, extra FROM history WHERE extra IS NOT NULL").fetchall()
+                self._conn.executemany("UPDATE history SET search_text = ? WHERE seq = ?",
+                                       [(self._search_text(json.loads(extra)), seq) for seq, extra in rows])
+            self._conn.execute("CREATE INDEX IF NOT EXISTS history_id ON history (id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS history_date ON history (date)")
+            # Dead-letter list: downloads that ran out of retries, kept until they succeed
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS failed (
+                id TEXT PRIMARY KEY,
+                error TEXT,
+                attempts INTEGER,
+                date TEXT
+            )""")
+
+    def migrate_json(self, json_path):
+        """Import a legacy download_history.json once, then move it out of the way"""
+        if not os.path.exists(json_path) or self.count():
+            return 0
+        with open(json_path, 'r') as f:
+            entries = json.load(f)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO history (id, filename, path, date, url, extra, search_text) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [self._to_row(entry) for entry in entries])
+        os.replace(json_path, json_path + ".migrated")
+        return len(entries)
+
+    def add(self, entry):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO history (id, filename, path, date, url, extra, search_text) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._to_row(entry))
+
+    def all(self):
+        return self._query("SELECT * FROM history ORDER BY seq")
+
+    def find_by_id(self, beatmap_id):
+        return self._query("SELECT * FROM history WHERE id = ? ORDER BY seq", (str(beatmap_id),))
+
+    def find_by_date(self, start, end=None):
+        """Entries downloaded between two "YYYY-MM-DD[ HH:MM:SS]" strings, end inclusive"""
+        if end is None:
+            return self._query("SELECT * FROM history WHERE date >= ? ORDER BY date", (start,))
+        # A bare end date should include that whole day
+        end = end + " 99" if len(end) == 10 else end
+        return self._query("SELECT * FROM history WHERE date >= ? AND date <= ? ORDER BY date", (start, end))
+
+    def search(self, text, limit=None, offset=0):
+        """Entries whose ID matches exactly, or whose filename or set metadata contains the text.
+
+        limit and offset fetch one page of the matches, a short query can match nearly every row.
+        """
+        pattern = f"%{text}%"
+        sql = "SELECT * FROM history WHERE id = ? OR filename LIKE ? OR search_text LIKE ? ORDER BY seq"
+        params = (text.strip(), pattern, pattern)
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += (limit, offset)
+        return self._query(sql, params)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def add_failed(self, beatmap_id, error, attempts):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO failed (id, error, attempts, date) VALUES (?, ?, ?, ?)",
+                               (str(beatmap_id), error, attempts, time.strftime("%Y-%m-%d %H:%M:%S")))
+
+    def remove_failed(self, beatmap_id):
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM failed WHERE id = ?", (str(beatmap_id),)).rowcount
+
+    def failed(self):
+        with self._lock:
+            cursor = self._conn.execute("SELECT id, error, attempts, date FROM failed ORDER BY date")
+            return [dict(zip(("id", "error", "attempts", "date"), row)) for row in cursor.fetchall()]
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM history")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        return [self._to_entry(dict(zip(names, row))) for row in rows]
+
+    def _to_row(self, entry):
+        # Keys beyond the indexed columns (e.g. set metadata) ride along as JSON
+        extra = {k: v for k, v in entry.items() if k not in HistoryStore.COLUMNS}
+        return (str(entry.get("id")), entry.get("filename"), entry.get("path"), entry.get("date"),
+                entry.get("url"), json.dumps(extra) if extra else None, self._search_text(extra))
+
+    def _search_text(self, extra):
+        """Metadata values search() matches against, one per line (the JSON in extra has key names too)"""
+        values = []
+        for key in HistoryStore.SEARCHED_METADATA:
+            value = extra.get(key)
+            values.extend(value if isinstance(value, list) else [value])
+        return "\n".join(str(value) for value in values if value) or None
+
+    def _to_entry(self, row):
+        entry = {k: row[k] for k in HistoryStore.COLUMNS}
+        if row.get("extra"):
+            entry.update(json.loads(row["extra"]))
+        return entry
+
+
+class LibraryIndex:
+    """Persistent index of beatmapset IDs already present in the download and Songs folders.
+
+    Each folder is rescanned only when its modification time changes, which happens
+    whenever an entry is added, removed or renamed inside it.
+    """
+    # "123 Artist - Title", "123 Artist - Title.osz", "123.osz" or our own "beatmap_123.osz"
+    ENTRY_PATTERN = re.compile(r'^(?:beatmap_)?(\d+)(?:[ _]|\.osz$)', re.IGNORECASE)
+    CHECK_INTERVAL = 2  # Seconds between mtime checks of the indexed folders
+
+    def __init__(self, index_path, roots=()):
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._roots = {}  # folder -> {"mtime": float, "sets": {beatmap_id: entry name}}
+        self._last_check = 0
+        self._load()
+        self.set_roots(roots)
+
+    def set_roots(self, roots):
+        """Choose the folders to index, keeping what is already known about them"""
+        roots = [os.path.normpath(root) for root in roots if root]
+        with self._lock:
+            self._roots = {root: self._roots.get(root, {"mtime": None, "sets": {}}) for root in roots}
+            self._last_check = 0
+
+    def find(self, beatmap_id):
+        """Path of an existing copy of the set, or None"""
+        self.refresh()
+        beatmap_id = str(beatmap_id)
+        with self._lock:
+            for root, info in self._roots.items():
+                name = info["sets"].get(beatmap_id)
+                if name and os.path.exists(os.path.join(root, name)):
+                    return os.path.join(root, name)
+        return None
+
+    def add(self, beatmap_id, path):
+        """Record a set we just wrote, without waiting for the next rescan"""
+        root = os.path.normpath(os.path.dirname(path))
+        with self._lock:
+            if root in self._roots:
+                self._roots[root]["sets"][str(beatmap_id)] = os.path.basename(path)
+
+    def ids(self):
+        self.refresh()
+        with self._lock:
+            return {beatmap_id for info in self._roots.values() for beatmap_id in info["sets"]}
+
+    def refresh(self, force=False):
+        """Rescan folders whose mtime changed since the last scan"""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_check < LibraryIndex.CHECK_INTERVAL:
+                return
+            self._last_check = now
+            changed = False
+            for root, info in self._roots.items():
+                try:
+                    mtime = os.stat(root).st_mtime
+                except OSError:
+                    continue
+                if force or mtime != info["mtime"]:
+                    info["sets"] = self._scan(root)
+                    info["mtime"] = mtime
+                    changed = True
+            if changed:
+                self._save()
+
+    def _scan(self, root):
+        sets = {}
+        try:
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    match = LibraryIndex.ENTRY_PATTERN.match(entry.name)
+                    if not match:
+                        continue
+                    if entry.is_dir() or entry.name.lower().endswith(".osz"):
+                        sets.setdefault(match.group(1), entry.name)
+        except OSError as e:
+            print(f"Error scanning {root}: {str(e)}")
+        return sets
+
+    def _load(self):
+        try:
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'r') as f:
+                    self._roots = json.load(f).get("roots", {})
+        except Exception as e:
+            print(f"Error loading library index: {str(e)}")
+            self._roots = {}
+
+    def _save(self):
+        # Caller holds self._lock
+        try:
+            temp_path = self.index_path + ".tmp"
+            with open(temp_path, 'w') as f:
+                json.dump({"roots": self._roots}, f)
+            os.replace(temp_path, self.index_path)
+        except Exception as e:
+            print(f"Error saving library index: {str(e)}")
+
+
+class OsuDbReader:
+    """Sequential reader for osu!'s binary .db formats.
+
+    The file is memory-mapped, so even a 100k-map osu!.db is walked without loading it.
+    """
+    BYTE = struct.Struct("<B")
+    INT = struct.Struct("<i")
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        if os.fstat(self._file.fileno()).st_size:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b""
+        self.pos = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def byte(self):
+        return self._unpack(OsuDbReader.BYTE)
+
+    def int(self):
+        return self._unpack(OsuDbReader.INT)
+
+    def skip(self, count):
+        self.pos += count
+        if self.pos > len(self._data):
+            raise ValueError("database is truncated")
+
+    def string(self):
+        length = self._string_length()
+        if length is None:
+            return None
+        value = self._data[self.pos:self.pos + length]
+        self.skip(length)
+        return value.decode("utf-8", "replace")
+
+    def skip_string(self):
+        length = self._string_length()
+        if length:
+            self.skip(length)
+
+    def _string_length(self):
+        # 0x00 for an absent string, otherwise 0x0b, a ULEB128 length and UTF-8 bytes
+        marker = self.byte()
+        if marker == 0:
+            return None
+        if marker != 0x0b:
+            raise ValueError(f"bad string marker {marker:#x} at offset {self.pos - 1}")
+        length = shift = 0
+        while True:
+            part = self.byte()
+            length |= (part & 0x7f) << shift
+            if not part & 0x80:
+                return length
+            shift += 7
+
+    def _unpack(self, fmt):
+        try:
+            value = fmt.unpack_from(self._data, self.pos)[0]
+        except struct.error:
+            raise ValueError("database is truncated")
+        self.pos += fmt.size
+        return value
+
+
+def read_collection_db(path):
+    """Yield (collection name, [beatmap MD5s]) from an osu! collection.db, one collection at a time"""
+    with OsuDbReader(path) as reader:
+        reader.int()  # Version
+        for _ in range(reader.int()):
+            name = reader.string()
+            yield name, [reader.string() for _ in range(reader.int())]
+
+
+def read_osu_db(path):
+    """Yield (beatmap MD5, beatmap ID, beatmapset ID) for every difficulty in an osu!.db"""
+    with OsuDbReader(path) as reader:
+        version = reader.int()
+        reader.skip(4 + 1 + 8)  # Folder count, account unlocked, unlock date
+        reader.skip_string()  # Player name
+        for _ in range(reader.int()):
+            if version < 20191106:
+                reader.skip(4)  # Entry size, dropped in later versions
+            for _ in range(7):
+                reader.skip_string()  # Artist, title (both also in unicode), creator, difficulty, audio file
+            md5 = reader.string()
+            reader.skip_string()  # .osu file name
+            reader.skip(1 + 6 + 8)  # Ranked status, object counts, modification time
+            reader.skip(4 if version < 20140609 else 16)  # AR, CS, HP, OD as bytes, later as floats
+            reader.skip(8)  # Slider velocity
+            if version >= 20140609:
+                # Star ratings per mode: (mod, rating) pairs, doubles until they became floats
+                pair_size = 14 if version < 20250107 else 10
+                for _ in range(4):
+                    reader.skip(reader.int() * pair_size)
+            reader.skip(12)  # Drain time, total time, preview time
+            reader.skip(reader.int() * 17)  # Timing points
+            beatmap_id = reader.int()
+            set_id = reader.int()
+            reader.skip(4 + 4 + 2 + 4 + 1)  # Thread ID, grades, local offset, stack leniency, mode
+            reader.skip_string()  # Source
+            reader.skip_string()  # Tags
+            reader.skip(2)  # Online offset
+            reader.skip_string()  # Title font
+            reader.skip(1 + 8 + 1)  # Unplayed, last played, osz2
+            reader.skip_string()  # Folder name
+            reader.skip(8 + 5)  # Last checked, per-map sound/skin/storyboard/video/visual overrides
+            if version < 20140609:
+                reader.skip(2)
+            reader.skip(4 + 1)  # Last modification time, mania scroll speed
+            yield md5, beatmap_id, set_id
+
+
+class ClipboardSource:
+    """Watches the clipboard and calls on_change(text) whenever its text changes"""
+    name = "base"
+
+    def __init__(self):
+        self.on_change = None
+        self.on_error = None
+        self.last_text = None
+
+    def start(self, on_change, on_error=None):
+        self.on_change = on_change
+        self.on_error = on_error
+
+    def stop(self):
+        pass
+
+    def read(self):
+        import pyperclip
+        return pyperclip.paste()
+
+    def check(self):
+        """Read the clipboard and report it if it changed, returns True on a change"""
+        try:
+            text = self.read()
+        except Exception as e:
+            if self.on_error:
+                self.on_error(e)
+            return False
+        if text == self.last_text:
+            return False
+        self.last_text = text
+        if text and self.on_change:
+            self.on_change(text)
+        return True
+
+
+class PollingClipboardSource(ClipboardSource):
+    """Polls pyperclip, quickly right after a change and backing off while the clipboard is idle.
+
+    The backoff stops at half a second, the fixed interval this replaced, so no copy waits longer than before.
+    """
+    name = "polling"
+
+    def __init__(self, min_interval=0.25, max_interval=0.5, backoff=1.5):
+        super().__init__()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, on_change, on_error=None):
+        super().start(on_change, on_error)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"clipboard-{self.name}")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        interval = self.min_interval
+        while not self._stop.is_set():
+            if self.changed():
+                interval = self.min_interval
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+            self._stop.wait(interval)
+
+    def changed(self):
+        return self.check()
+
+
+class WindowsClipboardSource(PollingClipboardSource):
+    """Polls GetClipboardSequenceNumber, an in-process counter, and only reads the text when it moves"""
+    name = "windows"
+
+    def __init__(self, interval=0.1):
+        super().__init__(min_interval=interval, max_interval=interval)
+        import ctypes
+        self._sequence_number = ctypes.windll.user32.GetClipboardSequenceNumber
+        self._last_sequence = None
+
+    def changed(self):
+        sequence = self._sequence_number()
+        if sequence == self._last_sequence:
+            return False
+        self._last_sequence = sequence
+        return self.check()
+
+
+class X11ClipboardSource(ClipboardSource):
+    """Sleeps until XFixes reports a new CLIPBOARD owner, then reads the text once"""
+    name = "x11"
+    SELECTION_OWNER_NOTIFY_MASK = 1  # XFixesSetSelectionOwnerNotifyMask
+
+    def __init__(self):
+        super().__init__()
+        import ctypes
+        import ctypes.util
+        self._ctypes = ctypes
+        xlib_path = ctypes.util.find_library("X11")
+        xfixes_path = ctypes.util.find_library("Xfixes")
+        if not xlib_path or not xfixes_path or not os.environ.get("DISPLAY"):
+            raise OSError("X11 with the XFixes extension is not available")
+        self._xlib = ctypes.cdll.LoadLibrary(xlib_path)
+        self._xfixes = ctypes.cdll.LoadLibrary(xfixes_path)
+        self._xlib.XOpenDisplay.restype = ctypes.c_void_p
+        self._xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        self._xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+        self._xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        self._xlib.XInternAtom.restype = ctypes.c_ulong
+        self._xlib.XInternAtom.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
+        self._xlib.XConnectionNumber.argtypes = [ctypes.c_void_p]
+        self._xlib.XPending.argtypes = [ctypes.c_void_p]
+        self._xlib.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        self._xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        self._xfixes.XFixesQueryExtension.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_int),
+                                                      ctypes.POINTER(ctypes.c_int)]
+        self._xfixes.XFixesSelectSelectionInput.argtypes = [ctypes.c_void_p, ctypes.c_ulong,
+                                                            ctypes.c_ulong, ctypes.c_ulong]
+        self._display = self._xlib.XOpenDisplay(None)
+        if not self._display:
+            raise OSError("Cannot open the X display")
+        event_base, error_base = ctypes.c_int(), ctypes.c_int()
+        if not self._xfixes.XFixesQueryExtension(self._display, ctypes.byref(event_base),
+                                                 ctypes.byref(error_base)):
+            self._xlib.XCloseDisplay(self._display)
+            raise OSError("The X server has no XFixes extension")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, on_change, on_error=None):
+        super().start(on_change, on_error)
+        clipboard = self._xlib.XInternAtom(self._display, b"CLIPBOARD", 0)
+        root_window = self._xlib.XDefaultRootWindow(self._display)
+        self._xfixes.XFixesSelectSelectionInput(self._display, root_window, clipboard,
+                                                X11ClipboardSource.SELECTION_OWNER_NOTIFY_MASK)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="clipboard-x11")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        import select
+        event = self._ctypes.create_string_buffer(256)  # Larger than any XEvent
+        fd = self._xlib.XConnectionNumber(self._display)
+        self.check()  # Pick up whatever is on the clipboard already
+        while not self._stop.is_set():
+            # Wake up at least twice a second so stop() is noticed
+            select.select([fd], [], [], 0.5)
+            changed = False
+            while self._xlib.XPending(self._display):
+                self._xlib.XNextEvent(self._display, event)
+                changed = True
+            if changed:
+                self.check()
+        self._xlib.XCloseDisplay(self._display)
+
+
+class TkClipboardSource(ClipboardSource):
+    """Reads the clipboard through Tk on the main thread, without spawning any helper process"""
+    name = "tk"
+
+    def __init__(self, root, min_interval=250, max_interval=500, backoff=1.5):
+        super().__init__()
+        self.root = root
+        self.min_interval = min_interval  # Milliseconds
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._interval = min_interval
+        self._after_id = None
+
+    def start(self, on_change, on_error=None):
+        super().start(on_change, on_error)
+        self._interval = self.min_interval
+        self._tick()
+
+    def stop(self):
+        if self._after_id:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def read(self):
+        import tkinter as tk
+        try:
+            return self.root.clipboard_get()
+        except tk.TclError:
+            return ""  # Clipboard is empty or doesn't hold text
+
+    def _tick(self):
+        if self.check():
+            self._interval = self.min_interval
+        else:
+            self._interval = min(int(self._interval * self.backoff), self.max_interval)
+        self._after_id = self.root.after(self._interval, self._tick)
+
+
+class FakeClipboardSource(ClipboardSource):
+    """In-memory clipboard for tests, push() fires the change callback synchronously"""
+    name = "fake"
+
+    def __init__(self, text=""):
+        super().__init__()
+        self.text = text
+
+    def read(self):
+        return self.text
+
+    def push(self, text):
+        self.text = text
+        return self.check()
+
+
+def create_clipboard_source(kind="auto", root=None):
+    """Pick the cheapest clipboard watcher this platform supports, "fake" gives the in-memory one"""
+    if kind == "auto":
+        candidates = ["windows" if sys.platform == "win32" else "x11", "tk", "polling"]
+    else:
+        candidates = [kind, "polling"]
+    for candidate in candidates:
+        try:
+            if candidate == "windows":
+                return WindowsClipboardSource()
+            if candidate == "x11":
+                return X11ClipboardSource()
+            if candidate == "tk" and root is not None:
+                return TkClipboardSource(root)
+            if candidate == "polling":
+                return PollingClipboardSource()
+            if candidate == "fake":
+                return FakeClipboardSource()
+        except Exception as e:
+            print(f"Clipboard source '{candidate}' unavailable: {str(e)}")
+    return PollingClipboardSource()
+
+
+class DownloadBatch:
+    """Jobs submitted together from one paste or clipboard copy, for aggregate progress"""
+    def __init__(self, total, label="Batch"):
+        self.total = total
+        self.label = label
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0  # Already queued elsewhere, or a beatmap we couldn't resolve
+        self._lock = threading.Lock()
+
+    def job_finished(self, job):
+        with self._lock:
+            if job.state == DownloadJob.DONE:
+                self.done += 1
+            else:
+                self.failed += 1
+
+    def skip(self, count=1):
+        with self._lock:
+            self.skipped += count
+
+    @property
+    def is_finished(self):
+        return self.done + self.failed + self.skipped >= self.total
+
+    def summary(self):
+        with self._lock:
+            text = f"{self.label}: {self.done + self.failed + self.skipped}/{self.total} finished"
+            if self.failed:
+                text += f", {self.failed} failed"
+            if self.skipped:
+                text += f", {self.skipped} skipped"
+            return text
+
+
+class DownloadJob:
+    """A single beatmapset download tracked by the download queue"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    RETRYING = "retrying"  # Failed, waiting out its backoff before going back in the queue
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, beatmap_id, seq, force=False, batch=None, priority=PRIORITY_NORMAL):
+        self.beatmap_id = beatmap_id
+        self.seq = seq
+        self.priority = priority  # Lower runs first
+        self.force = force  # Download even if the set is already in the library
+        self.batch = batch  # DownloadBatch this job belongs to, if any
+        self.state = DownloadJob.QUEUED
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.retry_at = None  # When a retrying job is queued again
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def is_finished(self):
+        return self.state in (DownloadJob.DONE, DownloadJob.FAILED)
+
+
+class DownloadQueue:
+    """Thread-safe job queue drained by a bounded pool of download workers"""
+    STATES = (DownloadJob.QUEUED, DownloadJob.RUNNING, DownloadJob.RETRYING, DownloadJob.DONE, DownloadJob.FAILED)
+
+    def __init__(self, worker, max_workers=4, on_change=None, engine=None, retry_policy=None, keep_finished=False):
+        self.worker = worker  # Called with a beatmap ID and force flag, returns the file path or None
+        self.engine = engine  # Optional AsyncDownloadEngine that replaces the worker threads
+        self.retry_policy = retry_policy  # RetryPolicy for failed jobs, None fails them right away
+        self.max_workers = max(1, int(max_workers))
+        self.on_change = on_change
+        # Finished jobs are forgotten once on_change has seen them, unless a view lists them until clear_finished()
+        self.keep_finished = keep_finished
+        self._jobs = {}  # seq -> job, every job still held, in submission order
+        self._counts = dict.fromkeys(DownloadQueue.STATES, 0)  # Jobs in _jobs per state, kept up to date
+        self._active = {}  # beatmap_id -> job, for queued or running jobs
+        self._pending = queue.PriorityQueue()  # (priority, seq, job), job None stops a worker
+        self._retry_timers = {}  # job -> threading.Timer for jobs waiting out a backoff
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._seq = 0
+        self._thread_count = 0
+        self._threads = set()  # Live worker threads, see join_workers
+        self._cancelled = False  # Set by stop(cancel_queued=True), workers then skip what is still queued
+        self._running = False
+
+    def start(self):
+        """Spin up the worker threads"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            if not self.engine:
+                self._spawn_workers(self.max_workers)
+
+    def stop(self, cancel_queued=False):
+        """Let the workers exit once the jobs already queued are done, or after their current one with cancel_queued"""
+        with self._lock:
+            self._running = False
+            self._cancelled = cancel_queued
+            count = self._thread_count
+            waiting = list(self._retry_timers.items())
+            self._retry_timers.clear()
+        for job, timer in waiting:
+            # Give up on backoffs now so they reach the dead-letter list instead of vanishing
+            timer.cancel()
+            self._finish_job(job, lambda: None, lambda: DownloadError(f"{job.error} (retry cancelled)"))
+        for _ in range(count):
+            # Sorted after every real job, so queued work still finishes
+            self._pending.put((sys.maxsize, 0, None))
+
+    def join_workers(self, timeout=None):
+        """Wait for the worker threads to exit after stop(), returns False if some are still running"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            threads = list(self._threads)
+        for worker_thread in threads:
+            worker_thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not any(worker_thread.is_alive() for worker_thread in threads)
+
+    def resize(self, max_workers):
+        """Change the pool size while running"""
+        max_workers = max(1, int(max_workers))
+        with self._lock:
+            delta = max_workers - self.max_workers
+            self.max_workers = max_workers
+            if not self._running or self.engine:
+                return
+            if delta > 0:
+                self._spawn_workers(delta)
+        # Surplus workers pick up a sentinel and exit
+        for _ in range(-delta if delta < 0 else 0):
+            self._pending.put((-1, 0, None))
+
+    def submit(self, beatmap_id, force=False, batch=None, priority=PRIORITY_NORMAL):
+        """Queue a beatmapset, returns None if it is already queued or in flight"""
+        beatmap_id = str(beatmap_id)
+        with self._lock:
+            if beatmap_id in self._active:
+                return None
+            self._seq += 1
+            job = DownloadJob(beatmap_id, self._seq, force, batch, priority)
+            self._active[beatmap_id] = job
+            self._jobs[job.seq] = job
+            self._counts[job.state] += 1
+        self._notify(job)
+        self._dispatch(job)
+        return job
+
+    def join(self, timeout=None):
+        """Block until no job is queued or running, returns False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._active, timeout)
+
+    def is_active(self, beatmap_id):
+        with self._lock:
+            return str(beatmap_id) in self._active
+
+    @property
+    def jobs(self):
+        """Every job still held, in submission order"""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def counts(self):
+        """Number of held jobs per state"""
+        with self._lock:
+            return dict(self._counts)
+
+    def clear_finished(self):
+        """Forget jobs that are done or failed"""
+        with self._lock:
+            removed = [job for job in self._jobs.values() if job.is_finished]
+            for job in removed:
+                self._forget(job)
+        return removed
+
+    def _set_state(self, job, state):
+        with self._lock:
+            if job.seq in self._jobs:
+                self._counts[job.state] -= 1
+                self._counts[state] += 1
+            job.state = state
+
+    def _forget(self, job):
+        # Caller holds self._lock
+        if self._jobs.pop(job.seq, None) is not None:
+            self._counts[job.state] -= 1
+
+    def _dispatch(self, job):
+        if self.engine:
+            future = self.engine.submit(job.beatmap_id, on_start=lambda: self._mark_running(job), force=job.force,
+                                        priority=job.priority)
+            future.add_done_callback(lambda f: self._finish_job(job, f.result, f.exception))
+        else:
+            self._pending.put((job.priority, job.seq, job))
+
+    def _retry(self, job):
+        with self._lock:
+            if self._retry_timers.pop(job, None) is None:
+                return  # Cancelled by stop()
+        self._set_state(job, DownloadJob.QUEUED)
+        job.retry_at = None
+        self._notify(job)
+        self._dispatch(job)
+
+    def _schedule_retry(self, job, error):
+        """Put a failed job back in the queue after its backoff, returns False if it shouldn't be retried"""
+        if not self.retry_policy or not self._running:
+            return False
+        delay = self.retry_policy.delay(error, max(1, job.attempts))
+        if delay is None:
+            return False
+        job.error = str(error)
+        job.retry_at = time.time() + delay
+        self._set_state(job, DownloadJob.RETRYING)
+        timer = threading.Timer(delay, self._retry, (job,))
+        timer.daemon = True
+        with self._lock:
+            self._retry_timers[job] = timer
+        timer.start()
+        self._notify(job)
+        return True
+
+    def _spawn_workers(self, count):
+        # Caller holds self._lock
+        for _ in range(count):
+            self._thread_count += 1
+            worker_thread = threading.Thread(target=self._worker_loop,
+                                             name=f"download-worker-{self._thread_count}")
+            worker_thread.daemon = True
+            self._threads.add(worker_thread)
+            worker_thread.start()
+
+    def _worker_loop(self):
+        while True:
+            priority, seq, job = self._pending.get()
+            if job is None:
+                with self._lock:
+                    self._thread_count -= 1
+                    self._threads.discard(threading.current_thread())
+                return
+            if self._cancelled:
+                continue  # Shutting down, leave it for the sentinel behind it
+            self._run_job(job)
+
+    def _run_job(self, job):
+        self._mark_running(job)
+        try:
+            result = self.worker(job.beatmap_id, force=job.force)
+        except Exception as e:
+            error = e
+            self._finish_job(job, lambda: None, lambda: error)
+            return
+        self._finish_job(job, lambda: result, lambda: None)
+
+    def _mark_running(self, job):
+        self._set_state(job, DownloadJob.RUNNING)
+        job.attempts += 1
+        job.started = time.time()
+        self._notify(job)
+
+    def _finish_job(self, job, result, exception):
+        # result/exception are callables so engine futures and plain calls share this path
+        error = exception()
+        if error and self._schedule_retry(job, error):
+            return
+        if error:
+            job.error = str(error)
+            state = DownloadJob.FAILED
+        else:
+            job.result = result()
+            job.error = None  # From an earlier attempt
+            state = DownloadJob.DONE if job.result else DownloadJob.FAILED
+        job.finished = time.time()
+        self._set_state(job, state)
+        if job.batch:
+            job.batch.job_finished(job)
+        with self._lock:
+            self._active.pop(job.beatmap_id, None)
+        self._notify(job)
+        if not self.keep_finished:
+            with self._lock:
+                self._forget(job)
+        with self._idle:
+            if not self._active:
+                self._idle.notify_all()
+
+    def _notify(self, job):
+        if self.on_change:
+            try:
+                self.on_change(job)
+            except Exception as e:
+                print(f"Error in queue callback: {str(e)}")
+
+
+class PriorityGate:
+    """asyncio semaphore that lets the waiter with the lowest priority number in first"""
+    def __init__(self, value):
+        self._value = value
+        self._waiters = []  # Heap of (priority, seq, future)
+        self._seq = 0
+
+    async def acquire(self, priority=PRIORITY_NORMAL):
+        import asyncio
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        self._seq += 1
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, self._seq, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # We were handed the slot just as we got cancelled
+            raise
+
+    def release(self):
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)[2]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._value += 1
+
+
+class AsyncDownloadEngine:
+    """Runs many set downloads concurrently on one asyncio loop in a background thread.
+
+    Needs the optional aiohttp package. Mirror selection, resume journals and history
+    bookkeeping are shared with the threaded path through the downloader instance.
+    """
+    WRITE_BUFFER = 256 * 1024  # Bytes collected before each disk write
+
+    def __init__(self, downloader, max_concurrency=100, per_host_limit=8):
+        import concurrent.futures
+        self.downloader = downloader
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.session = None
+        self._loop = None
+        self._thread = None
+        self._gate = None
+        # Disk writes run here so a slow download folder never stalls the event loop
+        self._disk = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="download-disk")
+
+    def start(self):
+        import asyncio
+        import importlib.util
+        # Fail here rather than on the loop thread, aiohttp itself is imported by _open_session
+        if importlib.util.find_spec("aiohttp") is None:
+            raise ImportError("aiohttp is not installed")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="download-loop")
+        self._thread.daemon = True
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._open_session(), self._loop).result()
+
+    def stop(self):
+        import asyncio
+        if not self._loop:
+            return
+        asyncio.run_coroutine_threadsafe(self.session.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._disk.shutdown(wait=True)
+        self._loop = None
+
+    def submit(self, beatmap_id, on_start=None, force=False, priority=PRIORITY_NORMAL):
+        """Schedule a download from any thread, returns a concurrent.futures.Future"""
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(self.download(beatmap_id, on_start, force, priority),
+                                                self._loop)
+
+    async def _open_session(self):
+        import aiohttp
+        d = self.downloader
+        self._gate = PriorityGate(self.max_concurrency)
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.per_host_limit)
+        timeout = aiohttp.ClientTimeout(sock_connect=d.connect_timeout, sock_read=d.read_timeout)
+        # Time DNS lookups and new connections into each request's trace_request_ctx dict
+        trace = aiohttp.TraceConfig()
+        trace.on_dns_resolvehost_start.append(self._trace_timer("dns", True))
+        trace.on_dns_resolvehost_end.append(self._trace_timer("dns", False))
+        trace.on_connection_create_start.append(self._trace_timer("connect", True))
+        trace.on_connection_create_end.append(self._trace_timer("connect", False))
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[trace],
+                                             headers={'User-Agent': d.user_agent})
+
+    @staticmethod
+    def _trace_timer(phase, start):
+        async def callback(session, context, params):
+            timings = context.trace_request_ctx
+            if timings is None:
+                return
+            if start:
+                timings[phase + "_started"] = time.perf_counter()
+            elif phase + "_started" in timings:
+                timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - timings.pop(phase + "_started")
+        return callback
+
+    async def download(self, beatmap_id, on_start=None, force=False, priority=PRIORITY_NORMAL):
+        d = self.downloader
+        if not force:
+            existing = await self._run_blocking(d.find_existing, beatmap_id)
+            if existing:
+                return existing
+        await self._gate.acquire(priority)
+        try:
+            return await self._download_from_mirrors(beatmap_id, on_start)
+        finally:
+            self._gate.release()
+
+    async def _download_from_mirrors(self, beatmap_id, on_start):
+        import aiohttp
+        import asyncio
+        d = self.downloader
+        if on_start:
+            on_start()
+        errors = []
+        causes = []
+        d.start_progress(beatmap_id)
+        try:
+            for mirror in d.mirror_candidates(beatmap_id):
+                try:
+                    filepath, filename, metadata = await self._fetch_to_file(beatmap_id, mirror)
+                except (MirrorError, aiohttp.ClientError, asyncio.TimeoutError, IOError) as e:
+                    if isinstance(e, IntegrityError):
+                        await self._run_blocking(d.discard_partial, beatmap_id)
+                    errors.append(d.note_mirror_error(mirror, e))
+                    causes.append(e)
+                    continue
+                await self._run_blocking(d.record_download, beatmap_id, filepath, filename, metadata)
+                return filepath
+        finally:
+            d.end_progress(beatmap_id)
+        raise DownloadError('; '.join(errors) or "no mirrors configured", causes)
+
+    async def _fetch_to_file(self, beatmap_id, mirror):
+        """Async counterpart of OsuBeatmapDownloader.fetch_to_file"""
+        import aiohttp
+        import asyncio
+        d = self.downloader
+        download_url = mirror.url_for(beatmap_id)
+        part_path = d.get_partial_paths(beatmap_id)[0]
+        drops = 0
+        latency = None
+        progress = {"id": beatmap_id, "bytes": 0, "disk": 0.0}
+        transfer_time = 0.0
+        timing = {"dns": 0.0, "connect": 0.0, "ttfb": 0.0}  # Summed over resumed requests
+        while True:
+            journal, offset, headers = d.prepare_resume(beatmap_id, download_url)
+            delay = d.request_delay(mirror)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            request_timing = {}
+            sent = time.perf_counter()
+            async with self.session.get(download_url, headers=dict(DOWNLOAD_HEADERS, **headers),
+                                        trace_request_ctx=request_timing) as response:
+                waited = time.perf_counter() - sent
+                if latency is None:
+                    latency = waited
+                # aiohttp resolves DNS while creating the connection, keep the phases apart
+                dns = request_timing.get("dns", 0.0)
+                connect = request_timing.get("connect", 0.0)
+                timing["dns"] += dns
+                timing["connect"] += max(0.0, connect - dns)
+                timing["ttfb"] += max(0.0, waited - connect)
+                action, journal = d.resume_action(beatmap_id, download_url, response.status,
+                                                  response.headers, headers, offset, journal)
+                if action == "complete":
+                    return await self._run_blocking(d.complete_download, beatmap_id, journal)
+                if action == "restart":
+                    continue
+                if action == "fail":
+                    raise d.mirror_error(response.status, response.headers)
+                
+                verifier = await self._run_blocking(d.start_verifier, beatmap_id, action)
+                started = time.time()
+                try:
+                    progress["position"] = offset if action == "append" else 0
+                    progress["length"] = journal.get('length')
+                    await self._stream_to_file(response, beatmap_id, action, journal, progress, mirror, verifier)
+                except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    transfer_time += time.time() - started
+                    drops += 1
+                    if drops > d.resume_attempts:
+                        raise
+                    d.update_status(f"Connection dropped ({str(e)}), resuming beatmap {beatmap_id}...")
+                    continue
+                transfer_time += time.time() - started
+            
+            if not d.transfer_complete(journal):
+                drops += 1
+                if drops > d.resume_attempts:
+                    raise IOError(f"Incomplete download: {os.path.getsize(part_path)} "
+                                  f"of {journal.get('length')} bytes")
+                continue
+            
+            result = await self._run_blocking(d.complete_download, beatmap_id, journal, verifier)
+            d.mirrors.record_success(mirror, latency, progress["bytes"], transfer_time)
+            d.record_transfer_metrics(beatmap_id, mirror, progress["bytes"], transfer_time, progress["disk"],
+                                      drops, **timing)
+            return result
+
+    async def _stream_to_file(self, response, beatmap_id, action, journal, progress, mirror, verifier):
+        import asyncio
+        d = self.downloader
+        writer = await self._run_blocking(d.open_part_file, beatmap_id, action, journal)
+        buffer = bytearray()
+        complete = False
+        limit = d.read_limit(mirror)
+        if limit < OsuBeatmapDownloader.READ_CHUNK_MAX:
+            chunks = response.content.iter_chunked(limit)  # Throttled, keep the pauses short
+        else:
+            chunks = response.content.iter_any()  # Whatever the socket has buffered
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                progress["bytes"] += len(chunk)
+                progress["position"] += len(chunk)
+                d.metrics.add_bytes(mirror.name, len(chunk))
+                d.note_progress(progress["id"], progress["position"], progress["length"])
+                delay = d.throttle_delay(mirror, len(chunk))
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if len(buffer) >= AsyncDownloadEngine.WRITE_BUFFER:
+                    # The loop waits for the write, so the buffer can be handed over without a copy
+                    progress["disk"] += await self._run_blocking(self._write_verified, writer, verifier, buffer)
+            progress["disk"] += await self._run_blocking(self._write_verified, writer, verifier, buffer)
+            complete = not progress["length"] or writer.position >= progress["length"]
+        finally:
+            # Keep whatever arrived before a drop so the next attempt can resume from it
+            if buffer:
+                await self._run_blocking(writer.write, buffer)
+            await self._run_blocking(writer.close, complete)
+
+    def _write_verified(self, writer, verifier, buffer):
+        # Runs on the disk thread so inflating .osu entries never stalls the event loop
+        started = time.perf_counter()
+        writer.write(buffer)
+        written = time.perf_counter() - started
+        try:
+            verifier.feed(buffer)
+        finally:
+            buffer.clear()  # On disk even if the verifier rejects it, it mustn't be written again on the way out
+        return written
+
+    async def _run_blocking(self, func, *args):
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(self._disk, func, *args)
+
+
+class UiEventBus:
+    """Hands GUI updates from download threads to the Tk main loop.
+
+    Any thread may post(); the main loop calls drain() on an after() tick. An event posted
+    with a key replaces a pending one with the same key, so a burst of progress updates
+    costs a single redraw per tick. A drain can be capped, so queueing thousands of jobs
+    spreads their rows over several ticks instead of freezing one.
+    """
+    def __init__(self):
+        self._pending = collections.OrderedDict()  # key -> (func, args)
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def post(self, func, *args, key=None):
+        with self._lock:
+            if key is None:
+                self._seq += 1
+                key = ("event", self._seq)
+            self._pending[key] = (func, args)
+
+    def drain(self, limit=None):
+        with self._lock:
+            if limit is None or len(self._pending) <= limit:
+                pending, self._pending = self._pending, collections.OrderedDict()
+            else:
+                # Oldest first, the rest keep their place for the next tick
+                pending = collections.OrderedDict(self._pending.popitem(last=False) for _ in range(limit))
+        for func, args in pending.values():
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Error in GUI update: {str(e)}")
+        return len(pending)
+
 
 class OsuBeatmapDownloader:
+    READ_CHUNK_MIN = 64 * 1024  # First read of a response body
+    READ_CHUNK_MAX = 1024 * 1024  # Reads double up to this while they keep coming back full
+    READ_CHUNK_FLOOR = 1024  # Smallest read under a very low speed limit
+    HISTORY_PAGE = 200  # History list rows created at a time
+    HISTORY_SEARCH_DELAY = 250  # Milliseconds of no typing before the history search runs
+    UI_EVENTS_PER_TICK = 500  # GUI updates applied per pump_ui_events tick
+    SHUTDOWN_WAIT = 10  # Seconds shutdown() gives running downloads to finish
+
     def __init__(self, root=None):
-        self.beatmap_id_pattern = r'osu\.ppy\.sh/beatmapsets/(\d+)'
-        self.direct_download_url = "https://catboy.best/d/{}"  # Using direct Catboy download URL format
+        self.beatmap_lookup_url = DEFAULT_BEATMAP_LOOKUP_URL
+        self.beatmap_set_cache = {}  # Beatmap ID -> beatmapset ID
+        self.mirror_list = list(DEFAULT_MIRRORS)  # URL templates, "{}" is replaced by the beatmapset ID
         self.download_folder = self.get_download_folder()
         self.previous_clipboard = ""
-        self.is_running = True
+        self.clipboard_source = None
+        self.clipboard_kind = "auto"  # "auto", "windows", "x11", "tk" or "polling"
         self.status_var = None
+        self.status_stream = None  # File that receives status messages when there is no GUI
+        self.open_after_download = True  # Hand finished downloads to osu!
         self.download_history = []
+        self.visible_history = []  # What the history list shows, after filtering by the search box
+        self.history_rows = 0  # Leading entries of visible_history that have a list box row yet
+        self.history_query = ""  # Search the list is filtered by, its matches are fetched a page at a time
+        self.history_more = False  # Whether the search has matches past visible_history
+        self.history_search_after = None  # Pending debounced search, see schedule_history_search
+        self.history_lock = threading.Lock()  # Workers append to the history concurrently
+        self.ui_events = UiEventBus()  # Worker -> Tk updates, drained on the main thread
+        self.ui_thread = None  # Thread running the Tk main loop, None without a GUI
+        self.transfer_progress = {}  # beatmap_id -> (bytes received, total bytes or None)
+        self.progress_lock = threading.Lock()
+        self.queue_rows = {}  # beatmap_id -> queue view row of a job in flight
         self.theme = "light"  # Default theme
+        self.max_workers = 4  # Parallel downloads
+        self.pool_size = 16  # Keep-alive connections kept per mirror host
+        self.connect_timeout = 10  # Seconds
+        self.read_timeout = 30  # Seconds without any data before a transfer is abandoned
+        self.resume_attempts = 5  # Range resumes per download after a dropped connection
+        self.user_agent = DEFAULT_USER_AGENT
+        self.engine = "threaded"  # "threaded" or "async" (needs aiohttp)
+        self.async_concurrency = 100  # Simultaneous downloads with the async engine
+        self.per_host_limit = 8  # Connections per mirror host with the async engine
+        self.songs_folder = self.get_songs_folder()  # osu!'s own Songs folder, if installed
+        self.skip_existing = True  # Don't re-download sets already in the library
+        self.max_kbps = 0  # Total download speed limit, 0 = unlimited
+        self.mirror_max_kbps = 0  # Default speed limit per mirror
+        self.mirror_requests_per_minute = 0  # Default request rate limit per mirror
+        self.max_backoff_wait = 60  # Seconds we'll wait for a rate-limited mirror before giving up
+        self.retry_rules = {}  # Overrides of RetryPolicy.DEFAULT_RULES, per error class
+        self.retry_jitter = 0.5
+        self.preallocate = True  # Reserve the whole file up front when the mirror sends Content-Length
+        self.fsync_policy = "on_complete"  # "never", "on_complete" or "interval", see PartFileWriter
+        self.metrics_port = 0  # Serve Prometheus metrics on localhost at this port, 0 = off
+        self.metrics_log = ""  # JSONL file with one line per finished download, "" = off
+        self.cache_folder = ""  # Where `serve` keeps its LAN cache, "" = beatmap_cache next to this script
+        self.cache_max_mb = 10240  # Size limit of that cache
+        self.proxy_port = 8765  # Port `serve` listens on
         self.load_history()
         self.load_settings()
-        
+        self.library = LibraryIndex(os.path.join(os.path.dirname(os.path.abspath(__file__)), "beatmap_index.json"),
+                                    self.library_roots())
+        self._session = None  # See session, requests is only imported once something goes online
+        self.session_lock = threading.Lock()
+        self.metrics = DownloadMetrics(log_path=self.metrics_log or None)
+        self.metrics_server = None
+        self.start_metrics_server(self.metrics_port)
+        self.bandwidth = TokenBucket(self.max_kbps * 1024)
+        self.mirrors = MirrorRegistry(self.mirror_list, max_kbps=self.mirror_max_kbps,
+                                      requests_per_minute=self.mirror_requests_per_minute)
+        self.async_engine = self.create_async_engine() if self.engine == "async" else None
+        self.job_listeners = []  # Extra callables notified of every job change
+        self.retry_policy = RetryPolicy(self.retry_rules, self.retry_jitter)
+        self.download_queue = DownloadQueue(self.download_set, self.max_workers,
+                                            on_change=self.on_job_changed, engine=self.async_engine,
+                                            retry_policy=self.retry_policy)
+        self.download_queue.start()
+
         # If root is provided, create GUI
         if root:
             self.setup_gui(root)
         
+    @property
+    def session(self):
+        """Pooled requests session, built on first use"""
+        if self._session is None:
+            with self.session_lock:
+                if self._session is None:
+                    self._session = create_http_session(max(self.pool_size, self.max_workers), self.user_agent)
+        return self._session
+
+    def create_async_engine(self):
+        engine = AsyncDownloadEngine(self, self.async_concurrency, self.per_host_limit)
+        try:
+            engine.start()
+        except ImportError:
+            print("The async engine needs aiohttp (pip install aiohttp), using threaded downloads")
+            return None
+        return engine
+
+    def start_metrics_server(self, port):
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        self.metrics_port = port
+        if not port:
+            return
+        server = MetricsServer(self.metrics_text, port)
+        try:
+            server.start()
+        except OSError as e:
+            print(f"Error starting metrics server on port {port}: {str(e)}")
+            return
+        self.metrics_server = server
+
+    def metrics_text(self):
+        return self.metrics.prometheus_text(self.download_queue.counts(), self.mirrors.snapshot())
+
+    def shutdown(self):
+        """Stop the download machinery and close network resources"""
+        if self.metrics_server:
+            self.metrics_server.stop()
+        self.download_queue.stop(cancel_queued=True)
+        # Downloads already running still record their outcome in the history, so it's closed last
+        if not self.download_queue.join_workers(self.SHUTDOWN_WAIT):
+            print("Error: downloads still running at shutdown, their results won't be recorded")
+        if self.async_engine:
+            self.async_engine.stop()
+        if self._session:
+            self._session.close()
+        self.history_store.close()
+
     def get_download_folder(self):
         # Default download folder - modify as needed
         download_folder = os.path.join(os.path.expanduser("~"), "Downloads", "osu_beatmaps")
@@ -34,13 +2349,29 @@ class OsuBeatmapDownloader:
             os.makedirs(download_folder)
         return download_folder
     
+    def get_songs_folder(self):
+        # Default osu!stable install location on Windows
+        songs_folder = os.path.join(os.environ.get("LOCALAPPDATA", ""), "osu!", "Songs")
+        return songs_folder if os.environ.get("LOCALAPPDATA") and os.path.isdir(songs_folder) else ""
+
+    def library_roots(self):
+        return [self.download_folder, self.songs_folder]
+    
     def setup_gui(self, root):
+        import tkinter as tk
+        from tkinter import ttk
+        from tkinter.font import Font
+
         # Center the window on startup
         self.center_window(root, 550, 450)
         
         root.title("osu! Beatmap Downloader")
         root.resizable(True, True)
         
+        # Only this thread touches Tk, everyone else goes through self.ui_events
+        self.ui_thread = threading.get_ident()
+        self.ui_root = root
+        
         # Create theme colors
         self.theme_colors = {
             "light": {
@@ -86,13 +2417,16 @@ class OsuBeatmapDownloader:
         # Status label
         self.status_var = tk.StringVar()
         self.status_var.set("Waiting for beatmap links...")
-        ttk.Label(main_frame, textvariable=self.status_var).pack(pady=5)
+        self.status_label = ttk.Label(main_frame, textvariable=self.status_var)
+        self.status_label.pack(pady=5)
         
         # Progress bar for downloads
         self.progress_frame = ttk.Frame(main_frame)
         self.progress_frame.pack(fill=tk.X, pady=5)
-        self.progress = ttk.Progressbar(self.progress_frame, orient=tk.HORIZONTAL, length=100, mode='indeterminate')
+        self.progress = ttk.Progressbar(self.progress_frame, orient=tk.HORIZONTAL, length=100, mode='determinate')
         self.progress.pack(fill=tk.X)
+        self.progress_var = tk.StringVar()
+        ttk.Label(self.progress_frame, textvariable=self.progress_var).pack()
         self.progress_frame.pack_forget()  # Hide initially
         
         # Download folder display and browse button
@@ -102,6 +2436,17 @@ class OsuBeatmapDownloader:
         self.folder_var = tk.StringVar(value=self.download_folder)
         ttk.Label(folder_frame, textvariable=self.folder_var, width=30).pack(side=tk.LEFT, padx=5)
         ttk.Button(folder_frame, text="Browse", command=self.browse_folder).pack(side=tk.LEFT)
+
+        # osu! Songs folder, checked for sets that are already installed
+        songs_frame = ttk.Frame(main_frame)
+        songs_frame.pack(fill=tk.X, pady=(0, 10))
+        ttk.Label(songs_frame, text="osu! Songs folder:").pack(side=tk.LEFT)
+        self.songs_var = tk.StringVar(value=self.songs_folder or "(not set)")
+        ttk.Label(songs_frame, textvariable=self.songs_var, width=28).pack(side=tk.LEFT, padx=5)
+        ttk.Button(songs_frame, text="Browse", command=self.browse_songs_folder).pack(side=tk.LEFT)
+        self.skip_existing_var = tk.BooleanVar(value=self.skip_existing)
+        ttk.Checkbutton(songs_frame, text="Skip sets I have", variable=self.skip_existing_var,
+                        command=self.change_skip_existing).pack(side=tk.LEFT, padx=5)
         
         # URL input for manual download
         manual_frame = ttk.LabelFrame(main_frame, text="Manual Download")
@@ -134,18 +2479,136 @@ class OsuBeatmapDownloader:
         ttk.Button(control_frame, text="Open Download Folder", 
                   command=lambda: os.startfile(self.download_folder)).pack(side=tk.LEFT, padx=5)
         
+        # Bulk import from collection.db, osu!.db or a list of links
+        ttk.Button(control_frame, text="Import...", command=self.import_dialog).pack(side=tk.LEFT, padx=5)
+
+        # Worker pool size
+        workers_frame = ttk.Frame(main_frame)
+        workers_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(workers_frame, text="Parallel downloads:").pack(side=tk.LEFT)
+        self.workers_var = tk.IntVar(value=self.max_workers)
+        ttk.Spinbox(workers_frame, from_=1, to=16, width=4, textvariable=self.workers_var,
+                    command=self.change_max_workers).pack(side=tk.LEFT, padx=5)
+        ttk.Label(workers_frame, text="Speed limit (KB/s, 0 = none):").pack(side=tk.LEFT, padx=(10, 0))
+        self.speed_var = tk.IntVar(value=self.max_kbps)
+        speed_box = ttk.Spinbox(workers_frame, from_=0, to=1000000, increment=256, width=8,
+                                textvariable=self.speed_var, command=self.change_speed_limit)
+        speed_box.pack(side=tk.LEFT, padx=5)
+        speed_box.bind("<Return>", lambda event: self.change_speed_limit())
+
+        # Queue tab
+        queue_frame = ttk.Frame(notebook, padding="10")
+        notebook.add(queue_frame, text="Queue")
+
+        self.queue_tree = ttk.Treeview(queue_frame, columns=("id", "state", "progress", "file"), show="headings",
+                                       height=12)
+        self.download_queue.keep_finished = True  # Listed here until "Clear Finished"
+        self.queue_tree.heading("id", text="Beatmap ID")
+        self.queue_tree.heading("state", text="State")
+        self.queue_tree.heading("progress", text="Progress")
+        self.queue_tree.heading("file", text="File / Error")
+        self.queue_tree.column("id", width=90, stretch=False)
+        self.queue_tree.column("state", width=80, stretch=False)
+        self.queue_tree.column("progress", width=110, stretch=False)
+        self.queue_tree.column("file", width=300)
+        self.queue_tree.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+        queue_buttons = ttk.Frame(queue_frame)
+        queue_buttons.pack(fill=tk.X, pady=5)
+        ttk.Button(queue_buttons, text="Clear Finished",
+                  command=self.clear_finished_jobs).pack(side=tk.LEFT, padx=5)
+
+        # Failed tab: downloads that ran out of retries, kept across restarts
+        failed_frame = ttk.Frame(notebook, padding="10")
+        notebook.add(failed_frame, text="Failed")
+
+        self.failed_tree = ttk.Treeview(failed_frame, columns=("id", "attempts", "date", "error"),
+                                        show="headings", height=12)
+        for column, title, width in (("id", "Beatmap ID", 90), ("attempts", "Attempts", 70),
+                                     ("date", "Failed At", 130), ("error", "Error", 300)):
+            self.failed_tree.heading(column, text=title)
+            self.failed_tree.column(column, width=width, stretch=(column == "error"))
+        self.failed_tree.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+        failed_buttons = ttk.Frame(failed_frame)
+        failed_buttons.pack(fill=tk.X, pady=5)
+        ttk.Button(failed_buttons, text="Retry All",
+                  command=self.retry_failed).pack(side=tk.LEFT, padx=5)
+        ttk.Button(failed_buttons, text="Retry Selected",
+                  command=self.retry_selected_failed).pack(side=tk.LEFT, padx=5)
+        ttk.Button(failed_buttons, text="Remove Selected",
+                  command=self.remove_selected_failed).pack(side=tk.LEFT, padx=5)
+        self.refresh_failed_view()
+
+        # Mirrors tab
+        mirrors_frame = ttk.Frame(notebook, padding="10")
+        notebook.add(mirrors_frame, text="Mirrors")
+
+        self.mirror_tree = ttk.Treeview(mirrors_frame, show="headings", height=6,
+                                        columns=("name", "latency", "speed", "limit", "state", "error"))
+        for column, title, width in (("name", "Mirror", 90), ("latency", "Latency", 70),
+                                     ("speed", "Speed", 80), ("limit", "Limit", 110), ("state", "State", 90),
+                                     ("error", "Last Error", 200)):
+            self.mirror_tree.heading(column, text=title)
+            self.mirror_tree.column(column, width=width, stretch=(column == "error"))
+        self.mirror_tree.pack(fill=tk.BOTH, expand=True)
+        self.refresh_mirror_view()
+
+        # Per-mirror limits: the defaults for every mirror, or overrides for the selected ones
+        limits_frame = ttk.Frame(mirrors_frame)
+        limits_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(limits_frame, text="KB/s (0 = none):").pack(side=tk.LEFT)
+        self.mirror_speed_var = tk.IntVar(value=self.mirror_max_kbps)
+        ttk.Spinbox(limits_frame, from_=0, to=1000000, increment=256, width=8,
+                    textvariable=self.mirror_speed_var).pack(side=tk.LEFT, padx=5)
+        ttk.Label(limits_frame, text="Requests/min (0 = none):").pack(side=tk.LEFT, padx=(10, 0))
+        self.mirror_rpm_var = tk.IntVar(value=int(self.mirror_requests_per_minute))
+        ttk.Spinbox(limits_frame, from_=0, to=6000, increment=10, width=6,
+                    textvariable=self.mirror_rpm_var).pack(side=tk.LEFT, padx=5)
+        ttk.Button(limits_frame, text="Apply to All",
+                  command=self.change_mirror_limits).pack(side=tk.LEFT, padx=5)
+        ttk.Button(limits_frame, text="Apply to Selected",
+                  command=lambda: self.change_mirror_limits(selected=True)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(limits_frame, text="Reset Selected",
+                  command=self.reset_mirror_limits).pack(side=tk.LEFT, padx=5)
+
+        # Stats tab: where the time goes, to tell slow mirrors from a slow network or disk
+        stats_frame = ttk.Frame(notebook, padding="10")
+        notebook.add(stats_frame, text="Stats")
+
+        self.stats_rate_var = tk.StringVar(value="-")
+        self.stats_totals_var = tk.StringVar(value="-")
+        ttk.Label(stats_frame, textvariable=self.stats_rate_var, font=("Arial", 14)).pack(anchor=tk.W)
+        ttk.Label(stats_frame, textvariable=self.stats_totals_var).pack(anchor=tk.W, pady=(0, 5))
+        self.stats_tree = ttk.Treeview(stats_frame, columns=("phase", "p50", "p95"), show="headings", height=7)
+        for column, title, width in (("phase", "Phase", 120), ("p50", "p50", 90), ("p95", "p95", 90)):
+            self.stats_tree.heading(column, text=title)
+            self.stats_tree.column(column, width=width)
+        self.stats_tree.pack(fill=tk.BOTH, expand=True)
+        self.refresh_stats_view()
+
         # History tab
         history_frame = ttk.Frame(notebook, padding="10")
         notebook.add(history_frame, text="Download History")
         
+        # Search by ID, filename, title, artist, mapper or difficulty name
+        search_frame = ttk.Frame(history_frame)
+        search_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT)
+        self.history_search_var = tk.StringVar()
+        self.history_search_var.trace_add("write", lambda *args: self.schedule_history_search())
+        ttk.Entry(search_frame, textvariable=self.history_search_var).pack(side=tk.LEFT, fill=tk.X,
+                                                                          expand=True, padx=5)
+        
         # Create history list
         self.history_listbox = tk.Listbox(history_frame, width=70, height=15)
         self.history_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
         # Scrollbar for history list
-        scrollbar = ttk.Scrollbar(history_frame, orient="vertical", command=self.history_listbox.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.history_listbox.configure(yscrollcommand=scrollbar.set)
+        self.history_scrollbar = ttk.Scrollbar(history_frame, orient="vertical", command=self.history_listbox.yview)
+        self.history_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Scrolling near the end adds the next page of rows
+        self.history_listbox.configure(yscrollcommand=self.on_history_scroll)
         
         # Buttons for history actions
         history_buttons = ttk.Frame(history_frame)
@@ -177,11 +2640,14 @@ class OsuBeatmapDownloader:
                                       font=signature_font)
         self.signature_label.pack(side=tk.RIGHT, padx=10)
         
-        # Update history list
-        self.update_history_list()
+        # Fill the history list once the entries have been read, without holding up the window
+        self.start_history_load()
         
         # Apply initial theme
         self.apply_theme()
+        
+        # Start applying updates posted by the download threads
+        self.pump_ui_events()
     
     def center_window(self, window, width, height):
         """Center the window on the screen"""
@@ -194,6 +2660,7 @@ class OsuBeatmapDownloader:
     
     def paste_url(self):
         """Paste clipboard content into URL entry"""
+        import pyperclip
         clipboard_content = pyperclip.paste()
         self.url_var.set(clipboard_content)
     
@@ -229,130 +2696,852 @@ class OsuBeatmapDownloader:
         if hasattr(self, 'root'):
             self.root.configure(bg=colors["bg"])
     
+    def run_on_ui(self, func, *args, key=None):
+        """Call func on the Tk main thread: right away from there, otherwise on the next tick"""
+        if self.ui_thread is None or threading.get_ident() == self.ui_thread:
+            func(*args)
+        else:
+            self.ui_events.post(func, *args, key=key)
+
+    def pump_ui_events(self):
+        """Apply GUI updates posted by other threads, about 60 times a second"""
+        self.ui_events.drain(self.UI_EVENTS_PER_TICK)
+        self.ui_root.after(16, self.pump_ui_events)
+
     def update_status(self, message):
         if self.status_var:
-            self.status_var.set(message)
+            self.run_on_ui(self.status_var.set, message, key="status")  # Only the latest message matters
+        elif self.status_stream:
+            print(message, file=self.status_stream, flush=True)
     
     def start_monitoring(self):
         if hasattr(self, 'start_button'):
+            import tkinter as tk
             self.start_button.config(state=tk.DISABLED)
             self.stop_button.config(state=tk.NORMAL)
         
-        self.is_running = True
-        self.monitor_thread = threading.Thread(target=self.monitor_clipboard)
-        self.monitor_thread.daemon = True
-        self.monitor_thread.start()
+        self.clipboard_source = create_clipboard_source(self.clipboard_kind, getattr(self, 'root', None))
+        self.clipboard_source.last_text = self.previous_clipboard
+        self.clipboard_source.start(self.on_clipboard_change,
+                                    lambda e: self.update_status(f"Error: {str(e)}"))
+        self.update_status("Monitoring clipboard for beatmap links...")
         
     def stop_monitoring(self):
-        self.is_running = False
+        if self.clipboard_source:
+            self.previous_clipboard = self.clipboard_source.last_text or ""
+            self.clipboard_source.stop()
+            self.clipboard_source = None
         if hasattr(self, 'start_button'):
+            import tkinter as tk
             self.start_button.config(state=tk.NORMAL)
             self.stop_button.config(state=tk.DISABLED)
         self.update_status("Monitoring stopped")
     
-    def monitor_clipboard(self):
-        self.update_status("Monitoring clipboard for beatmap links...")
-        
-        while self.is_running:
-            try:
-                current_clipboard = pyperclip.paste()
-                
-                if current_clipboard != self.previous_clipboard:
-                    self.previous_clipboard = current_clipboard
-                    
-                    # Check if it's an osu beatmap URL
-                    beatmap_match = re.search(self.beatmap_id_pattern, current_clipboard)
-                    if beatmap_match:
-                        beatmap_id = beatmap_match.group(1)
-                        self.update_status(f"Found beatmap ID: {beatmap_id}. Downloading...")
-                        self.download_beatmap(beatmap_id)
-                        
-            except Exception as e:
-                self.update_status(f"Error: {str(e)}")
-            
-            time.sleep(0.5)  # Check every half second
-    
-    def show_progress(self):
-        """Show progress bar"""
-        if hasattr(self, 'progress_frame'):
-            self.progress_frame.pack(fill=tk.X, pady=5)
-            self.progress.start(10)
+    def on_clipboard_change(self, current_clipboard):
+        """Called by the clipboard source with the new clipboard text"""
+        # Only links count here, a copied number is too likely to be something else
+        if 'osu.ppy.sh/' in current_clipboard:
+            self.enqueue_text(current_clipboard, bare_ids=False)
     
-    def hide_progress(self):
-        """Hide progress bar"""
-        if hasattr(self, 'progress_frame'):
+    def start_progress(self, beatmap_id):
+        self.note_progress(beatmap_id, 0, None)
+
+    def note_progress(self, beatmap_id, received, total):
+        """Record how far a transfer got, the GUI redraws at most once per tick however often this is called"""
+        with self.progress_lock:
+            self.transfer_progress[beatmap_id] = (received, total)
+        if self.ui_thread is not None:
+            self.ui_events.post(self.draw_progress, key="progress")
+
+    def end_progress(self, beatmap_id):
+        with self.progress_lock:
+            self.transfer_progress.pop(beatmap_id, None)
+        if self.ui_thread is not None:
+            self.ui_events.post(self.draw_progress, key="progress")
+
+    def draw_progress(self):
+        """Overall progress bar over every active transfer, plus the per-job column in the queue view"""
+        if not hasattr(self, 'progress_frame'):
+            return
+        import tkinter as tk
+        with self.progress_lock:
+            transfers = dict(self.transfer_progress)
+        if not transfers:
             self.progress.stop()
             self.progress_frame.pack_forget()
+            return
+        if not self.progress_frame.winfo_ismapped():
+            self.progress_frame.pack(fill=tk.X, pady=5, after=self.status_label)
+        received = sum(done for done, total in transfers.values())
+        if all(total for done, total in transfers.values()):
+            expected = sum(total for done, total in transfers.values())
+            if str(self.progress['mode']) != 'determinate':
+                self.progress.stop()
+                self.progress.configure(mode='determinate', maximum=100)
+            self.progress['value'] = 100 * received / expected if expected else 0
+            self.progress_var.set(f"{len(transfers)} downloading: {received / 1048576:.1f} of "
+                                  f"{expected / 1048576:.1f} MB")
+        else:
+            # A mirror didn't send Content-Length, so there's no total to measure against
+            if str(self.progress['mode']) != 'indeterminate':
+                self.progress.configure(mode='indeterminate')
+                self.progress.start(10)
+            self.progress_var.set(f"{len(transfers)} downloading: {received / 1048576:.1f} MB")
+        for beatmap_id, (done, total) in transfers.items():
+            iid = self.queue_rows.get(beatmap_id)
+            if iid and self.queue_tree.exists(iid):
+                text = f"{100 * done / total:.0f}%" if total else f"{done / 1048576:.1f} MB"
+                self.queue_tree.set(iid, "progress", text)
     
-    def download_beatmap(self, beatmap_id):
+    def download_set(self, beatmap_id, force=False):
+        """Download worker used by the queue, raises on failure so the job records why"""
+        # Skip sets we already have before touching the network
+        if not force:
+            existing = self.find_existing(beatmap_id)
+            if existing:
+                return existing
+        
+        self.start_progress(beatmap_id)
         try:
-            # Show progress bar
-            self.show_progress()
+            filepath, filename, metadata = self.download_from_mirrors(beatmap_id)
+            self.record_download(beatmap_id, filepath, filename, metadata)
+            return filepath
+        finally:
+            self.end_progress(beatmap_id)
+
+    def find_existing(self, beatmap_id):
+        """Path of a copy already in the download or Songs folder, if skipping those is enabled"""
+        if not self.skip_existing:
+            return None
+        existing = self.library.find(beatmap_id)
+        if existing:
+            self.update_status(f"Beatmap {beatmap_id} is already in your library: {os.path.basename(existing)}")
+        return existing
+
+    def record_download(self, beatmap_id, filepath, filename, metadata=None):
+        """Add a finished download to the history and hand it to osu!"""
+        self.update_status(f"Downloaded to: {filepath}")
+        self.library.add(beatmap_id, filepath)
+        
+        # Add to history
+        history_entry = {
+            "id": beatmap_id,
+            "filename": filename,
+            "path": filepath,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "url": f"https://osu.ppy.sh/beatmapsets/{beatmap_id}"
+        }
+        if metadata:
+            # Title, artist, mapper and difficulty names read from the archive while it downloaded
+            history_entry.update(metadata)
+        with self.history_lock:
+            self.history_store.add(history_entry)
+            self.download_history.append(history_entry)
+        self.update_history_list(history_entry)
+        
+        # Open the file
+        if self.open_after_download:
+            self.open_file(filepath)
+
+    def download_from_mirrors(self, beatmap_id):
+        """Try each mirror in turn until one delivers the set, returns (filepath, filename, metadata)"""
+        import requests
+        errors = []
+        causes = []
+        for mirror in self.mirror_candidates(beatmap_id):
+            self.update_status(f"Downloading from: {mirror.url_for(beatmap_id)}")
+            try:
+                return self.fetch_to_file(beatmap_id, mirror)
+            except (MirrorError, requests.exceptions.RequestException, IOError) as e:
+                if isinstance(e, IntegrityError):
+                    self.discard_partial(beatmap_id)  # Nothing worth resuming, fetch it fresh elsewhere
+                errors.append(self.note_mirror_error(mirror, e))
+                causes.append(e)
+        raise DownloadError('; '.join(errors) or "no mirrors configured", causes)
+
+    def mirror_candidates(self, beatmap_id):
+        part_path, journal_path = self.get_partial_paths(beatmap_id)
+        journal = self.load_partial_journal(journal_path)
+        return self.mirrors.candidates(journal.get('url') if journal else None)
+
+    def note_mirror_error(self, mirror, error):
+        """Feed a failed attempt into the mirror's health, returns a line for the status message"""
+        if isinstance(error, MirrorBusyError):
+            pass  # Already backing off, don't extend it
+        elif isinstance(error, MirrorError) and error.status_code == 404:
+            # The mirror is fine, it just doesn't have this set
+            mirror.last_error = str(error)
+        elif isinstance(error, MirrorError) and error.status_code == 429:
+            # Rate limited: stay away for as long as the mirror asked, or a default cooldown
+            self.mirrors.record_failure(mirror, error, error.retry_after or self.mirrors.cooldown)
+        else:
+            self.mirrors.record_failure(mirror, error, getattr(error, 'retry_after', None))
+        return f"{mirror.name}: {str(error)}"
+
+    def fetch_to_file(self, beatmap_id, mirror):
+        """Stream a beatmapset into its .part file, resuming with Range requests after drops.
+
+        Returns (filepath, filename, metadata), raises MirrorError when the mirror refuses
+        the download and IntegrityError when what it sends isn't a valid .osz.
+        """
+        import http.client
+        import requests
+        download_url = mirror.url_for(beatmap_id)
+        part_path, journal_path = self.get_partial_paths(beatmap_id)
+        drops = 0
+        latency = None
+        received = 0
+        transfer_time = 0.0
+        disk_time = 0.0
+        timing = {"connect": 0.0, "ttfb": 0.0}  # Summed over resumed requests
+        while True:
+            journal, offset, headers = self.prepare_resume(beatmap_id, download_url)
             
-            download_url = self.direct_download_url.format(beatmap_id)
-            self.update_status(f"Downloading from: {download_url}")
+            delay = self.request_delay(mirror)
+            if delay > 0:
+                time.sleep(delay)
             
-            # Add User-Agent header to avoid potential API blocks
-            headers = {
-                'User-Agent': 'OsuBeatmapDownloader/1.0'
-            }
+            # The shared session reuses pooled connections and sends the User-Agent header
+            connect_timing.seconds = 0.0
+            response = self.session.get(download_url, stream=True, headers=dict(DOWNLOAD_HEADERS, **headers),
+                                        timeout=(self.connect_timeout, self.read_timeout))
+            waited = response.elapsed.total_seconds()
+            if latency is None:
+                latency = waited
+            timing["connect"] += connect_timing.seconds  # Zero when a pooled connection was reused
+            timing["ttfb"] += max(0.0, waited - connect_timing.seconds)
             
-            response = requests.get(download_url, stream=True, headers=headers)
+            action, journal = self.resume_action(beatmap_id, download_url, response.status_code,
+                                                 response.headers, headers, offset, journal)
+            if action != "append" and action != "write":
+                response.close()  # Hand the connection back to the pool
+                if action == "complete":
+                    return self.complete_download(beatmap_id, journal)
+                if action == "restart":
+                    continue
+                raise self.mirror_error(response.status_code, response.headers)
             
-            if response.status_code == 200:
-                # Extract filename from header or use beatmap ID
-                content_disposition = response.headers.get('Content-Disposition')
-                if content_disposition and 'filename=' in content_disposition:
-                    filename = re.findall('filename="(.+)"', content_disposition)[0]
-                else:
-                    filename = f"beatmap_{beatmap_id}.osz"
-                
-                filepath = os.path.join(self.download_folder, filename)
-                
-                # Ensure we have unique filenames
-                counter = 1
-                base_name, extension = os.path.splitext(filename)
-                while os.path.exists(filepath):
-                    filename = f"{base_name}_{counter}{extension}"
-                    filepath = os.path.join(self.download_folder, filename)
-                    counter += 1
-                
-                # Download the file
-                with open(filepath, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                
-                self.update_status(f"Downloaded to: {filepath}")
-                
-                # Add to history
-                history_entry = {
-                    "id": beatmap_id,
-                    "filename": filename,
-                    "path": filepath,
-                    "date": time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "url": f"https://osu.ppy.sh/beatmapsets/{beatmap_id}"
-                }
-                self.download_history.append(history_entry)
-                self.save_history()
-                self.update_history_list()
-                
-                # Open the file
-                self.open_file(filepath)
-                
-                # Hide progress bar
-                self.hide_progress()
-                return filepath
+            verifier = self.start_verifier(beatmap_id, action)
+            started = time.time()
+            writer = self.open_part_file(beatmap_id, action, journal)
+            complete = False
+            try:
+                for chunk in self.iter_body(response, mirror):
+                    written = time.perf_counter()
+                    writer.write(chunk)
+                    disk_time += time.perf_counter() - written
+                    verifier.feed(chunk)
+                    received += len(chunk)
+                    self.metrics.add_bytes(mirror.name, len(chunk))
+                    self.note_progress(beatmap_id, writer.position, journal.get('length'))
+                    delay = self.throttle_delay(mirror, len(chunk))
+                    if delay > 0:
+                        time.sleep(delay)
+                complete = not journal.get('length') or writer.position >= journal['length']
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout, http.client.IncompleteRead, ConnectionError, TimeoutError) as e:
+                response.close()  # The connection is in an unknown state, don't pool it
+                transfer_time += time.time() - started
+                drops += 1
+                if drops > self.resume_attempts:
+                    raise
+                self.update_status(f"Connection dropped ({str(e)}), resuming beatmap {beatmap_id}...")
+                continue
+            except IntegrityError:
+                response.close()  # Don't bother reading the rest
+                raise
+            finally:
+                writer.close(complete)
+            
+            transfer_time += time.time() - started
+            if not self.transfer_complete(journal):
+                # The server closed the stream early without an error, pick up where it stopped
+                drops += 1
+                if drops > self.resume_attempts:
+                    raise IOError(f"Incomplete download: {os.path.getsize(part_path)} "
+                                  f"of {journal.get('length')} bytes")
+                continue
+            
+            result = self.complete_download(beatmap_id, journal, verifier)
+            self.mirrors.record_success(mirror, latency, received, transfer_time)
+            self.record_transfer_metrics(beatmap_id, mirror, received, transfer_time, disk_time, drops, **timing)
+            return result
+
+    def iter_body(self, response, mirror=None):
+        """Yield a response body as memoryviews over one reusable buffer.
+
+        Uncompressed bodies are read straight from http.client with readinto, skipping
+        urllib3's per-chunk bytes objects; reads grow while the link keeps the buffer full,
+        up to read_limit() for the mirror. Each view is only valid until the next one is requested.
+        """
+        raw = response.raw
+        source = getattr(raw, '_fp', None)
+        if response.headers.get('Content-Encoding', 'identity') != 'identity' or not hasattr(source, 'readinto'):
+            # Compressed bodies have to go through urllib3's decoder
+            chunk_size = min(OsuBeatmapDownloader.READ_CHUNK_MIN, self.read_limit(mirror))
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    yield chunk
+            return
+        buffer = memoryview(bytearray(OsuBeatmapDownloader.READ_CHUNK_MAX))
+        size = OsuBeatmapDownloader.READ_CHUNK_MIN
+        while True:
+            # Checked on every read, speed limits can change mid-download
+            size = min(size, self.read_limit(mirror))
+            count = source.readinto(buffer[:size])
+            if not count:
+                break
+            yield buffer[:count]
+            if count == size and size < OsuBeatmapDownloader.READ_CHUNK_MAX:
+                size *= 2
+        raw.release_conn()  # urllib3 didn't see the body go by, hand the connection back ourselves
+
+    def open_part_file(self, beatmap_id, action, journal):
+        """PartFileWriter for a transfer, checkpointing its progress into the journal"""
+        journal_path = self.get_partial_paths(beatmap_id)[1]
+
+        def checkpoint(position):
+            journal['written'] = position
+            self.save_partial_journal(journal_path, journal)
+
+        return PartFileWriter(self.get_partial_paths(beatmap_id)[0], action == "append", journal.get('length'),
+                              self.preallocate, self.fsync_policy, checkpoint)
+
+    def record_transfer_metrics(self, beatmap_id, mirror, nbytes, transfer_time, disk_time, resumes, **timing):
+        timings = {phase: round(seconds, 4) for phase, seconds in timing.items()}
+        self.metrics.record_transfer(beatmap_id, mirror.name, bytes=nbytes, transfer=round(transfer_time, 4),
+                                     disk=round(disk_time, 4), resumes=resumes,
+                                     throughput=round(nbytes / transfer_time) if transfer_time else None,
+                                     **timings)
+
+    def prepare_resume(self, beatmap_id, download_url):
+        """Work out whether a request can pick up an existing .part file.
+
+        Returns (journal, offset, request_headers).
+        """
+        part_path, journal_path = self.get_partial_paths(beatmap_id)
+        journal = self.load_partial_journal(journal_path)
+        if journal and os.path.exists(part_path):
+            offset = os.path.getsize(part_path)
+            if journal.get('written', offset) < offset:
+                # We died while the file was preallocated: only the checkpointed bytes are real
+                offset = journal['written']
+                os.truncate(part_path, offset)
+            validator = journal.get('etag') or journal.get('last_modified')
+            # Only resume when the server can tell us the file hasn't changed in between
+            if offset and validator and journal.get('url') == download_url:
+                return journal, offset, {'Range': f"bytes={offset}-", 'If-Range': validator}
+        return journal, 0, {}
+
+    def resume_action(self, beatmap_id, download_url, status_code, response_headers,
+                      request_headers, offset, journal):
+        """Decide what to do with a mirror's reply to a (possibly ranged) request.
+
+        Returns (action, journal) where action is "append", "write", "complete",
+        "restart" or "fail".
+        """
+        if status_code == 206 and request_headers and self.range_start(response_headers) == offset:
+            self.update_status(f"Resuming beatmap {beatmap_id} at {offset // 1024} KB")
+            return "append", journal
+        if status_code == 200:
+            content_length = response_headers.get('Content-Length')
+            journal = {
+                "id": beatmap_id,
+                "url": download_url,
+                "filename": self.filename_from_headers(response_headers, beatmap_id),
+                "length": int(content_length) if content_length else None,
+                "etag": response_headers.get('ETag'),
+                "last_modified": response_headers.get('Last-Modified')
+            }
+            self.save_partial_journal(self.get_partial_paths(beatmap_id)[1], journal)
+            return "write", journal
+        if status_code == 416 and journal and offset and offset == journal.get('length'):
+            # We already have every byte, the previous run died before the rename
+            return "complete", journal
+        if request_headers and status_code in (206, 416):
+            # The partial file doesn't line up with the server's copy, start over
+            self.discard_partial(beatmap_id)
+            return "restart", None
+        return "fail", journal
+
+    def transfer_complete(self, journal):
+        expected = journal.get('length')
+        part_path = self.get_partial_paths(journal['id'])[0]
+        return not expected or os.path.getsize(part_path) >= expected
+
+    def mirror_error(self, status_code, response_headers):
+        return MirrorError(f"HTTP {status_code}", status_code,
+                           self.parse_retry_after(response_headers.get('Retry-After')))
+
+    def parse_retry_after(self, value):
+        """Seconds to wait from a Retry-After header, which may be a number or an HTTP date"""
+        if not value:
+            return None
+        if value.strip().isdigit():
+            return int(value)
+        import email.utils
+        try:
+            return max(0, int(email.utils.parsedate_to_datetime(value).timestamp() - time.time()))
+        except (TypeError, ValueError):
+            return None
+
+    def request_delay(self, mirror):
+        """Seconds to wait before the next request to a mirror, honoring backoff and request limits"""
+        backoff = mirror.open_until - time.time()
+        if backoff > self.max_backoff_wait:
+            raise MirrorBusyError(f"backing off for {int(backoff)}s")
+        return max(backoff, 0) + mirror.requests.reserve(1)
+
+    def read_limit(self, mirror=None):
+        """Largest read to make while a speed limit applies.
+
+        A throttled read is followed by a pause as long as the read is big, and the socket
+        isn't drained meanwhile, so reads are kept to about a tenth of a second's worth.
+        """
+        buckets = (self.bandwidth, mirror.bandwidth) if mirror else (self.bandwidth,)
+        rates = [bucket.rate for bucket in buckets if bucket.rate]
+        if not rates:
+            return OsuBeatmapDownloader.READ_CHUNK_MAX
+        return max(OsuBeatmapDownloader.READ_CHUNK_FLOOR,
+                   min(OsuBeatmapDownloader.READ_CHUNK_MAX, int(min(rates) / 10)))
+
+    def throttle_delay(self, mirror, nbytes):
+        """Seconds to pause after receiving nbytes so the global and per-mirror rates hold"""
+        return max(self.bandwidth.reserve(nbytes), mirror.bandwidth.reserve(nbytes))
+
+    def set_speed_limits(self, max_kbps=None, mirror_max_kbps=None, mirror_requests_per_minute=None):
+        """Change bandwidth and request limits while downloads are running"""
+        if max_kbps is not None:
+            self.max_kbps = max(0, max_kbps)
+            self.bandwidth.set_rate(self.max_kbps * 1024)
+        if mirror_max_kbps is not None:
+            self.mirror_max_kbps = max(0, mirror_max_kbps)
+        if mirror_requests_per_minute is not None:
+            self.mirror_requests_per_minute = max(0, mirror_requests_per_minute)
+        self.mirrors.set_limits(self.mirror_max_kbps, self.mirror_requests_per_minute, self.mirror_list)
+
+    def set_mirror_limits(self, name, max_kbps=None, requests_per_minute=None):
+        """Give one mirror its own limits, None puts it back on the per-mirror defaults"""
+        for index, entry in enumerate(self.mirror_list):
+            if entry.get("name") != name:
+                continue
+            # A fresh dict, entries may still be the shared DEFAULT_MIRRORS ones
+            entry = {k: v for k, v in entry.items() if k not in ("max_kbps", "requests_per_minute")}
+            if max_kbps is not None:
+                entry["max_kbps"] = max(0, max_kbps)
+            if requests_per_minute is not None:
+                entry["requests_per_minute"] = max(0, requests_per_minute)
+            self.mirror_list[index] = entry
+        self.set_speed_limits()
+
+    def start_verifier(self, beatmap_id, action):
+        """Integrity checker for one transfer, caught up on the bytes already in the .part file"""
+        verifier = OszVerifier()
+        if action == "append":
+            verifier.feed_file(self.get_partial_paths(beatmap_id)[0])
+        return verifier
+
+    def complete_download(self, beatmap_id, journal, verifier=None):
+        """Verify a fully received .part file and move it into place.
+
+        Returns (filepath, filename, metadata), raises IntegrityError for a broken archive.
+        """
+        part_path = self.get_partial_paths(beatmap_id)[0]
+        if verifier is None:
+            verifier = self.start_verifier(beatmap_id, "append")
+        metadata = verifier.finish(part_path, journal.get('length'))
+        filepath, filename = self.finish_partial(beatmap_id, journal)
+        return filepath, filename, metadata
+
+    def finish_partial(self, beatmap_id, journal):
+        """Atomically move a completed .part file to its final name"""
+        part_path, journal_path = self.get_partial_paths(beatmap_id)
+        filename = journal.get('filename') or f"beatmap_{beatmap_id}.osz"
+        filepath = os.path.join(self.download_folder, filename)
+        
+        # Ensure we have unique filenames
+        counter = 1
+        base_name, extension = os.path.splitext(filename)
+        while os.path.exists(filepath):
+            filename = f"{base_name}_{counter}{extension}"
+            filepath = os.path.join(self.download_folder, filename)
+            counter += 1
+        
+        os.replace(part_path, filepath)
+        try:
+            os.remove(journal_path)
+        except OSError:
+            pass
+        return filepath, filename
+
+    def filename_from_headers(self, headers, beatmap_id):
+        # Extract filename from header or use beatmap ID
+        content_disposition = headers.get('Content-Disposition')
+        if content_disposition and 'filename=' in content_disposition:
+            names = re.findall('filename="(.+)"', content_disposition)
+            if names:
+                return os.path.basename(names[0])
+        return f"beatmap_{beatmap_id}.osz"
+
+    def range_start(self, headers):
+        """First byte offset of a 206 response, from its Content-Range header"""
+        match = re.match(r'bytes (\d+)-', headers.get('Content-Range', ''))
+        return int(match.group(1)) if match else None
+
+    def get_partial_paths(self, beatmap_id):
+        part_path = os.path.join(self.download_folder, f"{beatmap_id}.osz.part")
+        return part_path, part_path + ".json"
+
+    def load_partial_journal(self, journal_path):
+        try:
+            if os.path.exists(journal_path):
+                with open(journal_path, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"Error loading partial download journal: {str(e)}")
+        return None
+
+    def save_partial_journal(self, journal_path, journal):
+        # Write the sidecar atomically so a crash never leaves half a journal behind
+        temp_path = journal_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(journal, f)
+        os.replace(temp_path, journal_path)
+
+    def discard_partial(self, beatmap_id):
+        for path in self.get_partial_paths(beatmap_id):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def resume_partial_downloads(self):
+        """Queue every download that was interrupted in a previous run"""
+        resumed = []
+        try:
+            for name in os.listdir(self.download_folder):
+                if name.endswith(".osz.part.json"):
+                    beatmap_id = name[:-len(".osz.part.json")]
+                    if beatmap_id.isdigit() and self.download_queue.submit(beatmap_id, priority=PRIORITY_LOW):
+                        resumed.append(beatmap_id)
+        except OSError as e:
+            print(f"Error scanning for partial downloads: {str(e)}")
+        if resumed:
+            self.update_status(f"Resuming {len(resumed)} interrupted download(s)")
+        return resumed
+    
+    def enqueue_beatmap(self, beatmap_id, force=False, batch=None, priority=PRIORITY_HIGH):
+        """Hand a beatmapset to the download queue"""
+        job = self.download_queue.submit(beatmap_id, force, batch, priority)
+        if job is None:
+            if batch:
+                batch.skip()
+            else:
+                self.update_status(f"Beatmap {beatmap_id} is already queued or downloading")
+        return job
+
+    def enqueue_text(self, text, label="Batch", force=False, priority=None, bare_ids=True):
+        """Queue every beatmap referenced in a paste as one batch, returns the batch or None"""
+        set_ids, beatmap_ids = extract_beatmap_links(text, bare_ids)
+        total = len(set_ids) + len(beatmap_ids)
+        if not total:
+            return None
+        if priority is None:
+            # A single copied map jumps ahead of any batch that is already running
+            priority = PRIORITY_HIGH if total == 1 else PRIORITY_NORMAL
+        if total == 1 and set_ids:
+            self.update_status(f"Found beatmap ID: {set_ids[0]}. Queued for download...")
+        else:
+            self.update_status(f"{label}: queued {total} beatmaps")
+        batch = DownloadBatch(total, label)
+        for beatmap_id in set_ids:
+            self.enqueue_beatmap(beatmap_id, force, batch, priority)
+        if beatmap_ids:
+            # Difficulty links need a lookup first, don't hold up the caller for it
+            resolver = threading.Thread(target=self.enqueue_resolved,
+                                        args=(beatmap_ids, batch, force, set(set_ids), priority))
+            resolver.daemon = True
+            resolver.start()
+        return batch
+
+    def enqueue_resolved(self, beatmap_ids, batch, force=False, seen=(), priority=PRIORITY_NORMAL):
+        seen = set(seen)
+        for beatmap_id in beatmap_ids:
+            set_id = self.resolve_beatmap(beatmap_id)
+            if not set_id or set_id in seen:
+                # Unknown beatmap, or another difficulty of a set already in this batch
+                batch.skip()
+                continue
+            seen.add(set_id)
+            self.enqueue_beatmap(set_id, force, batch, priority)
+        self.update_status(batch.summary())
+
+    def import_files(self, paths, collections=None, force=False, dry_run=False):
+        """Queue every beatmapset referenced by osu! collection.db / osu!.db files or text exports.
+
+        Collection MD5s are resolved through the given osu!.db files and the local one.
+        Returns a summary dict, whose "sets" lists the beatmapset IDs found.
+        """
+        wanted = set()  # MD5s from the collections
+        set_ids = set()
+        beatmap_ids = set()  # Difficulty IDs from text exports
+        databases = []
+        for path in paths:
+            name = os.path.basename(path).lower()
+            if name == "osu!.db":
+                databases.append(path)
+            elif name.endswith(".db"):
+                for collection, hashes in read_collection_db(path):
+                    if not collections or collection in collections:
+                        wanted.update(md5 for md5 in hashes if md5)
             else:
-                self.update_status(f"Download failed: HTTP {response.status_code}")
-                self.hide_progress()
+                with open(path, 'r', encoding="utf-8", errors="replace") as f:
+                    found_sets, found_beatmaps = extract_beatmap_links(f.read())
+                set_ids.update(found_sets)
+                beatmap_ids.update(found_beatmaps)
+
+        local_db = os.path.join(os.path.dirname(self.songs_folder), "osu!.db") if self.songs_folder else ""
+        lookups = databases + ([local_db] if os.path.isfile(local_db) and local_db not in databases else [])
+        resolved = set()
+        for path in lookups:
+            everything = path in databases and not wanted
+            for md5, beatmap_id, set_id in read_osu_db(path):
+                if set_id <= 0:
+                    continue  # Unsubmitted map, no mirror has it
+                if md5 in wanted:
+                    resolved.add(md5)
+                    set_ids.add(str(set_id))
+                elif everything:
+                    set_ids.add(str(set_id))
+                if str(beatmap_id) in beatmap_ids:
+                    self.beatmap_set_cache[str(beatmap_id)] = str(set_id)  # Saves an API lookup
+
+        installed = set() if force else set_ids & self.library.ids()
+        new_sets = sorted(set_ids - installed, key=int)
+        summary = {"sets": new_sets, "installed": len(installed), "beatmaps": len(beatmap_ids),
+                   "unresolved": len(wanted - resolved)}
+        if dry_run or not new_sets and not beatmap_ids:
+            return summary
+
+        batch = DownloadBatch(len(new_sets) + len(beatmap_ids), "Import")
+        for set_id in new_sets:
+            # Low priority so a big import doesn't hold up maps copied in the meantime
+            self.enqueue_beatmap(set_id, force, batch, PRIORITY_LOW)
+        self.update_status(f"Import: queued {len(new_sets)} beatmapsets, {len(installed)} already installed, "
+                           f"{summary['unresolved']} maps not found in any osu!.db")
+        if beatmap_ids:
+            self.enqueue_resolved(sorted(beatmap_ids), batch, force, set_ids, PRIORITY_LOW)
+        return summary
+
+    def import_dialog(self):
+        from tkinter import filedialog
+        paths = filedialog.askopenfilenames(title="Import beatmaps", filetypes=[
+            ("osu! databases", "*.db"), ("Beatmap lists", "*.txt *.html *.json *.csv"), ("All files", "*.*")])
+        if not paths:
+            return
+        self.update_status(f"Reading {len(paths)} file(s) to import...")
+        importer = threading.Thread(target=self.run_import, args=(list(paths),))
+        importer.daemon = True
+        importer.start()
+
+    def run_import(self, paths):
+        try:
+            summary = self.import_files(paths)
+            if not summary["sets"] and not summary["beatmaps"]:
+                self.update_status(f"Import: nothing new ({summary['installed']} already installed, "
+                                   f"{summary['unresolved']} unresolved)")
+        except Exception as e:
+            self.update_status(f"Import error: {str(e)}")
+
+    def resolve_beatmap(self, beatmap_id):
+        """Beatmapset ID for a beatmap (difficulty) ID, or None if the lookup fails"""
+        if beatmap_id in self.beatmap_set_cache:
+            return self.beatmap_set_cache[beatmap_id]
+        try:
+            response = self.session.get(self.beatmap_lookup_url.format(beatmap_id),
+                                        timeout=(self.connect_timeout, self.read_timeout))
+            if response.status_code != 200:
+                self.update_status(f"Couldn't look up beatmap {beatmap_id}: HTTP {response.status_code}")
                 return None
-                
+            set_id = str(response.json()["beatmapset_id"])
         except Exception as e:
-            self.update_status(f"Download error: {str(e)}")
-            self.hide_progress()
+            self.update_status(f"Couldn't look up beatmap {beatmap_id}: {str(e)}")
             return None
-    
+        self.beatmap_set_cache[beatmap_id] = set_id
+        return set_id
+
+    def on_job_changed(self, job):
+        """Called by the download queue whenever a job changes state"""
+        self.update_queue_view(job)
+        for listener in self.job_listeners:
+            listener(job)
+        if job.is_finished:
+            counts = self.download_queue.counts()
+            self.metrics.record_job(job, counts[DownloadJob.QUEUED] + counts[DownloadJob.RETRYING])
+        elif job.state == DownloadJob.RETRYING:
+            self.metrics.record_retry()
+        if job.state == DownloadJob.DONE:
+            if self.history_store.remove_failed(job.beatmap_id):
+                self.refresh_failed_view()
+        elif job.state == DownloadJob.FAILED:
+            # Out of retries: park it in the dead-letter list so it survives a restart
+            self.history_store.add_failed(job.beatmap_id, job.error, job.attempts)
+            self.refresh_failed_view()
+            self.update_status(f"Download of {job.beatmap_id} failed: {job.error}")
+        elif job.state == DownloadJob.RETRYING:
+            self.update_status(f"Download of {job.beatmap_id} failed, retrying in "
+                               f"{max(0, job.retry_at - time.time()):.0f}s: {job.error}")
+        if job.batch and job.batch.total > 1 and job.is_finished:
+            self.update_status(job.batch.summary())
+            return
+        if job.state == DownloadJob.RETRYING:
+            return
+        counts = self.download_queue.counts()
+        if counts[DownloadJob.QUEUED] or counts[DownloadJob.RUNNING]:
+            self.update_status(f"Downloading: {counts[DownloadJob.RUNNING]} running, "
+                               f"{counts[DownloadJob.QUEUED]} queued")
+
+    def update_queue_view(self, job):
+        if hasattr(self, 'queue_tree'):
+            # Coalesced per job: only its latest state is drawn
+            self.run_on_ui(self.draw_queue_row, job, key=("job", job.seq))
+
+    def draw_queue_row(self, job):
+        import tkinter as tk
+        iid = str(job.seq)
+        if job.is_finished:
+            self.queue_rows.pop(job.beatmap_id, None)
+            progress = "100%" if job.state == DownloadJob.DONE else ""
+        else:
+            self.queue_rows[job.beatmap_id] = iid
+            progress = self.queue_tree.set(iid, "progress") if self.queue_tree.exists(iid) else ""
+        detail = job.result or job.error or ""
+        values = (job.beatmap_id, job.state, progress, detail)
+        if self.queue_tree.exists(iid):
+            self.queue_tree.item(iid, values=values)
+        else:
+            self.queue_tree.insert("", tk.END, iid=iid, values=values)
+
+    def retry_failed(self, beatmap_ids=None, force=False):
+        """Queue downloads from the dead-letter list again, all of them unless IDs are given.
+
+        Returns the batch, or None if there was nothing to retry.
+        """
+        entries = self.history_store.failed()
+        if beatmap_ids is not None:
+            wanted = {str(beatmap_id) for beatmap_id in beatmap_ids}
+            entries = [entry for entry in entries if entry['id'] in wanted]
+        if not entries:
+            return None
+        batch = DownloadBatch(len(entries), "Retry")
+        for entry in entries:
+            # Low priority so a bulk retry doesn't hold up what the user is copying right now
+            self.enqueue_beatmap(entry['id'], force, batch, PRIORITY_LOW)
+        self.update_status(f"Retrying {len(entries)} failed downloads")
+        return batch
+
+    def refresh_failed_view(self):
+        if hasattr(self, 'failed_tree'):
+            self.run_on_ui(self.draw_failed_view, key="failed")
+
+    def draw_failed_view(self):
+        import tkinter as tk
+        self.failed_tree.delete(*self.failed_tree.get_children())
+        for entry in self.history_store.failed():
+            self.failed_tree.insert("", tk.END, iid=entry['id'],
+                                    values=(entry['id'], entry['attempts'], entry['date'], entry['error']))
+
+    def retry_selected_failed(self):
+        selected = self.failed_tree.selection()
+        if selected:
+            self.retry_failed(selected)
+
+    def remove_selected_failed(self):
+        for beatmap_id in self.failed_tree.selection():
+            self.history_store.remove_failed(beatmap_id)
+        self.refresh_failed_view()
+
+    def clear_finished_jobs(self):
+        self.ui_events.drain()  # So a queued redraw can't bring a cleared row back
+        for job in self.download_queue.clear_finished():
+            if self.queue_tree.exists(str(job.seq)):
+                self.queue_tree.delete(str(job.seq))
+
+    def change_max_workers(self):
+        import tkinter as tk
+        try:
+            self.max_workers = max(1, int(self.workers_var.get()))
+        except (tk.TclError, ValueError):
+            return
+        self.download_queue.resize(self.max_workers)
+        self.save_settings()
+
+    def refresh_mirror_view(self):
+        """Redraw mirror health every couple of seconds"""
+        if not hasattr(self, 'mirror_tree'):
+            return
+        import tkinter as tk
+        for mirror in self.mirrors.snapshot():
+            latency = f"{mirror['latency'] * 1000:.0f} ms" if mirror['latency'] is not None else "-"
+            speed = f"{mirror['throughput'] / 1048576:.2f} MB/s" if mirror['throughput'] else "-"
+            limits = [f"{mirror['max_kbps']:.0f} KB/s"] if mirror['max_kbps'] else []
+            if mirror['requests_per_minute']:
+                limits.append(f"{mirror['requests_per_minute']:g}/min")
+            values = (mirror['name'], latency, speed, ", ".join(limits) or "-",
+                      mirror['state'], mirror['last_error'] or "")
+            # Update rows in place, rebuilding them would drop the selection
+            if self.mirror_tree.exists(mirror['name']):
+                self.mirror_tree.item(mirror['name'], values=values)
+            else:
+                self.mirror_tree.insert("", tk.END, iid=mirror['name'], values=values)
+        self.mirror_tree.after(2000, self.refresh_mirror_view)
+
+    def change_mirror_limits(self, selected=False):
+        import tkinter as tk
+        try:
+            max_kbps = max(0, int(self.mirror_speed_var.get()))
+            per_minute = max(0, int(self.mirror_rpm_var.get()))
+        except (tk.TclError, ValueError):
+            return
+        if selected:
+            for name in self.mirror_tree.selection():
+                self.set_mirror_limits(name, max_kbps, per_minute)
+        else:
+            self.set_speed_limits(mirror_max_kbps=max_kbps, mirror_requests_per_minute=per_minute)
+        self.save_settings()  # The Limit column catches up on the next refresh
+
+    def reset_mirror_limits(self):
+        for name in self.mirror_tree.selection():
+            self.set_mirror_limits(name)
+        self.save_settings()  # The Limit column catches up on the next refresh
+
+    def refresh_stats_view(self):
+        """Redraw the stats panel every second"""
+        if not hasattr(self, 'stats_tree'):
+            return
+        import tkinter as tk
+        metrics = self.metrics
+        counts = self.download_queue.counts()
+        self.stats_rate_var.set(f"{metrics.rate() / 1048576:.2f} MB/s")
+        self.stats_totals_var.set(f"{metrics.downloads.get('done', 0)} done, {metrics.downloads.get('failed', 0)} failed, "
+                                  f"{metrics.retries} retries, {counts[DownloadJob.RUNNING]} running, "
+                                  f"{counts[DownloadJob.QUEUED] + counts[DownloadJob.RETRYING]} waiting")
+        self.stats_tree.delete(*self.stats_tree.get_children())
+        for phase in DownloadMetrics.PHASES:
+            values = [metrics.percentile(phase, fraction) for fraction in (0.5, 0.95)]
+            self.stats_tree.insert("", tk.END, values=[phase] + [f"{value * 1000:.0f} ms" if value is not None else "-"
+                                                                 for value in values])
+        self.stats_tree.after(1000, self.refresh_stats_view)
+
+    def change_speed_limit(self):
+        import tkinter as tk
+        try:
+            max_kbps = max(0, int(self.speed_var.get()))
+        except (tk.TclError, ValueError):
+            return
+        self.set_speed_limits(max_kbps=max_kbps)
+        self.save_settings()
+
     def open_file(self, filepath):
         try:
             if os.path.exists(filepath):
@@ -366,45 +3555,77 @@ class OsuBeatmapDownloader:
 
     # Methods for additional features
     def browse_folder(self):
+        from tkinter import filedialog
         folder = filedialog.askdirectory(initialdir=self.download_folder)
         if folder:
-            self.download_folder = folder
+            self.set_download_folder(folder)
             self.folder_var.set(folder)
             self.save_settings()
+
+    def set_download_folder(self, folder):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.download_folder = folder
+        self.library.set_roots(self.library_roots())
+
+    def browse_songs_folder(self):
+        from tkinter import filedialog
+        folder = filedialog.askdirectory(initialdir=self.songs_folder or self.download_folder)
+        if folder:
+            self.songs_folder = folder
+            self.songs_var.set(folder)
+            self.library.set_roots(self.library_roots())
+            self.save_settings()
+
+    def change_skip_existing(self):
+        self.skip_existing = self.skip_existing_var.get()
+        self.save_settings()
     
     def manual_download(self):
+        from tkinter import messagebox
         url = self.url_var.get().strip()
         if not url:
             messagebox.showwarning("Input Error", "Please enter a beatmap URL")
             return
             
-        beatmap_match = re.search(self.beatmap_id_pattern, url)
-        if beatmap_match:
-            beatmap_id = beatmap_match.group(1)
-            self.update_status(f"Manual download of beatmap ID: {beatmap_id}")
-            self.download_beatmap(beatmap_id)
-        else:
+        if not self.enqueue_text(url, label="Manual download"):
             messagebox.showwarning("Invalid URL", "The URL you entered is not a valid osu! beatmap URL")
     
     def load_history(self):
-        history_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "download_history.json")
+        app_folder = os.path.dirname(os.path.abspath(__file__))
         try:
-            if os.path.exists(history_file):
-                with open(history_file, 'r') as f:
-                    self.download_history = json.load(f)
-            else:
-                self.download_history = []
+            self.history_store = HistoryStore(os.path.join(app_folder, "download_history.db"))
         except Exception as e:
             print(f"Error loading history: {str(e)}")
-            self.download_history = []
-    
-    def save_history(self):
-        history_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "download_history.json")
+            self.history_store = HistoryStore(":memory:")  # Keep working, just without persistence
+            return
+        json_path = os.path.join(app_folder, "download_history.json")
+        try:
+            migrated = self.history_store.migrate_json(json_path)
+            if migrated:
+                print(f"Migrated {migrated} history entries to download_history.db")
+        except Exception as e:
+            # A broken legacy file shouldn't cost us the database, nor be retried at every launch
+            print(f"Error migrating download_history.json: {str(e)}")
+            try:
+                os.replace(json_path, json_path + ".corrupt")
+            except OSError:
+                pass
+        # The entries themselves are only needed by the history list, see start_history_load
+
+    def start_history_load(self):
+        loader = threading.Thread(target=self.load_history_entries, name="history-load")
+        loader.daemon = True
+        loader.start()
+
+    def load_history_entries(self):
         try:
-            with open(history_file, 'w') as f:
-                json.dump(self.download_history, f, indent=2)
+            with self.history_lock:
+                # Downloads finishing meanwhile wait for the lock, so none is lost or listed twice
+                self.download_history = self.history_store.all()
         except Exception as e:
-            print(f"Error saving history: {str(e)}")
+            print(f"Error loading history: {str(e)}")
+        self.update_history_list()
     
     def load_settings(self):
         settings_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "settings.json")
@@ -414,6 +3635,59 @@ class OsuBeatmapDownloader:
                     settings = json.load(f)
                     if 'theme' in settings:
                         self.theme = settings['theme']
+                    if 'max_workers' in settings:
+                        self.max_workers = max(1, int(settings['max_workers']))
+                    if 'pool_size' in settings:
+                        self.pool_size = max(1, int(settings['pool_size']))
+                    if 'connect_timeout' in settings:
+                        self.connect_timeout = float(settings['connect_timeout'])
+                    if 'read_timeout' in settings:
+                        self.read_timeout = float(settings['read_timeout'])
+                    if 'user_agent' in settings:
+                        self.user_agent = settings['user_agent']
+                    if settings.get('mirrors'):
+                        self.mirror_list = [m if isinstance(m, dict) else {"name": m, "url": m}
+                                            for m in settings['mirrors']]
+                    if settings.get('engine') in ("threaded", "async"):
+                        self.engine = settings['engine']
+                    if 'async_concurrency' in settings:
+                        self.async_concurrency = max(1, int(settings['async_concurrency']))
+                    if 'per_host_limit' in settings:
+                        self.per_host_limit = max(1, int(settings['per_host_limit']))
+                    if settings.get('songs_folder') and os.path.isdir(settings['songs_folder']):
+                        self.songs_folder = settings['songs_folder']
+                    if 'skip_existing' in settings:
+                        self.skip_existing = bool(settings['skip_existing'])
+                    if 'clipboard_source' in settings:
+                        self.clipboard_kind = settings['clipboard_source']
+                    if 'max_kbps' in settings:
+                        self.max_kbps = max(0, int(settings['max_kbps']))
+                    if 'mirror_max_kbps' in settings:
+                        self.mirror_max_kbps = max(0, int(settings['mirror_max_kbps']))
+                    if 'mirror_requests_per_minute' in settings:
+                        self.mirror_requests_per_minute = max(0, float(settings['mirror_requests_per_minute']))
+                    if 'beatmap_lookup_url' in settings:
+                        self.beatmap_lookup_url = settings['beatmap_lookup_url']
+                    if 'resume_attempts' in settings:
+                        self.resume_attempts = max(0, int(settings['resume_attempts']))
+                    if isinstance(settings.get('retry_policy'), dict):
+                        self.retry_rules = settings['retry_policy']
+                    if 'retry_jitter' in settings:
+                        self.retry_jitter = float(settings['retry_jitter'])
+                    if 'preallocate' in settings:
+                        self.preallocate = bool(settings['preallocate'])
+                    if settings.get('fsync_policy') in PartFileWriter.FSYNC_POLICIES:
+                        self.fsync_policy = settings['fsync_policy']
+                    if 'metrics_port' in settings:
+                        self.metrics_port = max(0, int(settings['metrics_port']))
+                    if 'metrics_log' in settings:
+                        self.metrics_log = settings['metrics_log']
+                    if 'cache_folder' in settings:
+                        self.cache_folder = settings['cache_folder']
+                    if 'cache_max_mb' in settings:
+                        self.cache_max_mb = max(1, int(settings['cache_max_mb']))
+                    if 'proxy_port' in settings:
+                        self.proxy_port = max(0, int(settings['proxy_port']))
                     if 'download_folder' in settings:
                         folder = settings['download_folder']
                         if os.path.exists(folder):
@@ -426,20 +3700,115 @@ class OsuBeatmapDownloader:
         try:
             settings = {
                 "theme": self.theme,
-                "download_folder": self.download_folder
+                "download_folder": self.download_folder,
+                "max_workers": self.max_workers,
+                "pool_size": self.pool_size,
+                "connect_timeout": self.connect_timeout,
+                "read_timeout": self.read_timeout,
+                "user_agent": self.user_agent,
+                "resume_attempts": self.resume_attempts,
+                "retry_policy": self.retry_policy.rules,
+                "retry_jitter": self.retry_policy.jitter,
+                "preallocate": self.preallocate,
+                "fsync_policy": self.fsync_policy,
+                "metrics_port": self.metrics_port,
+                "metrics_log": self.metrics_log,
+                "cache_folder": self.cache_folder,
+                "cache_max_mb": self.cache_max_mb,
+                "proxy_port": self.proxy_port,
+                "mirrors": self.mirror_list,
+                "engine": self.engine,
+                "async_concurrency": self.async_concurrency,
+                "per_host_limit": self.per_host_limit,
+                "songs_folder": self.songs_folder,
+                "skip_existing": self.skip_existing,
+                "clipboard_source": self.clipboard_kind,
+                "beatmap_lookup_url": self.beatmap_lookup_url,
+                "max_kbps": self.max_kbps,
+                "mirror_max_kbps": self.mirror_max_kbps,
+                "mirror_requests_per_minute": self.mirror_requests_per_minute
             }
             with open(settings_file, 'w') as f:
                 json.dump(settings, f, indent=2)
         except Exception as e:
             print(f"Error saving settings: {str(e)}")
     
-    def update_history_list(self):
+    def update_history_list(self, new_entry=None):
+        """Show a newly added entry, or rebuild the whole list when none is given"""
         if hasattr(self, 'history_listbox'):
-            self.history_listbox.delete(0, tk.END)
-            for item in self.download_history:
-                self.history_listbox.insert(tk.END, f"{item['date']} - {item['filename']} (ID: {item['id']})")
+            # Both redraws are idempotent, so a burst of finished downloads costs one per tick
+            if new_entry is not None:
+                self.run_on_ui(self.draw_new_history, key="history")
+            else:
+                self.run_on_ui(self.draw_history_list, key="history-rebuild")
+
+    def draw_new_history(self):
+        if self.history_query:
+            self.draw_history_list()  # New entries may or may not match the search
+            return
+        with self.history_lock:
+            added = self.download_history[len(self.visible_history):]
+        self.visible_history.extend(added)
+        if self.history_rows + len(added) == len(self.visible_history):
+            self.fill_history_rows()  # Already showing the end of the list
+
+    def schedule_history_search(self):
+        """Search once typing pauses rather than on every keystroke"""
+        if self.history_search_after:
+            self.history_listbox.after_cancel(self.history_search_after)
+        self.history_search_after = self.history_listbox.after(self.HISTORY_SEARCH_DELAY, self.run_history_search)
+
+    def run_history_search(self):
+        self.history_search_after = None
+        self.draw_history_list()
+
+    def draw_history_list(self):
+        import tkinter as tk
+        self.history_query = self.history_search_var.get().strip()
+        if self.history_query:
+            self.visible_history = []  # Filled by fill_history_rows, one page of matches at a time
+            self.history_more = True
+        else:
+            with self.history_lock:
+                self.visible_history = list(self.download_history)
+            self.history_more = False
+        self.history_listbox.delete(0, tk.END)
+        self.history_rows = 0
+        self.fill_history_rows()
+
+    def fill_history_rows(self):
+        """Add the next page of visible_history to the list box.
+
+        Rows are only created as the list is scrolled towards its end, so a history of
+        any size costs one page to show. Indexes still line up with visible_history.
+        """
+        import tkinter as tk
+        if self.history_more and len(self.visible_history) < self.history_rows + self.HISTORY_PAGE:
+            # Decoding every match of a one-letter search took a second on a big history
+            page = self.history_store.search(self.history_query, self.HISTORY_PAGE, len(self.visible_history))
+            self.history_more = len(page) == self.HISTORY_PAGE
+            self.visible_history.extend(page)
+        page = self.visible_history[self.history_rows:self.history_rows + self.HISTORY_PAGE]
+        if page:
+            self.history_listbox.insert(tk.END, *[self.format_history_entry(item) for item in page])
+            self.history_rows += len(page)
+
+    def on_history_scroll(self, first, last):
+        self.history_scrollbar.set(first, last)
+        if float(last) > 0.9 and (self.history_rows < len(self.visible_history) or self.history_more):
+            self.fill_history_rows()
+
+    def format_history_entry(self, item):
+        if item.get('title'):
+            # Set metadata read from the archive when it was downloaded
+            name = f"{item.get('artist', '')} - {item['title']}" if item.get('artist') else item['title']
+            if item.get('creator'):
+                name += f" ({item['creator']})"
+            return f"{item['date']} - {name} [ID: {item['id']}]"
+        return f"{item['date']} - {item['filename']} (ID: {item['id']})"
     
     def open_selected_beatmap(self):
+        from tkinter import messagebox
         if not hasattr(self, 'history_listbox'):
             return
             
@@ -449,49 +3818,268 @@ class OsuBeatmapDownloader:
             return
             
         index = selected[0]
-        if 0 <= index < len(self.download_history):
-            filepath = self.download_history[index]['path']
+        if 0 <= index < len(self.visible_history):
+            filepath = self.visible_history[index]['path']
             if os.path.exists(filepath):
                 os.startfile(filepath)
                 self.update_status(f"Opened: {os.path.basename(filepath)}")
             else:
                 if messagebox.askyesno("File Not Found", 
                                      f"The file no longer exists at {filepath}. Would you like to re-download it?"):
-                    beatmap_id = self.download_history[index]['id']
-                    self.download_beatmap(beatmap_id)
+                    beatmap_id = self.visible_history[index]['id']
+                    self.enqueue_beatmap(beatmap_id, force=True)
     
     def clear_history(self):
+        from tkinter import messagebox
         if messagebox.askyesno("Clear History", "Are you sure you want to clear all download history?"):
-            self.download_history = []
-            self.save_history()
+            with self.history_lock:
+                self.history_store.clear()
+                self.download_history = []
             self.update_history_list()
     
     def view_in_browser(self):
+        import webbrowser
+        from tkinter import messagebox
         selected = self.history_listbox.curselection()
         if not selected:
             messagebox.showinfo("Selection", "Please select a beatmap from the history list")
             return
             
         index = selected[0]
-        if 0 <= index < len(self.download_history):
-            url = self.download_history[index]['url']
+        if 0 <= index < len(self.visible_history):
+            url = self.visible_history[index]['url']
             webbrowser.open(url)
 
-def main():
+def iter_input_lines(path, follow=False):
+    """Lines from a file or stdin ("-"), optionally waiting for more like tail -f"""
+    if path == "-":
+        for line in sys.stdin:
+            yield line
+        return
+    with open(path, 'r') as f:
+        while True:
+            line = f.readline()
+            if line:
+                yield line
+            elif follow:
+                time.sleep(0.5)
+            else:
+                return
+
+
+def enqueue_cli_text(app, text, force=False):
+    """Queue everything referenced in text, resolving difficulty links before returning"""
+    set_ids, beatmap_ids = extract_beatmap_links(text)
+    batch = DownloadBatch(len(set_ids) + len(beatmap_ids))
+    for beatmap_id in set_ids:
+        app.enqueue_beatmap(beatmap_id, force, batch, PRIORITY_NORMAL)
+    if beatmap_ids:
+        app.enqueue_resolved(beatmap_ids, batch, force, set_ids)
+
+
+def run_cli(argv):
+    """Headless entry point: never imports tkinter or pyperclip"""
+    parser = argparse.ArgumentParser(prog="osu_beatmap_downloader",
+                                     description="Download osu! beatmapsets without a GUI")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fetch = commands.add_parser("fetch", help="download the given beatmapsets, then exit")
+    fetch.add_argument("items", nargs="*", help="beatmapset IDs or URLs")
+    fetch.add_argument("-i", "--input", help="read IDs/URLs from a file, '-' for stdin")
+    daemon = commands.add_parser("daemon", help="keep downloading IDs/URLs as they are written to stdin or a file")
+    daemon.add_argument("-i", "--input", default="-",
+                        help="file to follow for new IDs/URLs (default: stdin, exits at end of input)")
+    bulk = commands.add_parser("import", help="download every set in osu! collection.db/osu!.db files or link lists")
+    bulk.add_argument("files", nargs="+", help="collection.db, osu!.db (resolves collection entries) or text files")
+    bulk.add_argument("-c", "--collection", action="append", help="only this collection (repeatable)")
+    bulk.add_argument("-n", "--dry-run", action="store_true", help="print what would be downloaded and exit")
+    retry = commands.add_parser("retry-failed", help="retry downloads that previously ran out of retries")
+    retry.add_argument("items", nargs="*", help="only these beatmapset IDs (default: all of them)")
+    retry.add_argument("-l", "--list", action="store_true", help="list the failed downloads instead")
+    startup = commands.add_parser("startup-check",
+                                  help="open the window, print how long it took to appear, then close it")
+    startup.add_argument("--budget", type=float, default=1.0,
+                         help="fail when the window takes longer than this many seconds (default: 1)")
+    serve = commands.add_parser("serve", help="act as a caching mirror for other instances on the LAN (/d/<id>)")
+    serve.add_argument("-p", "--port", type=int, help="port to listen on (default: settings.json, 8765)")
+    serve.add_argument("--bind", default="0.0.0.0", help="address to listen on (default: all interfaces)")
+    serve.add_argument("--cache", help="cache folder (default: settings.json, beatmap_cache next to this script)")
+    serve.add_argument("--max-size", type=int, help="cache size limit in MB (default: settings.json, 10240)")
+    serve.set_defaults(jobs=None, output=None, force=False)
+    for command in (fetch, daemon, bulk, retry):
+        command.add_argument("-j", "--jobs", type=int, help="parallel downloads (default: settings.json)")
+        command.add_argument("-o", "--output", help="download folder (default: settings.json)")
+        command.add_argument("--force", action="store_true", help="download even if the set is already present")
+    for command in (fetch, daemon, bulk, retry, serve):
+        command.add_argument("-v", "--verbose", action="store_true", help="print status messages to stderr")
+        command.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on 127.0.0.1 at this port")
+        command.add_argument("--metrics-log", help="append one JSON line of timings per finished download here")
+    args = parser.parse_args(argv)
+    if args.command == "startup-check":
+        return check_startup(args.budget)
+
+    app = OsuBeatmapDownloader()
+    app.open_after_download = False
+    if args.command == "retry-failed" and args.list:
+        for entry in app.history_store.failed():
+            print(json.dumps(entry))
+        app.shutdown()
+        return 0
+    if args.verbose:
+        app.status_stream = sys.stderr
+    if args.output:
+        app.set_download_folder(os.path.abspath(args.output))
+    if args.jobs:
+        app.download_queue.resize(args.jobs)
+    if args.metrics_log:
+        app.metrics.log_path = args.metrics_log
+    if args.metrics_port is not None:
+        app.start_metrics_server(args.metrics_port)
+
+    # One JSON object per finished job on stdout
+    output_lock = threading.Lock()
+    failed = []
+
+    def report(job):
+        if not job.is_finished:
+            return
+        if job.state == DownloadJob.FAILED:
+            failed.append(job.beatmap_id)
+        result = {
+            "id": job.beatmap_id,
+            "status": job.state,
+            "path": job.result,
+            "error": job.error,
+            "seconds": round(job.finished - (job.started or job.created), 3)
+        }
+        with output_lock:
+            print(json.dumps(result), flush=True)
+    app.job_listeners.append(report)
+
+    try:
+        if args.command == "fetch":
+            items = list(args.items)
+            if args.input:
+                items.extend(iter_input_lines(args.input))
+            enqueue_cli_text(app, "\n".join(items), args.force)
+        elif args.command == "import":
+            try:
+                summary = app.import_files(args.files, args.collection, args.force, args.dry_run)
+            except (OSError, ValueError) as e:
+                print(f"Import error: {str(e)}", file=sys.stderr)
+                return 1
+            if args.dry_run:
+                for set_id in summary["sets"]:
+                    print(json.dumps({"id": set_id, "status": "new"}))
+            print(f"{len(summary['sets'])} new sets, {summary['installed']} already installed, "
+                  f"{summary['beatmaps']} beatmap links, {summary['unresolved']} unresolved", file=sys.stderr)
+            if args.dry_run:
+                return 0
+        elif args.command == "retry-failed":
+            app.retry_failed(args.items or None, args.force)
+        elif args.command == "serve":
+            return run_proxy(app, args)
+        else:
+            app.resume_partial_downloads()
+            for line in iter_input_lines(args.input, follow=args.input != "-"):
+                enqueue_cli_text(app, line, args.force)
+        app.download_queue.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        app.shutdown()
+    return 1 if failed else 0
+
+
+def run_proxy(app, args):
+    """Serve the LAN cache until interrupted"""
+    folder = os.path.abspath(args.cache or app.cache_folder or
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "beatmap_cache"))
+    cache = SetCache(folder, (args.max_size or app.cache_max_mb) * 1024 * 1024)
+    # Downloads land next to the cache and are moved into it, never into the user's library
+    app.set_download_folder(os.path.join(folder, "incoming"))
+    port = args.port if args.port is not None else app.proxy_port
+    proxy = BeatmapProxy(app, cache, args.bind, port)
+    try:
+        proxy.start()
+    except OSError as e:
+        print(f"Error starting proxy on {args.bind}:{port}: {str(e)}", file=sys.stderr)
+        cache.close()
+        return 1
+    print(f"Serving beatmapsets at http://{args.bind}:{proxy.port}/d/<id>, cache in {folder}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.stop()
+        cache.close()
+        print(f"{proxy.hits} hits, {proxy.misses} upstream fetches, {proxy.shared} requests shared a fetch",
+              file=sys.stderr)
+    return 0
+
+
+# Loading these before the window appears would make every launch wait for them
+DEFERRED_MODULES = ("requests", "urllib3", "asyncio", "aiohttp", "http.server", "webbrowser")
+
+
+def check_startup(budget):
+    """Startup regression check: time until the window is painted, and which heavy modules were loaded by then"""
+    report = {}
+
+    def first_window(root):
+        root.update_idletasks()
+        report["window_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+        report["eager_imports"] = [name for name in DEFERRED_MODULES if name in sys.modules]
+        return True  # Close right away
+
+    run_gui(first_window)
+    report["budget_seconds"] = budget
+    report["ok"] = report.get("window_seconds", budget + 1) <= budget and not report.get("eager_imports")
+    print(json.dumps(report))
+    return 0 if report["ok"] else 1
+
+
+def run_gui(on_first_window=None):
+    import tkinter as tk
+
     root = tk.Tk()
     app = OsuBeatmapDownloader(root)
-    app.root = root  # Store reference to root for theme changes
+    app.root = root  # Store reference to root for theme changes and the Tk clipboard source
     app.start_monitoring()
     
     # Set up proper shutdown
     def on_closing():
         app.stop_monitoring()
-        app.save_history()
+        app.shutdown()
         app.save_settings()
         root.destroy()
+
+    mapped = False
+
+    def on_map(event):
+        nonlocal mapped
+        # <Map> also fires for every child widget and again after the window is restored
+        if event.widget is not root or mapped:
+            return
+        mapped = True
+        if on_first_window and on_first_window(root):
+            root.after_idle(on_closing)
+            return
+        # Resuming loads requests and starts network I/O, so only once the window is up
+        root.after_idle(app.resume_partial_downloads)
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
+    root.bind("<Map>", on_map, add="+")
     root.mainloop()
 
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return run_cli(argv)
+    run_gui()
+    return 0
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,171 @@
+import http.server
+import io
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import osu_beatmap_downloader as obd  # noqa: E402
+
+
+def run_script(folder, *args, settings=None, stdin=""):
+    """Run a copy of the script in a fresh interpreter, so settings, history and downloads stay in folder"""
+    import shutil
+    import subprocess
+    script = folder / "osu_beatmap_downloader.py"
+    shutil.copy(obd.__file__, script)
+    if settings is not None:
+        (folder / "settings.json").write_text(json.dumps(settings))
+    env = dict(os.environ, HOME=str(folder / "home"), USERPROFILE=str(folder / "home"))
+    env.pop("LOCALAPPDATA", None)
+    return subprocess.run([sys.executable, *args], cwd=str(folder), env=env, timeout=60, input=stdin,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+
+def build_osz(title="Test Song", artist="Tester", creator="Mapper", difficulties=("Easy", "Hard"), padding=0):
+    """A small but valid .osz, padded with an incompressible audio file when `padding` bytes are asked for"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for version in difficulties:
+            archive.writestr(f"{artist} - {title} ({creator}) [{version}].osu",
+                             "osu file format v14\n\n[General]\nAudioFilename: audio.mp3\n\n"
+                             f"[Metadata]\nTitle:{title}\nArtist:{artist}\nCreator:{creator}\nVersion:{version}\n")
+        if padding:
+            archive.writestr(zipfile.ZipInfo("audio.mp3"), os.urandom(padding), zipfile.ZIP_STORED)
+    return buffer.getvalue()
+
+
+class StandInMirror:
+    """Local stand-in for a beatmap mirror serving /d/<id>.
+
+    Failures are injected per request: `statuses` and `drops` are consumed one entry per
+    request, `delay` applies to every request. Ranged requests are honored the way real
+    mirrors do, including If-Range and 416 past the end.
+    """
+    def __init__(self, sets=None):
+        self.sets = dict(sets or {})  # beatmapset ID (str) -> archive bytes
+        self.etag = '"v1"'
+        self.delay = 0.0  # Seconds before answering
+        self.statuses = []  # Status codes to answer with instead of the set, one per request
+        self.retry_after = None  # Sent along with 429/503 answers
+        self.drops = []  # Close the connection after this many body bytes, one entry per request
+        self.requests = []  # (path, headers) of every request received
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/d/{{}}"
+
+    def start(self):
+        mirror = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                mirror.requests.append((self.path, dict(self.headers)))
+                if mirror.delay:
+                    time.sleep(mirror.delay)
+                if mirror.statuses:
+                    self.send_empty(mirror.statuses.pop(0))
+                    return
+                data = mirror.sets.get(self.path.rsplit("/", 1)[-1])
+                if data is None:
+                    self.send_empty(404)
+                    return
+                status, start = 200, 0
+                byte_range = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+                if byte_range and self.headers.get("If-Range", mirror.etag) == mirror.etag:
+                    start = int(byte_range.group(1))
+                    if start >= len(data):
+                        self.send_empty(416, {"Content-Range": f"bytes */{len(data)}"})
+                        return
+                    status = 206
+                body = data[start:]
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", mirror.etag)
+                self.send_header("Content-Disposition", f'attachment; filename="{self.path.rsplit("/", 1)[-1]} Set.osz"')
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+                self.end_headers()
+                if mirror.drops:
+                    # Send part of the body, then hang up mid-stream
+                    self.wfile.write(body[:mirror.drops.pop(0)])
+                    self.wfile.flush()
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+            def send_empty(self, status, headers=None):
+                self.send_response(status)
+                if mirror.retry_after is not None and status in (429, 503):
+                    self.send_header("Retry-After", str(mirror.retry_after))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def app_dir(tmp_path, monkeypatch):
+    """Point settings, history and the download folder at a temporary directory"""
+    monkeypatch.setattr(obd, "__file__", str(tmp_path / "osu_beatmap_downloader.py"))
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    monkeypatch.setenv("USERPROFILE", str(tmp_path / "home"))
+    monkeypatch.delenv("LOCALAPPDATA", raising=False)
+    return tmp_path
+
+
+@pytest.fixture
+def make_app(app_dir):
+    """Factory for headless downloaders, taking settings.json values as keyword arguments"""
+    apps = []
+
+    def make(**settings):
+        with open(app_dir / "settings.json", "w") as f:
+            json.dump(settings, f)
+        app = obd.OsuBeatmapDownloader()
+        app.open_after_download = False
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        app.shutdown()
+
+
+@pytest.fixture
+def start_mirror():
+    """Factory for running StandInMirror instances, stopped after the test"""
+    mirrors = []
+
+    def start(sets=None):
+        mirror = StandInMirror(sets).start()
+        mirrors.append(mirror)
+        return mirror
+
+    yield start
+    for mirror in mirrors:
+        mirror.stop()
@@ -0,0 +1,47 @@
+import io
+import json
+
+import osu_beatmap_downloader as obd
+from conftest import build_osz, run_script
+
+SET = build_osz()
+
+
+def imported_modules(stderr):
+    """Top-level modules listed by -X importtime"""
+    return {line.rsplit("|", 1)[1].strip().split(".")[0] for line in stderr.splitlines()
+            if line.startswith("import time:") and "|" in line}
+
+
+def test_fetch_is_headless_and_reports_json_lines(tmp_path, start_mirror):
+    mirror = start_mirror({"1": SET, "2": SET})
+    result = run_script(tmp_path, "-X", "importtime", "osu_beatmap_downloader.py", "fetch", "1",
+                        "https://osu.ppy.sh/beatmapsets/2", "404",
+                        settings={"mirrors": [{"name": "standin", "url": mirror.url}]})
+
+    modules = imported_modules(result.stderr)
+    assert "requests" in modules  # Sanity check: the listing works
+    assert not modules & {"tkinter", "_tkinter", "pyperclip"}
+
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert {line["id"]: line["status"] for line in lines} == {"1": "done", "2": "done", "404": "failed"}
+    assert all(line["path"].endswith(".osz") for line in lines if line["status"] == "done")
+    assert result.returncode == 1  # Something failed
+
+    result = run_script(tmp_path, "osu_beatmap_downloader.py", "fetch", "1", "--force")
+    assert [json.loads(line)["status"] for line in result.stdout.splitlines()] == ["done"]
+    assert result.returncode == 0
+
+
+def test_daemon_forgets_finished_jobs(app_dir, start_mirror, monkeypatch, capsys):
+    mirror = start_mirror({str(n): SET for n in range(20)})
+    (app_dir / "settings.json").write_text(json.dumps({"mirrors": [{"name": "standin", "url": mirror.url}]}))
+    monkeypatch.setattr("sys.stdin", io.StringIO("".join(f"{n}\n" for n in range(20))))
+    held = []
+    shutdown = obd.OsuBeatmapDownloader.shutdown
+    monkeypatch.setattr(obd.OsuBeatmapDownloader, "shutdown",
+                        lambda app: held.append(len(app.download_queue.jobs)) or shutdown(app))
+
+    assert obd.main(["daemon"]) == 0
+    assert len(capsys.readouterr().out.splitlines()) == 20  # Every job was reported first
+    assert held == [0]
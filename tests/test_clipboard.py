@@ -0,0 +1,105 @@
+import io
+
+import osu_beatmap_downloader as obd
+
+
+def watching(make_app, text=""):
+    """A downloader monitoring the in-memory clipboard, with a queue that never downloads"""
+    app = make_app(clipboard_source="fake")
+    app.download_queue.stop()
+    app.download_queue = obd.DownloadQueue(app.download_set)
+    app.status_stream = io.StringIO()
+    app.previous_clipboard = text
+    app.start_monitoring()
+    assert isinstance(app.clipboard_source, obd.FakeClipboardSource)
+    app.clipboard_source.text = text
+    return app
+
+
+def queued(app):
+    return [job.beatmap_id for job in app.download_queue.jobs]
+
+
+def test_copied_link_is_queued(make_app):
+    app = watching(make_app)
+    assert app.clipboard_source.push("https://osu.ppy.sh/beatmapsets/1234#osu/5678")
+    assert queued(app) == ["1234"]
+    assert app.download_queue.jobs[0].priority == obd.PRIORITY_HIGH
+
+
+def test_every_link_in_a_copy_is_queued_as_one_batch(make_app):
+    app = watching(make_app)
+    app.clipboard_source.push("pool:\nhttps://osu.ppy.sh/beatmapsets/1\nhttps://osu.ppy.sh/s/2\n"
+                              "https://osu.ppy.sh/beatmapsets/1")
+    assert queued(app) == ["1", "2"]
+    assert app.download_queue.jobs[0].batch is app.download_queue.jobs[1].batch
+    assert app.download_queue.jobs[0].batch.total == 2
+
+
+def test_text_without_links_is_ignored(make_app):
+    app = watching(make_app)
+    assert app.clipboard_source.push("just some text")
+    assert app.clipboard_source.push("1234")  # A bare number is too likely to be something else
+    assert queued(app) == []
+
+
+def test_unchanged_clipboard_is_not_queued_again(make_app):
+    app = watching(make_app, "https://osu.ppy.sh/beatmapsets/1")
+    assert not app.clipboard_source.push("https://osu.ppy.sh/beatmapsets/1")  # Was there before monitoring
+    assert app.clipboard_source.push("https://osu.ppy.sh/beatmapsets/2")
+    assert not app.clipboard_source.push("https://osu.ppy.sh/beatmapsets/2")
+    assert queued(app) == ["2"]
+
+
+def test_restarting_monitoring_remembers_the_last_copy(make_app):
+    app = watching(make_app)
+    app.clipboard_source.push("https://osu.ppy.sh/beatmapsets/3")
+    app.stop_monitoring()
+    app.start_monitoring()
+    app.clipboard_source.text = "https://osu.ppy.sh/beatmapsets/3"
+    assert not app.clipboard_source.check()
+    assert queued(app) == ["3"]
+
+
+def test_read_errors_are_reported(make_app):
+    app = watching(make_app)
+
+    def broken():
+        raise RuntimeError("no clipboard")
+    app.clipboard_source.read = broken
+    assert not app.clipboard_source.check()
+    assert "Error: no clipboard" in app.status_stream.getvalue()
+
+
+class RecordingEvent:
+    """Stands in for the poller's stop event, recording each wait and stopping after a few"""
+    def __init__(self, waits):
+        self.intervals = []
+        self.waits = waits
+
+    def is_set(self):
+        return len(self.intervals) >= self.waits
+
+    def wait(self, interval):
+        self.intervals.append(interval)
+
+
+def test_polling_backoff_never_exceeds_half_a_second():
+    source = obd.PollingClipboardSource()
+    source.read = lambda: "idle"
+    source.last_text = "idle"
+    source._stop = RecordingEvent(10)
+    source._run()
+    assert max(source._stop.intervals) <= 0.5
+    assert source._stop.intervals[-1] == 0.5
+
+
+def test_polling_speeds_up_again_after_a_change():
+    source = obd.PollingClipboardSource()
+    texts = iter(["a"] * 6 + ["b"] * 10)
+    source.read = lambda: next(texts)
+    source.last_text = "a"
+    source._stop = RecordingEvent(8)
+    source._run()
+    assert source._stop.intervals[5] == 0.5
+    assert source._stop.intervals[6] == source.min_interval  # The seventh read saw "b"
@@ -0,0 +1,151 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+import osu_beatmap_downloader as obd
+
+
+def test_legacy_json_is_migrated_once(app_dir, make_app):
+    entries = [{"id": "1", "filename": "1 A - B.osz", "path": "/x/1.osz", "date": "2024-01-01 10:00:00",
+                "url": "https://osu.ppy.sh/beatmapsets/1", "title": "B"}]
+    (app_dir / "download_history.json").write_text(json.dumps(entries))
+
+    app = make_app()
+
+    assert [entry["id"] for entry in app.history_store.all()] == ["1"]
+    assert app.history_store.all()[0]["title"] == "B"
+    assert not os.path.exists(app_dir / "download_history.json")
+    assert os.path.exists(app_dir / "download_history.json.migrated")
+
+
+def test_broken_legacy_json_keeps_the_database(app_dir, make_app):
+    (app_dir / "download_history.json").write_text('[{"id": "1", "filena')
+
+    app = make_app()
+
+    assert app.history_store.db_path == os.path.join(str(app_dir), "download_history.db")
+    assert os.path.exists(app_dir / "download_history.json.corrupt")
+    assert not os.path.exists(app_dir / "download_history.json")
+    app.record_download("7", "/x/7.osz", "7.osz")
+    app.history_store.add_failed("8", "HTTP 500", 3)
+    app.shutdown()
+
+    again = make_app()
+    assert [entry["id"] for entry in again.history_store.all()] == ["7"]
+    assert [entry["id"] for entry in again.history_store.failed()] == ["8"]
+
+
+def test_search_matches_metadata_values_not_json_keys(tmp_path):
+    store = obd.HistoryStore(str(tmp_path / "history.db"))
+    store.add({"id": "1", "filename": "1.osz", "date": "2024-01-01 10:00:00", "title": "Blue Zenith",
+               "artist": "xi", "creator": "Asphyxia", "difficulties": ["FOUR DIMENSIONS"]})
+    store.add({"id": "2", "filename": "2.osz", "date": "2024-01-02 10:00:00", "title": "Freedom Dive",
+               "artist": "xi", "creator": "Nakagawa-Kanon", "difficulties": ["FOUR DIMENSIONS"]})
+
+    assert store.search("art") == []
+    assert store.search("title") == []
+    assert store.search("diff") == []
+    assert [entry["id"] for entry in store.search("zenith")] == ["1"]
+    assert [entry["id"] for entry in store.search("Kanon")] == ["2"]
+    assert [entry["id"] for entry in store.search("dimensions")] == ["1", "2"]
+    assert [entry["id"] for entry in store.search("2")] == ["2"]
+    store.close()
+
+
+def test_search_text_is_backfilled_for_older_databases(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE history (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL, filename TEXT, "
+                 "path TEXT, date TEXT, url TEXT, extra TEXT)")
+    conn.execute("INSERT INTO history (id, filename, extra) VALUES ('5', '5.osz', ?)",
+                 (json.dumps({"title": "Galaxy Collapse", "artist": "Kurokotei"}),))
+    conn.commit()
+    conn.close()
+
+    store = obd.HistoryStore(db_path)
+
+    assert [entry["id"] for entry in store.search("galaxy")] == ["5"]
+    assert store.search("artist") == []
+    assert store.all()[0]["title"] == "Galaxy Collapse"
+    store.close()
+
+
+def test_find_by_id_returns_every_download_of_a_set_in_order(tmp_path):
+    store = obd.HistoryStore(str(tmp_path / "history.db"))
+    store.add({"id": "5", "filename": "5 old.osz", "date": "2024-01-01 10:00:00"})
+    store.add({"id": "6", "filename": "6.osz", "date": "2024-01-02 10:00:00"})
+    store.add({"id": "5", "filename": "5 new.osz", "date": "2024-03-01 10:00:00"})
+
+    assert [entry["filename"] for entry in store.find_by_id(5)] == ["5 old.osz", "5 new.osz"]
+    assert store.find_by_id("7") == []
+
+
+def test_find_by_date_takes_days_or_timestamps(tmp_path):
+    store = obd.HistoryStore(str(tmp_path / "history.db"))
+    for beatmap_id, date in (("3", "2024-01-03 09:00:00"), ("1", "2024-01-01 23:59:59"),
+                             ("2", "2024-01-02 00:00:00"), ("4", "2024-01-04 00:00:00")):
+        store.add({"id": beatmap_id, "filename": f"{beatmap_id}.osz", "date": date})
+
+    assert [entry["id"] for entry in store.find_by_date("2024-01-02")] == ["2", "3", "4"]
+    assert [entry["id"] for entry in store.find_by_date("2024-01-01", "2024-01-03")] == ["1", "2", "3"]
+    assert [entry["id"] for entry in store.find_by_date("2024-01-02", "2024-01-03 08:00:00")] == ["2"]
+    assert store.find_by_date("2025-01-01") == []
+
+
+def test_search_pages_with_limit_and_offset(tmp_path):
+    store = obd.HistoryStore(str(tmp_path / "history.db"))
+    for n in range(5):
+        store.add({"id": str(n), "filename": f"{n} Song.osz", "date": "2024-01-01 10:00:00"})
+
+    assert [entry["id"] for entry in store.search("song", limit=2)] == ["0", "1"]
+    assert [entry["id"] for entry in store.search("song", limit=2, offset=4)] == ["4"]
+    assert len(store.search("song")) == 5
+
+
+class FakeListbox:
+    def __init__(self):
+        self.rows = []
+
+    def insert(self, index, *rows):
+        self.rows.extend(rows)
+
+    def delete(self, first, last=None):
+        self.rows = []
+
+
+class FakeVar:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def test_history_search_fetches_matches_a_page_at_a_time(make_app, monkeypatch):
+    pytest.importorskip("tkinter")
+    app = make_app()
+    for n in range(450):
+        app.history_store.add({"id": str(n), "filename": f"{n} {'Blue' if n % 2 else 'Red'}.osz",
+                               "date": "2024-01-01 10:00:00"})
+    app.history_listbox = FakeListbox()
+    app.history_search_var = FakeVar("blue")
+    pages = []
+    search = app.history_store.search
+    monkeypatch.setattr(app.history_store, "search",
+                        lambda *args: pages.append(args[1:]) or search(*args))
+
+    app.draw_history_list()
+    assert pages == [(200, 0)]
+    assert len(app.history_listbox.rows) == 200 and app.history_more
+
+    app.fill_history_rows()
+    assert pages[-1] == (200, 200)
+    assert not app.history_more  # Only 225 odd IDs
+    assert len(app.history_listbox.rows) == len(app.visible_history) == 225
+    assert all("Blue" in entry["filename"] for entry in app.visible_history)
+
+    app.history_search_var = FakeVar("")
+    app.draw_history_list()
+    assert len(pages) == 2 and not app.history_more
@@ -0,0 +1,204 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import osu_beatmap_downloader as obd
+from conftest import build_osz
+
+SET = build_osz(padding=128 * 1024)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(obd.time, "monotonic", clock)
+    return clock
+
+
+def test_unlimited_bucket_never_waits(clock):
+    bucket = obd.TokenBucket(0)
+    assert bucket.reserve(10 ** 9) == 0.0
+
+
+def test_bucket_allows_a_burst_then_paces_at_the_rate(clock):
+    bucket = obd.TokenBucket(1000)  # Burst defaults to one second's worth
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.reserve(500) == pytest.approx(0.5)
+    assert bucket.reserve(500) == pytest.approx(1.0)  # Debt accumulates across callers
+    clock.now += 1.0
+    assert bucket.reserve(0) == pytest.approx(0.0)
+
+
+def test_bucket_refills_only_up_to_the_burst(clock):
+    bucket = obd.TokenBucket(100, burst=200)
+    assert bucket.reserve(200) == 0.0
+    clock.now += 60
+    assert bucket.reserve(300) == pytest.approx(1.0)
+
+
+def test_set_rate_takes_effect_immediately(clock):
+    bucket = obd.TokenBucket(100)
+    bucket.reserve(100)
+    bucket.set_rate(0)
+    assert bucket.reserve(10 ** 6) == 0.0
+
+
+def test_retry_after_header_accepts_seconds_and_http_dates(make_app):
+    app = make_app()
+    assert app.parse_retry_after("120") == 120
+    later = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 90))
+    assert app.parse_retry_after(later) == pytest.approx(90, abs=2)
+    assert app.parse_retry_after("soon") is None
+
+
+def test_429_backs_the_mirror_off_for_retry_after_and_fails_over(start_mirror, make_app):
+    busy, spare = start_mirror({"1": SET}), start_mirror({"1": SET})
+    busy.statuses, busy.retry_after = [429], 120
+    app = make_app(mirrors=[{"name": "busy", "url": busy.url}, {"name": "spare", "url": spare.url}])
+
+    assert open(app.download_from_mirrors("1")[0], "rb").read() == SET
+
+    mirror = app.mirrors.mirrors[0]
+    assert mirror.open_until - time.time() == pytest.approx(120, abs=2)
+    assert [m.name for m in app.mirrors.candidates()] == ["spare"]
+
+
+def test_short_retry_after_is_waited_out(start_mirror, make_app):
+    mirror = start_mirror({"1": SET})
+    mirror.statuses, mirror.retry_after = [429], 1
+    app = make_app(mirrors=[{"name": "only", "url": mirror.url}])
+    with pytest.raises(obd.DownloadError) as error:
+        app.download_from_mirrors("1")
+    assert error.value.causes[0].retry_after == 1
+
+    started = time.time()
+    app.download_from_mirrors("1")
+    assert time.time() - started >= 0.9
+
+
+def test_long_retry_after_raises_mirror_busy(start_mirror, make_app):
+    mirror = start_mirror({"1": SET})
+    mirror.statuses, mirror.retry_after = [429], 300
+    app = make_app(mirrors=[{"name": "only", "url": mirror.url}])
+    with pytest.raises(obd.DownloadError):
+        app.download_from_mirrors("1")
+    with pytest.raises(obd.DownloadError) as error:
+        app.download_from_mirrors("1")
+    assert isinstance(error.value.causes[0], obd.MirrorBusyError)
+    assert len(mirror.requests) == 1  # Never asked again while backing off
+
+
+def timed_download(app, beatmap_id="1"):
+    started = time.perf_counter()
+    app.download_from_mirrors(beatmap_id)
+    return time.perf_counter() - started
+
+
+def expected_seconds(size, kbps):
+    rate = kbps * 1024
+    return (size - rate) / rate  # The first second's worth goes out as a burst
+
+
+def test_global_speed_limit_holds_against_a_local_mirror(start_mirror, make_app):
+    mirror = start_mirror({"1": SET})
+    app = make_app(mirrors=[{"name": "local", "url": mirror.url}], max_kbps=64)
+    assert timed_download(app) == pytest.approx(expected_seconds(len(SET), 64), abs=0.3)
+
+
+def test_per_mirror_speed_limit_holds_against_a_local_mirror(start_mirror, make_app):
+    mirror = start_mirror({"1": SET})
+    app = make_app(mirrors=[{"name": "local", "url": mirror.url, "max_kbps": 64}])
+    assert timed_download(app) == pytest.approx(expected_seconds(len(SET), 64), abs=0.3)
+
+
+def test_requests_per_minute_spaces_out_requests(start_mirror, make_app):
+    small = build_osz()
+    mirror = start_mirror({str(i): small for i in range(4)})
+    app = make_app(mirrors=[{"name": "local", "url": mirror.url}], mirror_requests_per_minute=120)
+    started = time.perf_counter()
+    for i in range(4):
+        app.download_from_mirrors(str(i))
+    # Two requests of burst, then one every half second
+    assert time.perf_counter() - started == pytest.approx(1.0, abs=0.3)
+
+
+def test_mirror_limits_can_be_overridden_at_runtime(make_app):
+    app = make_app(mirrors=[{"name": "a", "url": "http://a/d/{}"}, {"name": "b", "url": "http://b/d/{}"}],
+                   mirror_max_kbps=100)
+    app.set_mirror_limits("b", max_kbps=10, requests_per_minute=30)
+    a, b = app.mirrors.mirrors
+    assert (a.bandwidth.rate, b.bandwidth.rate) == (100 * 1024, 10 * 1024)
+    assert b.requests.rate == pytest.approx(0.5)
+    app.set_speed_limits(mirror_max_kbps=200)
+    assert (a.bandwidth.rate, b.bandwidth.rate) == (200 * 1024, 10 * 1024)
+    app.set_mirror_limits("b")
+    assert b.bandwidth.rate == 200 * 1024 and b.requests.rate == 0
+    assert "max_kbps" not in obd.DEFAULT_MIRRORS[0]
+
+
+def test_priority_gate_admits_the_most_urgent_waiter_first():
+    async def scenario():
+        gate = obd.PriorityGate(1)
+        await gate.acquire()
+        order = []
+
+        async def waiter(priority):
+            await gate.acquire(priority)
+            order.append(priority)
+            gate.release()
+
+        tasks = [asyncio.ensure_future(waiter(p)) for p in (obd.PRIORITY_LOW, obd.PRIORITY_HIGH, obd.PRIORITY_NORMAL)]
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == [obd.PRIORITY_HIGH, obd.PRIORITY_NORMAL, obd.PRIORITY_LOW]
+
+
+def test_priority_gate_hands_a_cancelled_waiters_slot_on():
+    async def scenario():
+        gate = obd.PriorityGate(1)
+        await gate.acquire()
+        cancelled = asyncio.ensure_future(gate.acquire(obd.PRIORITY_HIGH))
+        other = asyncio.ensure_future(gate.acquire(obd.PRIORITY_LOW))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        gate.release()
+        await asyncio.wait_for(other, 1)
+
+    asyncio.run(scenario())
+
+
+def test_queue_runs_higher_priority_jobs_first():
+    release = threading.Event()
+    started = []
+
+    def worker(beatmap_id, force):
+        started.append(beatmap_id)
+        release.wait(5)
+        return beatmap_id
+
+    queue = obd.DownloadQueue(worker, max_workers=1)
+    queue.start()
+    queue.submit("blocker")
+    while not started:
+        time.sleep(0.01)
+    queue.submit("low", priority=obd.PRIORITY_LOW)
+    queue.submit("normal-1")
+    queue.submit("high", priority=obd.PRIORITY_HIGH)
+    queue.submit("normal-2")
+    release.set()
+    assert queue.join(5)
+    queue.stop()
+    assert started == ["blocker", "high", "normal-1", "normal-2", "low"]
@@ -0,0 +1,42 @@
+import io
+
+import osu_beatmap_downloader as obd
+
+
+def test_every_kind_of_link_is_found_once_in_order():
+    text = ("see https://osu.ppy.sh/beatmapsets/10#osu/1001 and osu.ppy.sh/s/11,\n"
+            "https://osu.ppy.sh/b/2002?m=0 https://osu.ppy.sh/beatmaps/2003 "
+            "https://osu.ppy.sh/beatmapsets/10/discussion")
+    assert obd.extract_beatmap_links(text) == (["10", "11"], ["2002", "2003"])
+
+
+def test_anchor_difficulty_is_not_queued_separately():
+    assert obd.extract_beatmap_links("https://osu.ppy.sh/beatmapsets/7#mania/99") == (["7"], [])
+
+
+def test_lines_of_bare_ids():
+    text = "123\n 456, 789 ;\n12 and some text\nhttps://osu.ppy.sh/beatmapsets/1\n"
+    assert obd.extract_beatmap_links(text) == (["123", "456", "789", "1"], [])
+
+
+def test_crlf_text_keeps_its_bare_ids():
+    text = "https://osu.ppy.sh/beatmapsets/1\r\n123\r\n456, 789\r\n"
+    assert obd.extract_beatmap_links(text) == (["1", "123", "456", "789"], [])
+    assert obd.extract_beatmap_links("https://osu.ppy.sh/b/5\r\n") == ([], ["5"])
+
+
+def test_bare_ids_can_be_turned_off():
+    text = "Tournament 2023\r\n2023\r\nhttps://osu.ppy.sh/beatmapsets/1\r\n"
+    assert obd.extract_beatmap_links(text, bare_ids=False) == (["1"], [])
+
+
+def test_clipboard_copy_with_a_link_does_not_queue_number_lines(make_app):
+    app = make_app()
+    app.download_queue.stop()
+    app.download_queue = obd.DownloadQueue(app.download_set)
+    app.status_stream = io.StringIO()
+    app.on_clipboard_change("Mappool 2023\r\n2023\r\nhttps://osu.ppy.sh/beatmapsets/1\r\n")
+    assert [job.beatmap_id for job in app.download_queue.jobs] == ["1"]
+
+    app.enqueue_text("2023\r\n42\r\n", "Manual download")  # Typed or pasted on purpose, bare IDs count
+    assert [job.beatmap_id for job in app.download_queue.jobs] == ["1", "2023", "42"]
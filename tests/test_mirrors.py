@@ -0,0 +1,138 @@
+import time
+
+import pytest
+
+import osu_beatmap_downloader as obd
+from conftest import build_osz
+
+SET = build_osz(padding=64 * 1024)
+
+
+def registry(count=3, **kwargs):
+    return obd.MirrorRegistry([{"name": f"m{i}", "url": f"https://m{i}.example/d/{{}}"} for i in range(count)],
+                              **kwargs)
+
+
+def names(mirrors):
+    return [mirror.name for mirror in mirrors]
+
+
+def test_unmeasured_mirrors_keep_their_configured_order():
+    assert names(registry().candidates()) == ["m0", "m1", "m2"]
+
+
+def test_faster_mirrors_come_first_and_unmeasured_ones_get_probed():
+    mirrors = registry()
+    m0, m1, m2 = mirrors.mirrors
+    mirrors.record_success(m0, latency=0.5, nbytes=1024 * 1024, seconds=2.0)
+    mirrors.record_success(m1, latency=0.1, nbytes=10 * 1024 * 1024, seconds=1.0)
+    assert names(mirrors.candidates()) == ["m2", "m1", "m0"]
+
+
+def test_circuit_opens_after_repeated_failures_and_closes_on_success():
+    mirrors = registry(failure_threshold=3, cooldown=30)
+    m0 = mirrors.mirrors[0]
+    for _ in range(2):
+        mirrors.record_failure(m0, "HTTP 500")
+    assert names(mirrors.candidates()) == ["m0", "m1", "m2"]
+    mirrors.record_failure(m0, "HTTP 500")
+    assert names(mirrors.candidates()) == ["m1", "m2"]
+    assert m0.open_until - time.time() == pytest.approx(30, abs=1)
+    mirrors.record_success(m0, latency=0.1, nbytes=0, seconds=0)
+    assert m0.failures == 0 and "m0" in names(mirrors.candidates())
+
+
+def test_backoff_doubles_up_to_the_cap():
+    mirrors = registry(failure_threshold=1, cooldown=10, max_cooldown=60)
+    m0 = mirrors.mirrors[0]
+    backoffs = []
+    for _ in range(6):
+        mirrors.record_failure(m0, "timeout")
+        backoffs.append(round(m0.open_until - time.time()))
+    assert backoffs == [10, 20, 40, 60, 60, 60]
+
+
+def test_retry_after_sets_the_backoff_within_the_cap():
+    mirrors = registry(max_cooldown=600)
+    m0, m1 = mirrors.mirrors[:2]
+    mirrors.record_failure(m0, "HTTP 429", retry_after=120)
+    mirrors.record_failure(m1, "HTTP 429", retry_after=86400)
+    assert m0.open_until - time.time() == pytest.approx(120, abs=1)
+    assert m1.open_until - time.time() == pytest.approx(600, abs=1)
+
+
+def test_all_circuits_open_probes_the_first_to_recover():
+    mirrors = registry(failure_threshold=1)
+    for mirror, wait in zip(mirrors.mirrors, (300, 100, 200)):
+        mirrors.record_failure(mirror, "down", retry_after=wait)
+    assert names(mirrors.candidates()) == ["m1"]
+
+
+def test_resuming_prefers_the_mirror_that_started_the_download():
+    mirrors = registry()
+    assert names(mirrors.candidates("https://m2.example/d/123")) == ["m2", "m0", "m1"]
+
+
+@pytest.fixture
+def two_mirrors(start_mirror, make_app):
+    first, second = start_mirror({"1": SET}), start_mirror({"1": SET})
+    app = make_app(mirrors=[{"name": "first", "url": first.url}, {"name": "second", "url": second.url}],
+                   read_timeout=0.3)
+    return app, first, second
+
+
+def test_fails_over_when_the_first_mirror_lacks_the_set(two_mirrors):
+    app, first, second = two_mirrors
+    first.sets.clear()
+
+    filepath = app.download_from_mirrors("1")[0]
+
+    assert open(filepath, "rb").read() == SET
+    assert len(first.requests) == 1 and len(second.requests) == 1
+    assert app.mirrors.mirrors[0].failures == 0  # A 404 says nothing about the mirror's health
+
+
+@pytest.mark.parametrize("status", [500, 502, 503])
+def test_fails_over_on_server_errors(two_mirrors, status):
+    app, first, second = two_mirrors
+    first.statuses = [status]
+
+    filepath = app.download_from_mirrors("1")[0]
+
+    assert open(filepath, "rb").read() == SET
+    assert app.mirrors.mirrors[0].failures == 1
+    assert app.mirrors.mirrors[0].last_error == f"HTTP {status}"
+
+
+def test_fails_over_when_a_mirror_times_out(two_mirrors):
+    app, first, second = two_mirrors
+    first.delay = 1.0
+
+    filepath = app.download_from_mirrors("1")[0]
+
+    assert open(filepath, "rb").read() == SET
+    assert app.mirrors.mirrors[0].failures == 1
+
+
+def test_every_mirror_failing_reports_each_cause(two_mirrors):
+    app, first, second = two_mirrors
+    first.statuses = [500]
+    second.sets.clear()
+
+    with pytest.raises(obd.DownloadError) as error:
+        app.download_from_mirrors("1")
+
+    assert [cause.status_code for cause in error.value.causes] == [500, 404]
+    assert "first: HTTP 500" in str(error.value) and "second: HTTP 404" in str(error.value)
+
+
+def test_slow_mirror_drops_behind_after_being_measured(two_mirrors):
+    app, first, second = two_mirrors
+    first.delay = 0.2
+    second.sets["2"] = SET
+    first.sets["2"] = SET
+    app.download_from_mirrors("1")  # Served by the first mirror, which is slow
+    assert names(app.mirrors.candidates()) == ["second", "first"]  # Unmeasured mirrors get probed
+    app.download_from_mirrors("2")
+    assert names(app.mirrors.candidates()) == ["second", "first"]
+    assert app.mirrors.mirrors[1].latency < app.mirrors.mirrors[0].latency
@@ -0,0 +1,125 @@
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import osu_beatmap_downloader as obd
+from conftest import build_osz
+
+SET = build_osz(padding=32 * 1024)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1.0  # Every call is a second later, so last_used never ties
+        return self.now
+
+
+@pytest.fixture
+def proxy(make_app, start_mirror, tmp_path):
+    """BeatmapProxy on localhost whose upstream is a StandInMirror"""
+    mirror = start_mirror({"1": SET, "2": build_osz(title="Other")})
+    app = make_app(mirrors=[{"name": "standin", "url": mirror.url}])
+    proxy = obd.BeatmapProxy(app, obd.SetCache(str(tmp_path / "cache"), 100 * 1024 * 1024), "127.0.0.1", 0)
+    proxy.mirror = mirror
+    proxy.start()
+    yield proxy
+    proxy.stop()
+    proxy.cache.close()
+
+
+def fetch(proxy, path, headers=None):
+    """(status, headers, body) of a request to the proxy"""
+    request = urllib.request.Request(f"http://127.0.0.1:{proxy.port}{path}", headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def upstream_requests(proxy, beatmap_id):
+    return [path for path, headers in proxy.mirror.requests if path.endswith(f"/{beatmap_id}")]
+
+
+def test_concurrent_misses_share_one_upstream_fetch(proxy):
+    proxy.mirror.delay = 0.3  # Long enough for every request to find the fetch in flight
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(fetch(proxy, "/d/1"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [status for status, headers, body in results] == [200] * 5
+    assert all(body == SET for status, headers, body in results)
+    assert len(upstream_requests(proxy, 1)) == 1
+    assert (proxy.misses, proxy.shared) == (1, 4)
+
+    assert fetch(proxy, "/d/1")[2] == SET
+    assert proxy.hits == 1 and len(upstream_requests(proxy, 1)) == 1
+
+
+def test_ranges_and_if_range(proxy):
+    status, headers, body = fetch(proxy, "/d/1")
+    etag = headers["ETag"]
+
+    status, headers, body = fetch(proxy, "/d/1", {"Range": "bytes=100-", "If-Range": etag})
+    assert status == 206 and body == SET[100:]
+    assert headers["Content-Range"] == f"bytes 100-{len(SET) - 1}/{len(SET)}"
+
+    status, headers, body = fetch(proxy, "/d/1", {"Range": "bytes=10-19"})
+    assert status == 206 and body == SET[10:20]
+
+    status, headers, body = fetch(proxy, "/d/1", {"Range": "bytes=100-", "If-Range": '"changed"'})
+    assert status == 200 and body == SET  # Different content: start over
+
+    status, headers, body = fetch(proxy, "/d/1", {"Range": f"bytes={len(SET)}-"})
+    assert status == 416 and headers["Content-Range"] == f"bytes */{len(SET)}"
+
+
+def test_missing_everywhere_is_404_and_upstream_errors_are_502(proxy):
+    assert fetch(proxy, "/d/999")[0] == 404
+    assert fetch(proxy, "/not/a/set")[0] == 404
+
+    proxy.mirror.statuses = [500]
+    assert fetch(proxy, "/d/2")[0] == 502
+    assert fetch(proxy, "/d/2")[0] == 200  # Not cached as missing, the next request tries again
+
+
+def test_eviction_drops_least_recently_used_and_keeps_the_newest(tmp_path, monkeypatch):
+    monkeypatch.setattr(obd.time, "time", Clock())
+    cache = obd.SetCache(str(tmp_path / "cache"), 2500)
+
+    def put(beatmap_id, size):
+        source = tmp_path / f"{beatmap_id}.osz"
+        source.write_bytes(bytes([beatmap_id]) * size)
+        return cache.put(beatmap_id, str(source), f"{beatmap_id}.osz")
+
+    put(1, 1000)
+    put(2, 1000)
+    cache.get(1)  # Served again, now 2 is the oldest
+    put(3, 1000)
+    assert cache.get(2) is None
+    assert cache.get(1) and cache.get(3)
+    assert cache.total_bytes() == 2000
+
+    newest = put(4, 3000)  # Bigger than the whole cache: everything else goes, the new set stays
+    assert cache.get(1) is None and cache.get(3) is None
+    assert cache.get(4)["path"] == newest["path"]
+    cache.close()
+
+
+def test_identical_archives_are_stored_once(tmp_path):
+    cache = obd.SetCache(str(tmp_path / "cache"), 10 ** 6)
+    for beatmap_id in ("1", "2"):
+        source = tmp_path / f"{beatmap_id}.osz"
+        source.write_bytes(SET)
+        cache.put(beatmap_id, str(source), "Same.osz")
+    assert cache.get("1")["path"] == cache.get("2")["path"]
+    assert cache.total_bytes() == len(SET)
+    cache.close()
@@ -0,0 +1,65 @@
+import threading
+
+import osu_beatmap_downloader as obd
+
+
+def blocking_worker(gate, results):
+    def worker(beatmap_id, force=False):
+        gate.wait(5)
+        if results.get(beatmap_id) == "fail":
+            raise obd.DownloadError("mirror said no")
+        return f"/x/{beatmap_id}.osz"
+    return worker
+
+
+def test_counts_follow_every_transition():
+    gate = threading.Event()
+    queue = obd.DownloadQueue(blocking_worker(gate, {"3": "fail"}), max_workers=1, keep_finished=True)
+    for beatmap_id in ("1", "2", "3"):
+        queue.submit(beatmap_id)
+    assert queue.counts()[obd.DownloadJob.QUEUED] == 3
+
+    queue.start()
+    for _ in range(100):
+        if queue.counts()[obd.DownloadJob.RUNNING]:
+            break
+        threading.Event().wait(0.01)
+    assert queue.counts() == {"queued": 2, "running": 1, "retrying": 0, "done": 0, "failed": 0}
+
+    gate.set()
+    assert queue.join(5)
+    assert queue.counts() == {"queued": 0, "running": 0, "retrying": 0, "done": 2, "failed": 1}
+    assert [job.beatmap_id for job in queue.clear_finished()] == ["1", "2", "3"]
+    assert queue.jobs == []
+    assert queue.counts()["done"] == 0
+    queue.stop()
+
+
+def test_finished_jobs_are_dropped_once_reported():
+    gate = threading.Event()
+    gate.set()
+    seen = []
+    queue = obd.DownloadQueue(blocking_worker(gate, {}), max_workers=2,
+                              on_change=lambda job: seen.append((job.beatmap_id, job.state)))
+    queue.start()
+    for beatmap_id in range(50):
+        queue.submit(beatmap_id)
+    assert queue.join(5)
+    assert queue.jobs == []
+    assert set(queue.counts().values()) == {0}
+    assert seen.count(("7", obd.DownloadJob.DONE)) == 1  # Listeners still saw it finish
+    queue.stop()
+
+
+def test_capped_drain_keeps_the_rest_in_order():
+    bus = obd.UiEventBus()
+    drawn = []
+    for n in range(5):
+        bus.post(drawn.append, n, key=("job", n))
+    bus.post(drawn.append, "latest 1", key=("job", 1))  # Replaces the pending draw in its place
+
+    assert bus.drain(2) == 2
+    assert drawn == [0, "latest 1"]
+    assert bus.drain(2) == 2
+    assert bus.drain() == 1
+    assert drawn == [0, "latest 1", 2, 3, 4]
@@ -0,0 +1,146 @@
+import json
+import os
+
+import pytest
+
+import osu_beatmap_downloader as obd
+from conftest import build_osz
+
+SET = build_osz(padding=300 * 1024)
+
+
+@pytest.fixture
+def mirror(start_mirror):
+    return start_mirror({"1": SET})
+
+
+@pytest.fixture
+def app(make_app, mirror):
+    return make_app(mirrors=[{"name": "local", "url": mirror.url}])
+
+
+def ranges(mirror):
+    return [(headers.get("Range"), headers.get("If-Range")) for path, headers in mirror.requests]
+
+
+def write_partial(app, mirror, data, **journal):
+    part_path, journal_path = app.get_partial_paths("1")
+    with open(part_path, "wb") as f:
+        f.write(data)
+    journal = dict({"id": "1", "url": mirror.url.format("1"), "filename": "1 Set.osz", "length": len(SET),
+                    "etag": mirror.etag, "last_modified": None}, **journal)
+    with open(journal_path, "w") as f:
+        json.dump(journal, f)
+    return part_path, journal_path
+
+
+def test_resumes_after_the_connection_drops_mid_stream(app, mirror):
+    mirror.drops = [100000, 100000]
+
+    filepath, filename, metadata = app.download_from_mirrors("1")
+
+    assert open(filepath, "rb").read() == SET
+    assert ranges(mirror) == [(None, None), ("bytes=100000-", '"v1"'), ("bytes=200000-", '"v1"')]
+    assert metadata["title"] == "Test Song"
+    assert not any(os.path.exists(path) for path in app.get_partial_paths("1"))
+
+
+def test_gives_up_after_resume_attempts_and_keeps_the_part_file(make_app, mirror):
+    app = make_app(mirrors=[{"name": "local", "url": mirror.url}], resume_attempts=1)
+    mirror.drops = [50000, 50000]
+
+    with pytest.raises(obd.DownloadError):
+        app.download_from_mirrors("1")
+
+    part_path, journal_path = app.get_partial_paths("1")
+    assert os.path.getsize(part_path) == 100000
+    assert json.load(open(journal_path))["written"] == 100000
+    mirror.requests.clear()
+    filepath = app.download_from_mirrors("1")[0]
+    assert open(filepath, "rb").read() == SET
+    assert ranges(mirror) == [("bytes=100000-", '"v1"')]
+
+
+def test_preallocated_tail_past_the_checkpoint_is_discarded(app, mirror):
+    # A crash after preallocating: the file has its full size, but only 80000 bytes were checkpointed
+    written = 80000
+    write_partial(app, mirror, SET[:written] + bytes(len(SET) - written), written=written)
+
+    filepath = app.download_from_mirrors("1")[0]
+
+    assert ranges(mirror) == [("bytes=80000-", '"v1"')]
+    assert open(filepath, "rb").read() == SET
+
+
+def test_prepare_resume_truncates_to_the_checkpoint(app, mirror):
+    part_path, _ = write_partial(app, mirror, bytes(len(SET)), written=4096)
+
+    journal, offset, headers = app.prepare_resume("1", mirror.url.format("1"))
+
+    assert offset == 4096
+    assert os.path.getsize(part_path) == 4096
+    assert headers == {"Range": "bytes=4096-", "If-Range": '"v1"'}
+
+
+def test_416_for_a_fully_received_part_file_completes_it(app, mirror):
+    write_partial(app, mirror, SET)
+
+    filepath, filename, metadata = app.download_from_mirrors("1")
+
+    assert ranges(mirror) == [(f"bytes={len(SET)}-", '"v1"')]
+    assert filename == "1 Set.osz"
+    assert open(filepath, "rb").read() == SET
+
+
+def test_changed_file_on_the_mirror_restarts_from_scratch(app, mirror):
+    write_partial(app, mirror, b"stale bytes" * 1000, etag='"v0"')
+
+    filepath = app.download_from_mirrors("1")[0]
+
+    assert ranges(mirror) == [("bytes=11000-", '"v0"')]  # If-Range mismatch, the mirror sent all of it
+    assert open(filepath, "rb").read() == SET
+
+
+def test_only_the_final_rename_creates_the_osz(app, mirror, monkeypatch):
+    mirror.drops = [100000]
+    folder = app.download_folder
+    renames = []
+    real_replace = os.replace
+    real_write = obd.PartFileWriter.write
+
+    def no_osz_yet():
+        return [name for name in os.listdir(folder) if name.endswith(".osz")] == []
+
+    def replace(src, dst):
+        if str(dst).endswith(".osz"):
+            assert no_osz_yet()
+            renames.append((os.path.basename(src), os.path.basename(dst)))
+        return real_replace(src, dst)
+
+    def write(self, data):
+        assert no_osz_yet()
+        return real_write(self, data)
+
+    monkeypatch.setattr(os, "replace", replace)
+    monkeypatch.setattr(obd.PartFileWriter, "write", write)
+
+    app.download_from_mirrors("1")
+
+    assert renames == [("1.osz.part", "1 Set.osz")]
+
+
+def test_downloads_ask_for_the_raw_bytes(app, mirror):
+    mirror.drops = [100000]
+
+    app.download_from_mirrors("1")
+
+    # Resume offsets count file bytes, a gzip-encoded reply would count something else
+    assert [headers.get("Accept-Encoding") for path, headers in mirror.requests] == ["identity", "identity"]
+
+
+def test_async_downloads_ask_for_the_raw_bytes(make_app, mirror):
+    app = make_app(mirrors=[{"name": "local", "url": mirror.url}], engine="async")
+
+    app.async_engine.submit("1").result(timeout=30)
+
+    assert [headers.get("Accept-Encoding") for path, headers in mirror.requests] == ["identity"]
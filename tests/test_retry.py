@@ -0,0 +1,110 @@
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+import osu_beatmap_downloader as obd
+from conftest import build_osz
+
+SET = build_osz()
+
+
+@pytest.mark.parametrize("error, kind", [
+    (obd.MirrorError("HTTP 429", 429), "rate_limit"),
+    (obd.MirrorBusyError("all backing off"), "rate_limit"),
+    (obd.MirrorError("HTTP 503", 503), "server"),
+    (obd.MirrorError("HTTP 404", 404), None),
+    (obd.IntegrityError("bad zip"), "integrity"),
+    (TimeoutError(), "timeout"),
+    (socket.timeout(), "timeout"),
+    (requests.exceptions.ReadTimeout(), "timeout"),
+    (ConnectionResetError(), "connect"),
+    (requests.exceptions.ConnectionError(), "connect"),
+    (requests.exceptions.ChunkedEncodingError(), "connect"),
+    (OSError("stream ended early"), "connect"),
+    (OSError(28, "No space left on device"), None),
+    (ValueError("bug"), None),
+])
+def test_classify(error, kind):
+    assert obd.RetryPolicy().classify(error) == kind
+
+
+def test_download_error_takes_the_most_transient_cause():
+    policy = obd.RetryPolicy()
+    missing = obd.MirrorError("HTTP 404", 404)
+    assert policy.classify(obd.DownloadError("x", [missing, TimeoutError()])) == "timeout"
+    assert policy.classify(obd.DownloadError("x", [TimeoutError(), obd.MirrorError("HTTP 502", 502)])) == "server"
+    assert policy.classify(obd.DownloadError("x", [missing, missing])) is None
+    assert policy.classify(obd.DownloadError("no mirrors configured")) is None
+
+
+def test_delay_doubles_up_to_the_cap_then_gives_up():
+    policy = obd.RetryPolicy({"server": {"attempts": 5, "base": 10, "max": 50}}, jitter=0)
+    error = obd.MirrorError("HTTP 500", 500)
+    assert [policy.delay(error, attempt) for attempt in range(1, 7)] == [10, 20, 40, 50, 50, None]
+    assert policy.delay(obd.MirrorError("HTTP 404", 404), 1) is None
+
+
+def test_jitter_only_shortens_the_delay():
+    policy = obd.RetryPolicy(jitter=0.5)
+    delays = [policy.delay(TimeoutError(), 2) for _ in range(200)]
+    assert all(5 <= delay <= 10 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_retry_after_is_a_floor():
+    policy = obd.RetryPolicy(jitter=0)
+    error = obd.DownloadError("x", [obd.MirrorError("HTTP 429", 429, retry_after=300),
+                                    obd.MirrorError("HTTP 429", 429, retry_after=90)])
+    assert policy.delay(error, 1) == 90  # The mirror that frees up first
+    assert policy.delay(obd.MirrorError("HTTP 429", 429, retry_after=5), 1) == 30
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_stop_parks_jobs_waiting_for_a_retry(make_app, start_mirror):
+    mirror = start_mirror()
+    mirror.statuses = [500]
+    app = make_app(mirrors=[{"name": "standin", "url": mirror.url}], retry_rules={"server": {"base": 60}})
+    job = app.enqueue_beatmap("5")
+    wait_for(lambda: job.state == obd.DownloadJob.RETRYING)
+
+    app.download_queue.stop()
+    assert job.state == obd.DownloadJob.FAILED
+    assert "retry cancelled" in job.error
+    assert [entry["id"] for entry in app.history_store.failed()] == ["5"]
+
+
+def test_success_clears_the_dead_letter_entry(make_app, start_mirror):
+    mirror = start_mirror({"6": SET})
+    app = make_app(mirrors=[{"name": "standin", "url": mirror.url}])
+    app.history_store.add_failed("6", "HTTP 500", 4)
+
+    batch = app.retry_failed()
+    assert batch.total == 1
+    assert app.download_queue.join(10)
+    assert app.history_store.failed() == []
+
+
+def test_shutdown_records_jobs_that_fail_while_it_waits(app_dir, make_app, start_mirror):
+    mirror = start_mirror()
+    mirror.delay = 0.5  # Still running when shutdown starts, then a 404: no retry
+    app = make_app(mirrors=[{"name": "standin", "url": mirror.url}])
+    job = app.enqueue_beatmap("7")
+    wait_for(lambda: job.state == obd.DownloadJob.RUNNING)
+
+    shutdown = threading.Thread(target=app.shutdown)
+    shutdown.start()
+    shutdown.join(15)
+    assert job.state == obd.DownloadJob.FAILED
+
+    store = obd.HistoryStore(str(app_dir / "download_history.db"))
+    assert [entry["id"] for entry in store.failed()] == ["7"]
+    store.close()
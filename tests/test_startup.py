@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from conftest import run_script
+
+
+def test_importing_loads_no_deferred_module(tmp_path):
+    result = run_script(tmp_path, "-c", "import sys, osu_beatmap_downloader as obd; "
+                                        "print([name for name in obd.DEFERRED_MODULES if name in sys.modules])")
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+
+
+def display_available():
+    tk = pytest.importorskip("tkinter")
+    try:
+        tk.Tk().destroy()
+    except tk.TclError:
+        return False
+    return True
+
+
+def test_startup_check_opens_the_window_without_eager_imports(tmp_path):
+    if not display_available():
+        pytest.skip("startup-check needs a display")
+    result = run_script(tmp_path, "osu_beatmap_downloader.py", "startup-check", "--budget", "30")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report["eager_imports"] == []
+    assert report["window_seconds"] <= 30
+    assert report["ok"] and result.returncode == 0
+
+
+def test_interrupted_downloads_do_not_slow_the_first_window(tmp_path):
+    if not display_available():
+        pytest.skip("startup-check needs a display")
+    folder = tmp_path / "home" / "Downloads" / "osu_beatmaps"
+    folder.mkdir(parents=True)
+    (folder / "123.osz.part").write_bytes(b"PK\x03\x04")  # Resumed once the window is up, not before
+    result = run_script(tmp_path, "osu_beatmap_downloader.py", "startup-check", "--budget", "30")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report["eager_imports"] == []
@@ -0,0 +1,114 @@
+import io
+import struct
+import zipfile
+
+import pytest
+
+import osu_beatmap_downloader as obd
+from conftest import build_osz
+
+SET = build_osz(padding=20000)
+
+
+def verify(tmp_path, data, chunk_size=None, expected_length=None):
+    path = tmp_path / "set.osz"
+    path.write_bytes(data)
+    verifier = obd.OszVerifier()
+    chunk_size = chunk_size or len(data)
+    for start in range(0, len(data), chunk_size):
+        verifier.feed(data[start:start + chunk_size])
+    return verifier, verifier.finish(str(path), expected_length)
+
+
+class Unseekable(io.RawIOBase):
+    """Write-only stream, makes zipfile put sizes and CRCs in data descriptors after each entry"""
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+
+def streamed_osz(audio_method=zipfile.ZIP_DEFLATED):
+    stream = Unseekable()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("A - B (C) [Normal].osu", "[Metadata]\nTitle:B\nArtist:A\nCreator:C\nVersion:Normal\n")
+        archive.writestr(zipfile.ZipInfo("audio.mp3"), bytes(range(256)) * 100, audio_method)
+    return bytes(stream.data)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096, None])
+def test_metadata_is_read_while_streaming(tmp_path, chunk_size):
+    verifier, metadata = verify(tmp_path, SET, chunk_size, expected_length=len(SET))
+
+    assert metadata == {"title": "Test Song", "artist": "Tester", "creator": "Mapper",
+                        "difficulties": ["Easy", "Hard"]}
+    assert verifier.entries == ["Tester - Test Song (Mapper) [Easy].osu", "Tester - Test Song (Mapper) [Hard].osu",
+                                "audio.mp3"]
+
+
+def test_html_error_page_is_rejected_on_the_first_bytes():
+    verifier = obd.OszVerifier()
+
+    with pytest.raises(obd.IntegrityError, match="not a zip archive"):
+        verifier.feed(b"<!DOCTYPE html><html><body>Rate limited</body></html>")
+
+
+@pytest.mark.parametrize("cut, error", [(100, "truncated"), (len(SET) // 2, "truncated"),
+                                        (len(SET) - 30, "bad central directory")])
+def test_truncated_archive_fails_at_finish(tmp_path, cut, error):
+    with pytest.raises(obd.IntegrityError, match=error):
+        verify(tmp_path, SET[:cut])
+
+
+def test_short_transfer_fails_the_length_check(tmp_path):
+    with pytest.raises(obd.IntegrityError, match=f"expected {len(SET) + 1} bytes"):
+        verify(tmp_path, SET, expected_length=len(SET) + 1)
+
+
+def test_crc_mismatch_in_a_difficulty_is_caught(tmp_path):
+    data = bytearray(SET)
+    crc = struct.unpack_from("<I", data, 14)[0]  # CRC-32 of the first local entry
+    struct.pack_into("<I", data, 14, crc ^ 1)
+
+    with pytest.raises(obd.IntegrityError, match=r"CRC mismatch in .*\[Easy\]\.osu"):
+        verify(tmp_path, bytes(data), chunk_size=512)
+
+
+def test_corrupt_deflate_stream_is_caught(tmp_path):
+    data = bytearray(SET)
+    header = obd.OszVerifier.LOCAL_HEADER.size + struct.unpack_from("<H", data, 26)[0]
+    data[header:header + 8] = b"\xff" * 8
+
+    with pytest.raises(obd.IntegrityError, match="corrupt"):
+        verify(tmp_path, bytes(data))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 100, None])
+def test_data_descriptor_entries_are_followed(tmp_path, chunk_size):
+    data = streamed_osz()
+    assert struct.unpack_from("<H", data, 6)[0] & 0x08  # Sizes come after the data
+
+    verifier, metadata = verify(tmp_path, data, chunk_size)
+
+    assert verifier.entries == ["A - B (C) [Normal].osu", "audio.mp3"]
+    assert metadata == {"title": "B", "artist": "A", "creator": "C", "difficulties": ["Normal"]}
+
+
+def test_stored_entry_with_a_data_descriptor_falls_back_to_the_central_directory(tmp_path):
+    verifier, metadata = verify(tmp_path, streamed_osz(audio_method=zipfile.ZIP_STORED))
+
+    assert metadata["difficulties"] == ["Normal"]
+
+
+def test_archive_without_difficulties_is_rejected(tmp_path):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("audio.mp3", b"\0" * 1000)
+
+    with pytest.raises(obd.IntegrityError, match="no .osu"):
+        verify(tmp_path, buffer.getvalue())
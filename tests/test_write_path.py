@@ -0,0 +1,117 @@
+import asyncio
+import sys
+
+import pytest
+
+import osu_beatmap_downloader as obd
+
+
+class EndlessBody:
+    """http.client stand-in whose reads always come back full, like a socket buffer that filled up during a pause"""
+    def __init__(self, total):
+        self.left = total
+        self.reads = []
+
+    def readinto(self, view):
+        count = min(len(view), self.left)
+        self.left -= count
+        self.reads.append(count)
+        return count
+
+
+class FakeResponse:
+    def __init__(self, total):
+        self.headers = {}
+        self.raw = self
+        self._fp = EndlessBody(total)
+
+    def release_conn(self):
+        pass
+
+
+def read_sizes(app, mirror=None, total=8 * 1024 * 1024):
+    response = FakeResponse(total)
+    received = sum(len(chunk) for chunk in app.iter_body(response, mirror))
+    assert received == total
+    return response._fp.reads[:-1]  # The last read returns 0
+
+
+def test_reads_grow_to_the_maximum_without_a_limit(make_app):
+    app = make_app()
+    sizes = read_sizes(app)
+    assert sizes[:5] == [64 * 1024, 128 * 1024, 256 * 1024, 512 * 1024, 1024 * 1024]
+    assert max(sizes) == obd.OsuBeatmapDownloader.READ_CHUNK_MAX
+
+
+def test_reads_stay_small_under_a_global_limit(make_app):
+    app = make_app(max_kbps=300)
+    assert max(read_sizes(app)) == 300 * 1024 // 10
+
+
+def test_reads_follow_the_tighter_mirror_limit(make_app):
+    app = make_app(max_kbps=300, mirror_max_kbps=16)
+    mirror = app.mirrors.mirrors[0]
+    assert max(read_sizes(app, mirror, total=256 * 1024)) == 16 * 1024 // 10
+
+
+def test_limit_changes_apply_mid_download(make_app):
+    app = make_app()
+    response = FakeResponse(8 * 1024 * 1024)
+    body = app.iter_body(response)
+    for _ in range(5):
+        next(body)
+    app.bandwidth.set_rate(64 * 1024)
+    next(body)
+    assert response._fp.reads[-1] == 64 * 1024 // 10
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.position = 0
+        self.closed = None
+
+    def write(self, data):
+        self.position += len(data)
+
+    def close(self, complete):
+        self.closed = complete
+
+
+class ChunkedContent:
+    """aiohttp response.content stand-in yielding fixed chunks"""
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def iter_any(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class ChunkedResponse:
+    def __init__(self, chunks):
+        self.content = ChunkedContent(chunks)
+
+
+def test_async_rejected_buffer_is_written_once(make_app, monkeypatch):
+    app = make_app()
+    writer = RecordingWriter()
+    monkeypatch.setattr(app, "open_part_file", lambda beatmap_id, action, journal: writer)
+    engine = obd.AsyncDownloadEngine(app)
+    chunk = b"<html>".ljust(64 * 1024, b" ")
+    response = ChunkedResponse([chunk] * 8)  # Not a zip, rejected by the first buffer flush
+    progress = {"id": "1", "bytes": 0, "position": 0, "length": len(chunk) * 8, "disk": 0.0}
+    try:
+        with pytest.raises(obd.IntegrityError):
+            asyncio.run(engine._stream_to_file(response, "1", "new", {}, progress, app.mirrors.mirrors[0],
+                                               obd.OszVerifier()))
+    finally:
+        engine._disk.shutdown()
+    assert writer.position == len(chunk) * 4  # The first 256 KB flush, not twice over
+    assert writer.closed is False
+
+
+def test_async_engine_falls_back_without_aiohttp(make_app, monkeypatch):
+    monkeypatch.setitem(sys.modules, "aiohttp", None)
+    app = make_app(engine="async")
+    assert app.async_engine is None
+    assert app.download_queue.engine is None